@@ -0,0 +1,24 @@
+"""FlaskアプリとAPI(/api)をまとめたASGIアプリ
+
+gunicorn asgi:app -k uvicorn.workers.UvicornWorker で起動する
+"""
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.routing import Mount
+
+from app import app as flask_app
+from mendel_japan.api.routes import create_api, dispose_engine
+from mendel_japan.compression import ASGICompressionMiddleware
+from mendel_japan.metrics import ASGIMetrics
+
+app = Starlette(
+    routes=[
+        Mount('/api', app=ASGICompressionMiddleware(
+            ASGIMetrics(create_api(flask_app), '/api'),
+            flask_app.config['COMPRESS_MIN_SIZE'],
+            flask_app.config['COMPRESS_GZIP_LEVEL'],
+            flask_app.config['COMPRESS_BROTLI_LEVEL'])),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    on_shutdown=[dispose_engine],
+)
@@ -1,8 +1,94 @@
 from dotenv import load_dotenv
 import os
-import sqlalchemy
 
 load_dotenv('.env')
 DATABASE_URI = os.environ.get('DATABASE_URL').replace("s://", "sql://", 1)
-engine: sqlalchemy.engine = \
-    sqlalchemy.create_engine(DATABASE_URI, echo=True)
+# セッション・CSRFトークンの署名鍵
+# 未設定の場合はプロセスごとに生成する(複数ワーカーでは共通の値を設定する)
+SECRET_KEY = os.environ.get('SECRET_KEY')
+# 全てのSQLをログに出す(開発用)
+SQL_ECHO = os.environ.get('SQL_ECHO', 'false').lower() == 'true'
+
+# 接続プール(Flask-SQLAlchemyのdb.engineが全ての同期処理で共有する)
+# gthreadワーカーやASGI(WSGIMiddlewareのスレッド)では、同時に処理する
+# スレッド数以上をDB_POOL_SIZE + DB_MAX_OVERFLOWで確保する
+# SQLiteのファイルはSQLAlchemyの既定(接続ごとに開閉)のまま
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+ENGINE_OPTIONS = {'pool_pre_ping': True}
+if not DATABASE_URI.startswith('sqlite'):
+    ENGINE_OPTIONS.update(
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT)
+
+# このミリ秒以上かかったSQLを記録する(0で記録しない)
+# 初回の実行計画の取得方法(off, plan, analyze)と集計するSQLの種類の上限
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'plan')
+SLOW_QUERY_MAX_FINGERPRINTS = int(
+    os.environ.get('SLOW_QUERY_MAX_FINGERPRINTS', 500))
+
+# APIの非同期エンジン用(postgresql→asyncpg, sqlite→aiosqlite)
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+_scheme, _rest = DATABASE_URI.split(':', 1)
+ASYNC_DATABASE_URI = ASYNC_DRIVERS.get(_scheme, _scheme) + ':' + _rest
+
+# パスワードのハッシュ方式(werkzeug.security.generate_password_hashのmethod)
+# コストは flask auth benchmark-hash で計測して決める
+PASSWORD_HASH_METHOD = os.environ.get(
+    'PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+# ログインユーザーのキャッシュ保持秒数(0でキャッシュしない)
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+# 定期作成するダウンロードファイルの保存先と確認間隔(秒, 0でスレッドを起動しない)
+EXPORT_SNAPSHOT_FOLDER = os.environ.get(
+    'EXPORT_SNAPSHOT_FOLDER', 'instance/export_snapshots')
+EXPORT_SNAPSHOT_INTERVAL = int(os.environ.get('EXPORT_SNAPSHOT_INTERVAL', 0))
+
+# 変更履歴(アウトボックス)の保持期間と、同じ行の古い変更をまとめるまでの日数
+CHANGE_RETENTION_DAYS = int(os.environ.get('CHANGE_RETENTION_DAYS', 30))
+CHANGE_COMPACT_DAYS = int(os.environ.get('CHANGE_COMPACT_DAYS', 1))
+
+# 淘汰からこの日数が過ぎた雄をアーカイブへ移動する(flask boars archive)
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 730))
+
+# 管理者(プロファイル一覧などの管理ページを使える)のメールアドレス(カンマ区切り)
+ADMIN_EMAILS = [
+    x.strip() for x in os.environ.get('ADMIN_EMAILS', '').split(',')
+    if x.strip()]
+
+# 一括取り込みAPI(/api/ingest)のBearerトークン(カンマ区切り)
+# 「AIセンターID:トークン」はAIセンター管轄の農場だけ、トークンのみは全ての農場
+INGEST_TOKENS = {
+    token.strip(): int(station) if station.strip() else None
+    for station, _, token in (
+        x.strip().rpartition(':')
+        for x in os.environ.get('INGEST_TOKENS', '').split(','))
+    if token.strip()}
+
+# 重い処理(ダウンロード・アップロード・一括変更・一括取り込み)の受付制御
+# ワーカーごとの同時実行数(0で制限しない)・待たせる件数・待つ秒数・
+# 1ユーザーの件数(0で制限しない)・SQLを打ち切るミリ秒(0で打ち切らない)
+HEAVY_CONCURRENCY = int(os.environ.get('HEAVY_CONCURRENCY', 2))
+HEAVY_QUEUE = int(os.environ.get('HEAVY_QUEUE', 4))
+HEAVY_QUEUE_TIMEOUT = float(os.environ.get('HEAVY_QUEUE_TIMEOUT', 10))
+HEAVY_PER_USER = int(os.environ.get('HEAVY_PER_USER', 1))
+HEAVY_STATEMENT_TIMEOUT_MS = int(
+    os.environ.get('HEAVY_STATEMENT_TIMEOUT_MS', 60000))
+
+# リクエストのプロファイルの保存先・無作為に計測する割合(%)・記録間隔(ミリ秒)
+# 保存するたびにPROFILE_KEEP件を超えた分とPROFILE_RETENTION_DAYS日を過ぎた分を削除
+PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER', 'instance/profiles')
+PROFILE_SAMPLE_PERCENT = float(os.environ.get('PROFILE_SAMPLE_PERCENT', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+PROFILE_RETENTION_DAYS = int(os.environ.get('PROFILE_RETENTION_DAYS', 7))
+
+# レスポンスの圧縮(このバイト数未満は圧縮しない, gzipは1-9, brotliは0-11)
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_LEVEL = int(os.environ.get('COMPRESS_BROTLI_LEVEL', 4))
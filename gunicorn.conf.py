@@ -0,0 +1,33 @@
+"""gunicornの設定(起動ディレクトリのこのファイルを自動で読み込む)
+
+・ワーカーごとのメトリクスを集計するため、PROMETHEUS_MULTIPROC_DIRを設定する
+・起動時に前回のファイルを削除し、終了したワーカーのファイルを片付ける
+・ワーカーの種類はコマンドの-kで指定する(ProcfileはASGIのUvicornWorker)
+    ・WSGI(app:app)をスレッドで動かす場合は -k gthread
+      (GUNICORN_THREADSスレッド, DB_POOL_SIZE + DB_MAX_OVERFLOWを
+      スレッド数以上にする)
+    ・セッションはスレッド・greenletごとに分かれ、リクエスト終了時に
+      片付けられる(flask check-concurrencyで確認できる)
+"""
+import os
+import shutil
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', 'instance/prometheus')
+
+# child_exitはシグナルの処理中に呼ばれるため、importは起動時に済ませておく
+from prometheus_client import multiprocess  # noqa: E402
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+def on_starting(server) -> None:
+    """前回起動時のメトリクスのファイルを削除する"""
+    folder: str = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder, exist_ok=True)
+
+
+def child_exit(server, worker) -> None:
+    """終了したワーカーの処理中のリクエスト数などを集計から外す"""
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,13 @@
+"""ローカルの負荷試験(python -m loadtest)
+
+・負荷試験用のデータベースを作り直してデータを投入する
+  (既定は一時ディレクトリのSQLite, --database-urlでローカルのPostgreSQL)
+・ProcfileのwebコマンドでアプリをgunicornのUvicornWorkerで起動する
+・複数の仮想クライアントがシナリオ(雄一覧・雄詳細・状態登録・
+  ダウンロード・アップロード)を重み付きで無作為に繰り返す
+・ルートごとのスループット・p50/p95/p99・エラー率をJSONに保存し、
+  バージョン間のレポートを比較する
+
+    python -m loadtest run --clients 20 --duration 60
+    python -m loadtest diff instance/loadtest/before.json after.json
+"""
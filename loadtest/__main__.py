@@ -0,0 +1,231 @@
+"""負荷試験のコマンド(python -m loadtest run / seed / diff)"""
+from __future__ import annotations
+
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+
+from loadtest import client, report, server
+from loadtest.seed import seed_database
+from mendel_japan import UPLOAD_FOLDER
+
+
+def parse_mix(value: str) -> dict:
+    """シナリオの重み(index=30,show=40,...)を辞書にする
+
+    Args:
+        value (str): カンマ区切りのシナリオ名=重み
+
+    Raises:
+        click.BadParameter: 存在しないシナリオ・重みが数値でない
+
+    Returns:
+        dict: シナリオ名と重み(0は除く)
+    """
+    mix: dict = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in client.SCENARIOS:
+            raise click.BadParameter(
+                f'{name}: シナリオは{list(client.SCENARIOS)}から選びます')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise click.BadParameter(f'{item}: 重みは数値で指定します')
+    mix = {k: v for k, v in mix.items() if v > 0}
+    if not mix:
+        raise click.BadParameter('重みが0より大きいシナリオがありません')
+    return mix
+
+
+def git_commit() -> str:
+    """試験したコードのコミット(未コミットの変更がある場合は+dirty)
+
+    Returns:
+        str: コミットの短いハッシュ, 取得できない場合はNone
+    """
+    try:
+        commit: str = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+        dirty: str = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}+dirty' if dirty else commit
+
+
+@click.group()
+def cli() -> None:
+    """ローカルの負荷試験"""
+
+
+@cli.command('seed')
+@click.option('--database-url', envvar='DATABASE_URL', required=True,
+              help='作り直すデータベース(全てのテーブルを削除します)')
+@click.option('--boars', default=2000, show_default=True, help='雄の頭数')
+@click.option('--statuses', default=4, show_default=True,
+              help='雄1頭あたりの状態の最大件数')
+@click.option('--seed', default=1, show_default=True, help='乱数のシード')
+def seed_command(
+        database_url: str, boars: int, statuses: int, seed: int) -> None:
+    """データベースを作り直して試験データを投入する"""
+    os.environ['DATABASE_URL'] = database_url
+    ids, _, status_count = seed_database(boars, statuses, seed)
+    click.echo(f'雄 {len(ids)}頭, 状態 {status_count}件を登録しました')
+
+
+@cli.command('run')
+@click.option('--database-url', default=None,
+              help='試験に使うデータベース(全てのテーブルを削除します)'
+              ' [default: 一時ディレクトリのSQLite]')
+@click.option('--boars', default=2000, show_default=True, help='雄の頭数')
+@click.option('--statuses', default=4, show_default=True,
+              help='雄1頭あたりの状態の最大件数')
+@click.option('--seed', default=1, show_default=True, help='乱数のシード')
+@click.option('--clients', default=20, show_default=True,
+              help='同時に動かす仮想クライアント数')
+@click.option('--duration', default=60.0, show_default=True,
+              help='計測する秒数')
+@click.option('--warmup', default=5.0, show_default=True,
+              help='集計から除く最初の秒数')
+@click.option('--mix', default=','.join(
+    f'{k}={v}' for k, v in client.DEFAULT_MIX.items()), show_default=True,
+    help='シナリオの重み')
+@click.option('--upload-rows', default=20, show_default=True,
+              help='1回のアップロードの行数')
+@click.option('--workers', default=2, show_default=True,
+              help='ワーカー数(WEB_CONCURRENCY)')
+@click.option('--command', default=None,
+              help='サーバーの起動コマンド({port}でポート番号)'
+              ' [default: Procfileのweb]')
+@click.option('--timeout', default=30.0, show_default=True,
+              help='1リクエストのタイムアウト秒数')
+@click.option('--output', default=None,
+              help='レポートの保存先'
+              ' [default: instance/loadtest/日時-コミット.json]')
+def run_command(
+        database_url: str, boars: int, statuses: int, seed: int,
+        clients: int, duration: float, warmup: float, mix: str,
+        upload_rows: int, workers: int, command: str, timeout: float,
+        output: str) -> None:
+    """サーバーを起動して負荷をかけ、レポートを保存する"""
+    scenario_mix: dict = parse_mix(mix)
+    command = command or server.procfile_command()
+    commit: str = git_commit()
+    started_at: datetime = datetime.now()
+    output = output or os.path.join(
+        'instance', 'loadtest',
+        f'{started_at:%Y%m%d%H%M%S}-{commit or "unknown"}.json')
+    log_path: str = os.path.splitext(output)[0] + '.log'
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+    folder: str = tempfile.mkdtemp(prefix='loadtest-')
+    database_url = database_url \
+        or f'sqlite:///{os.path.join(folder, "loadtest.db")}'
+    env: dict = {
+        'DATABASE_URL': database_url,
+        'SECRET_KEY': uuid.uuid4().hex,
+        'WEB_CONCURRENCY': str(workers),
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(folder, 'prometheus'),
+        'EXPORT_SNAPSHOT_INTERVAL': '0',
+    }
+    try:
+        click.echo(f'データを投入しています({database_url.split(":")[0]})')
+        os.environ['DATABASE_URL'] = database_url
+        boar_ids, farm_ids, status_count = \
+            seed_database(boars, statuses, seed)
+
+        port: int = server.free_port()
+        click.echo(f'サーバーを起動しています: {command} (port {port})')
+        process = server.start_server(command, port, env, log_path)
+        try:
+            server.wait_ready(process, port, timeout=60)
+            click.echo(f'{clients}クライアントで{warmup + duration:.0f}秒'
+                       f'(ウォームアップ{warmup:.0f}秒)実行しています')
+            context: dict = {
+                'boar_ids': boar_ids, 'farm_ids': farm_ids,
+                'upload_rows': upload_rows}
+            origin: float = time.perf_counter()
+            until: float = origin + warmup + duration
+            with ThreadPoolExecutor(max_workers=clients) as executor:
+                results = executor.map(
+                    lambda number: client.run_client(
+                        client.Client('127.0.0.1', port, origin, timeout),
+                        scenario_mix, context, seed * 1000 + number, until),
+                    range(clients))
+                samples: list = [x for result in results for x in result]
+            measured: float = time.perf_counter() - origin - warmup
+        finally:
+            server.stop_server(process)
+    except RuntimeError as e:
+        raise click.ClickException(f'{e} (サーバーのログ: {log_path})')
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+        for path in glob.glob(os.path.join(UPLOAD_FOLDER, 'loadtest_*.csv')):
+            os.remove(path)
+
+    result: dict = {
+        'meta': {
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'commit': commit,
+            'database': database_url.split(':')[0],
+            'boars': len(boar_ids),
+            'statuses': status_count,
+            'clients': clients,
+            'duration': round(measured, 1),
+            'warmup': warmup,
+            'mix': scenario_mix,
+            'workers': workers,
+            'command': command,
+        },
+        **report.summarize(samples, measured, warmup),
+    }
+    report.save(result, output)
+    click.echo(report.format_table(result))
+    for error, count in result['errors'].items():
+        click.echo(f'{count:>6}  {error}', err=True)
+    click.echo(f'レポート: {output}')
+    click.echo(f'サーバーのログ: {log_path}')
+
+
+@cli.command('diff')
+@click.argument('before', type=click.Path(exists=True, dir_okay=False))
+@click.argument('after', type=click.Path(exists=True, dir_okay=False))
+@click.option('--threshold', default=10.0, show_default=True,
+              help='悪化とみなす変化率(%)')
+@click.option('--fail-on-regression', is_flag=True,
+              help='悪化した指標がある場合は終了コード1で終了する')
+def diff_command(
+        before: str, after: str, threshold: float,
+        fail_on_regression: bool) -> None:
+    """2つのレポートをルートごとに比較する"""
+    old: dict = report.load(before)
+    new: dict = report.load(after)
+    for label, data in (('before', old), ('after', new)):
+        meta: dict = data['meta']
+        click.echo(
+            f'{label:<7}{meta["commit"]}  {meta["started_at"]}  '
+            f'{meta["database"]}, {meta["clients"]} clients, '
+            f'{meta["workers"]} workers, {meta["duration"]} s')
+    rows: list = report.compare(old, new, threshold)
+    click.echo(report.format_comparison(rows))
+    regressed: int = sum(1 for row in rows if row[-1])
+    click.echo(f'悪化した指標: {regressed}')
+    if regressed and fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
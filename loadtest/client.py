@@ -0,0 +1,272 @@
+"""仮想クライアントとシナリオ
+
+・クライアントごとにHTTP接続(keep-alive)とクッキーを持ち、
+  ブラウザと同じようにフォームのCSRFトークンを読んでから送信する
+・リダイレクトはたどらず、1リクエストごとに所要時間を記録する
+・シナリオは重み(mix)に従って無作為に選び、終了時刻まで繰り返す
+"""
+from __future__ import annotations
+
+import gzip
+import http.client
+import random
+import re
+import time
+import uuid
+from datetime import date, timedelta
+from http.cookies import SimpleCookie
+from typing import NamedTuple
+from urllib.parse import urlencode
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]*)"')
+DEFAULT_MIX: dict = {
+    'index': 30, 'show': 40, 'add_status': 15, 'download': 10, 'upload': 5}
+UPLOAD_LINES: list = ['LLLL', 'NNNN', 'ZZZZ', 'MMMM']
+DOWNLOAD_FORM: dict = {
+    'm_line': 'y', 'n_line': 'y', 'l_line': 'y', 'z_line': 'y',
+    'jl_line': 'y', 'jw_line': 'y',
+    'ggp1_farm': 'y', 'ggp2_farm': 'y', 'east_farm': 'y',
+}
+
+
+class Sample(NamedTuple):
+    """1リクエストの記録
+
+    Attributes:
+        route (str): メソッドとURLのルール(例: GET /boars/<id>)
+        started (float): 試験開始からの秒数
+        seconds (float): 所要時間
+        status (int): ステータス, 接続エラーは0
+        error (str): 想定外のステータス・例外, 成功はNone
+    """
+    route: str
+    started: float
+    seconds: float
+    status: int
+    error: str
+
+
+class Client:
+    """仮想クライアント(1つの接続とクッキー)"""
+
+    def __init__(
+            self, host: str, port: int, origin: float,
+            timeout: float) -> None:
+        self.host: str = host
+        self.port: int = port
+        self.origin: float = origin
+        self.timeout: float = timeout
+        self.cookies: SimpleCookie = SimpleCookie()
+        self.samples: list = []
+        self._connection: http.client.HTTPConnection = None
+
+    def request(
+            self, method: str, path: str, route: str, body: bytes = None,
+            headers: dict = None, expect: tuple = (200,)) -> str:
+        """リクエストを送り、所要時間とステータスを記録する
+
+        Args:
+            method (str): メソッド
+            path (str): パス
+            route (str): 集計に使うルート名
+            body (bytes, optional): 本文. Defaults to None.
+            headers (dict, optional): 追加のヘッダー. Defaults to None.
+            expect (tuple, optional): 成功とみなすステータス.
+                Defaults to (200,).
+
+        Returns:
+            str: 本文(HTMLの場合), 失敗した場合はNone
+        """
+        headers = dict(headers or {}, **{'Accept-Encoding': 'gzip'})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                f'{key}={morsel.value}'
+                for key, morsel in self.cookies.items())
+        started: float = time.perf_counter()
+        try:
+            if self._connection is None:
+                self._connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+            self._connection.request(method, path, body, headers)
+            response: http.client.HTTPResponse = \
+                self._connection.getresponse()
+            data: bytes = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            self._record(route, started, 0, f'{type(e).__name__}: {e}')
+            return None
+
+        for cookie in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(cookie)
+        status: int = response.status
+        error: str = None if status in expect else f'HTTP {status}'
+        self._record(route, started, status, error)
+        if error is not None:
+            return None
+        if response.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        content_type: str = response.headers.get('Content-Type', '')
+        return data.decode() if content_type.startswith('text/') else ''
+
+    def _record(
+            self, route: str, started: float, status: int,
+            error: str) -> None:
+        now: float = time.perf_counter()
+        self.samples.append(Sample(
+            route, started - self.origin, now - started, status, error))
+
+    def form_token(self, path: str, route: str) -> str:
+        """フォームのページを表示してCSRFトークンを返す
+
+        Args:
+            path (str): フォームのページ
+            route (str): 集計に使うルート名
+
+        Returns:
+            str: CSRFトークン, 取得できない場合はNone
+        """
+        html: str = self.request('GET', path, route)
+        match = CSRF_PATTERN.search(html or '')
+        return match.group(1) if match else None
+
+    def post_form(
+            self, path: str, route: str, fields: dict,
+            expect: tuple) -> str:
+        """フォームをapplication/x-www-form-urlencodedで送信する
+
+        Args:
+            path (str): 送信先
+            route (str): 集計に使うルート名
+            fields (dict): 項目
+            expect (tuple): 成功とみなすステータス
+
+        Returns:
+            str: 本文(HTMLの場合)
+        """
+        return self.request(
+            'POST', path, route, urlencode(fields).encode(),
+            {'Content-Type': 'application/x-www-form-urlencoded'}, expect)
+
+    def post_file(
+            self, path: str, route: str, fields: dict, file_name: str,
+            content: bytes, expect: tuple) -> str:
+        """フォームとファイルをmultipart/form-dataで送信する
+
+        Args:
+            path (str): 送信先
+            route (str): 集計に使うルート名
+            fields (dict): ファイル以外の項目
+            file_name (str): ファイル名
+            content (bytes): ファイルの内容
+            expect (tuple): 成功とみなすステータス
+
+        Returns:
+            str: 本文(HTMLの場合)
+        """
+        boundary: str = uuid.uuid4().hex
+        parts: list = [
+            f'--{boundary}\r\nContent-Disposition: form-data; '
+            f'name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()]
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; '
+            f'name="file"; filename="{file_name}"\r\n'
+            'Content-Type: text/csv\r\n\r\n'.encode() + content + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return self.request(
+            'POST', path, route, b''.join(parts),
+            {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            expect)
+
+    def close(self) -> None:
+        """接続を閉じる(次のリクエストで接続し直す)"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def index(client: Client, rnd: random.Random, context: dict) -> None:
+    """雄一覧を表示する"""
+    client.request('GET', '/boars/', 'GET /boars/')
+
+
+def show(client: Client, rnd: random.Random, context: dict) -> None:
+    """雄詳細を表示する"""
+    boar_id: int = rnd.choice(context['boar_ids'])
+    client.request('GET', f'/boars/{boar_id}', 'GET /boars/<id>')
+
+
+def add_status(client: Client, rnd: random.Random, context: dict) -> None:
+    """雄詳細を表示して状態を登録する"""
+    boar_id: int = rnd.choice(context['boar_ids'])
+    token: str = client.form_token(f'/boars/{boar_id}', 'GET /boars/<id>')
+    if token is None:
+        return
+    client.post_form(f'/boars/{boar_id}', 'POST /boars/<id>', {
+        'csrf_token': token,
+        'start_on': (date.today() - timedelta(
+            days=rnd.randint(0, 30))).isoformat(),
+        'status': rnd.choice(['生産可', '生産外', '注意']),
+        'reason': '負荷試験',
+    }, expect=(302,))
+
+
+def download(client: Client, rnd: random.Random, context: dict) -> None:
+    """ダウンロードページを表示して雄一覧をダウンロードする"""
+    token: str = client.form_token('/boars/download', 'GET /boars/download')
+    if token is None:
+        return
+    client.post_form('/boars/download', 'POST /boars/download', dict(
+        DOWNLOAD_FORM, csrf_token=token,
+        enrollment_status=rnd.choice(['all', 'alive_only', 'culled_only'])),
+        expect=(200,))
+
+
+def upload(client: Client, rnd: random.Random, context: dict) -> None:
+    """アップロードページを表示して雄一覧(CSV)を登録する"""
+    token: str = client.form_token('/boars/upload', 'GET /boars/upload')
+    if token is None:
+        return
+    prefix: str = uuid.uuid4().hex[:10].upper()
+    lines: list = ['タトゥー,雄ID,系統,生年月日,淘汰日']
+    lines += [
+        f'LU{prefix}{number:03d},,{rnd.choice(UPLOAD_LINES)},'
+        f'{date.today() - timedelta(days=rnd.randint(200, 900))},'
+        for number in range(context['upload_rows'])]
+    client.post_file('/boars/upload', 'POST /boars/upload', {
+        'csrf_token': token,
+        'farm_id': rnd.choice(context['farm_ids']),
+    }, f'loadtest_{prefix}.csv', '\n'.join(lines).encode(), expect=(302,))
+
+
+SCENARIOS: dict = {
+    'index': index,
+    'show': show,
+    'add_status': add_status,
+    'download': download,
+    'upload': upload,
+}
+
+
+def run_client(
+        client: Client, mix: dict, context: dict, seed: int,
+        until: float) -> list:
+    """終了時刻までシナリオを繰り返す
+
+    Args:
+        client (Client): 仮想クライアント
+        mix (dict): シナリオ名と重み
+        context (dict): boar_ids, farm_ids, upload_rows
+        seed (int): 乱数のシード
+        until (float): 終了時刻(time.perf_counter)
+
+    Returns:
+        list: Sampleのリスト
+    """
+    rnd: random.Random = random.Random(seed)
+    names: list = list(mix)
+    weights: list = [mix[x] for x in names]
+    while time.perf_counter() < until:
+        SCENARIOS[rnd.choices(names, weights)[0]](client, rnd, context)
+    client.close()
+    return client.samples
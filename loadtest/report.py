@@ -0,0 +1,184 @@
+"""負荷試験の集計・保存・比較
+
+・ルートごとと全体のリクエスト数、スループット(req/s)、エラー率、
+  レイテンシ(p50/p95/p99・平均・最大, ミリ秒)を求める
+・ウォームアップ中に始まったリクエストは集計から除く
+・レポートはJSONで保存し、2つのレポートをルートごとに比較する
+"""
+from __future__ import annotations
+
+import json
+import os
+from collections import Counter
+
+import numpy as np
+
+METRICS: list = ['throughput', 'p50', 'p95', 'p99', 'error_rate']
+# 大きいほど悪い指標(スループットは小さいほど悪い)
+WORSE_WHEN_HIGHER: dict = {
+    'throughput': False, 'p50': True, 'p95': True, 'p99': True,
+    'error_rate': True}
+
+
+def route_stats(samples: list, seconds: float) -> dict:
+    """リクエストの記録を集計する
+
+    Args:
+        samples (list): Sampleのリスト
+        seconds (float): 集計期間(秒)
+
+    Returns:
+        dict: requests, errors, error_rate, throughput,
+            p50, p95, p99, mean, max(ミリ秒), statuses
+    """
+    latencies = np.array([x.seconds for x in samples]) * 1000
+    errors: int = sum(1 for x in samples if x.error is not None)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) \
+        if len(latencies) else (0, 0, 0)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'throughput': round(len(samples) / seconds, 2) if seconds else 0,
+        'p50': round(float(p50), 1),
+        'p95': round(float(p95), 1),
+        'p99': round(float(p99), 1),
+        'mean': round(float(latencies.mean()), 1) if samples else 0,
+        'max': round(float(latencies.max()), 1) if samples else 0,
+        'statuses': {
+            str(k): v for k, v in sorted(
+                Counter(x.status for x in samples).items())},
+    }
+
+
+def summarize(samples: list, duration: float, warmup: float) -> dict:
+    """ウォームアップ後のリクエストをルートごとと全体で集計する
+
+    Args:
+        samples (list): 全てのクライアントのSample
+        duration (float): 計測期間(秒, ウォームアップを含まない)
+        warmup (float): ウォームアップ(秒)
+
+    Returns:
+        dict: total(全体), routes(ルートごと), errors(エラーの内容と件数)
+    """
+    measured: list = [x for x in samples if x.started >= warmup]
+    routes: dict = {}
+    for sample in measured:
+        routes.setdefault(sample.route, []).append(sample)
+    errors: Counter = Counter(
+        f'{x.route}: {x.error}' for x in measured if x.error is not None)
+    return {
+        'total': route_stats(measured, duration),
+        'routes': {
+            route: route_stats(routes[route], duration)
+            for route in sorted(routes)},
+        'errors': dict(errors.most_common(20)),
+    }
+
+
+def save(report: dict, path: str) -> None:
+    """レポートをJSONで保存する
+
+    Args:
+        report (dict): レポート
+        path (str): 保存先
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def load(path: str) -> dict:
+    """保存したレポートを読み込む
+
+    Args:
+        path (str): レポートのファイル
+
+    Returns:
+        dict: レポート
+    """
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def format_table(report: dict) -> str:
+    """レポートを表形式の文字列にする
+
+    Args:
+        report (dict): レポート
+
+    Returns:
+        str: ルートごとの行と全体の行
+    """
+    header: str = f'{"route":<26}{"req":>7}{"req/s":>9}{"err%":>7}' \
+        f'{"p50":>9}{"p95":>9}{"p99":>9}{"max":>9}'
+    lines: list = [header, '-' * len(header)]
+    rows: list = list(report['routes'].items()) \
+        + [('total', report['total'])]
+    for route, stats in rows:
+        lines.append(
+            f'{route:<26}{stats["requests"]:>7}{stats["throughput"]:>9.2f}'
+            f'{stats["error_rate"] * 100:>7.1f}{stats["p50"]:>9.1f}'
+            f'{stats["p95"]:>9.1f}{stats["p99"]:>9.1f}{stats["max"]:>9.1f}')
+    return '\n'.join(lines)
+
+
+def compare(before: dict, after: dict, threshold: float) -> list:
+    """2つのレポートをルートごと・指標ごとに比較する
+
+    ・変化率がthreshold(%)を超えて悪くなった指標を悪化とする
+    ・エラー率は0から増えた場合も悪化とする
+
+    Args:
+        before (dict): 比較元のレポート
+        after (dict): 比較先のレポート
+        threshold (float): 悪化とみなす変化率(%)
+
+    Returns:
+        list: (ルート, 指標, 比較元, 比較先, 変化率(%), 悪化したか)のリスト
+    """
+    rows: list = []
+    names: list = list(before['routes']) + [
+        x for x in after['routes'] if x not in before['routes']] + ['total']
+    for route in names:
+        old: dict = before['total'] if route == 'total' \
+            else before['routes'].get(route)
+        new: dict = after['total'] if route == 'total' \
+            else after['routes'].get(route)
+        if old is None or new is None:
+            continue
+        for metric in METRICS:
+            change: float = (new[metric] - old[metric]) / old[metric] * 100 \
+                if old[metric] else None
+            if change is None:
+                regressed: bool = \
+                    metric == 'error_rate' and new[metric] > old[metric]
+            else:
+                worse: float = change if WORSE_WHEN_HIGHER[metric] \
+                    else -change
+                regressed = worse > threshold
+            rows.append(
+                (route, metric, old[metric], new[metric], change, regressed))
+    return rows
+
+
+def format_comparison(rows: list) -> str:
+    """比較結果を表形式の文字列にする
+
+    Args:
+        rows (list): compareの戻り値
+
+    Returns:
+        str: 悪化した指標には!を付ける
+    """
+    header: str = f'{"route":<26}{"metric":<12}{"before":>10}' \
+        f'{"after":>10}{"change":>10}'
+    lines: list = [header, '-' * len(header)]
+    for route, metric, old, new, change, regressed in rows:
+        shown: str = f'{change:+.1f}%' if change is not None else '-'
+        lines.append(
+            f'{route:<26}{metric:<12}{old:>10}{new:>10}{shown:>10}'
+            f'{" !" if regressed else ""}')
+    return '\n'.join(lines)
@@ -0,0 +1,96 @@
+"""負荷試験用のデータベースの作成
+
+環境変数DATABASE_URLのデータベースの全てのテーブルを作り直し、
+AIセンター・農場・系統と、雄・状態を投入する
+"""
+from __future__ import annotations
+
+import os
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+STATIONS: list = [('東日本AIセンター', '東日本AI'), ('西日本AIセンター', '西日本AI')]
+FARMS: list = [
+    ('GGP農場', 'GGP', 0), ('第2農場', '第2農場', 0), ('東日本農場', '東日本', 1)]
+LINES: list = [
+    ('MMMM', 'デュロック', 'D', 'M'), ('NNNN', 'TL', 'TL', 'N'),
+    ('LLLL', 'ランドレース', 'LL', 'L'), ('ZZZZ', 'TW', 'TW', 'Z'),
+    ('JL', 'JL', 'L', 'JL'), ('JW', 'JW', 'W', 'JW')]
+STATUSES: list = ['生産可', '生産外', '注意']
+
+
+def seed_database(boars: int, statuses: int, seed: int) -> tuple:
+    """テーブルを作り直して試験データを投入する
+
+    ・雄の生年月日は6年前から1年前まで、4割は淘汰済み
+    ・雄ごとに0〜statuses件の状態を60日おきに登録する
+
+    Args:
+        boars (int): 雄の頭数
+        statuses (int): 雄1頭あたりの状態の最大件数
+        seed (int): 乱数のシード
+
+    Returns:
+        tuple: (雄IDのリスト, 農場IDのリスト, 登録した状態の件数)
+    """
+    from mendel_japan import UPLOAD_FOLDER, create_app, db
+    from mendel_japan.models import AiStation, Boar, Farm, Line, Status
+
+    app = create_app()
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    rnd: random.Random = random.Random(seed)
+    today: date = date.today()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        stations: list = [
+            AiStation(name=name, abbreviation=abbreviation)
+            for name, abbreviation in STATIONS]
+        db.session.add_all(stations)
+        db.session.flush()
+        farms: list = [
+            Farm(name=name, abbreviation=abbreviation,
+                 ai_station_id=stations[station].id)
+            for name, abbreviation, station in FARMS]
+        lines: list = [
+            Line(line=line, name=name, abbreviation=abbreviation, code=code)
+            for line, name, abbreviation, code in LINES]
+        db.session.add_all(farms + lines)
+        db.session.flush()
+
+        boar_rows: list = []
+        births: list = []
+        for number in range(1, boars + 1):
+            birth_on: date = today - timedelta(days=rnd.randint(365, 2190))
+            culled: bool = rnd.random() < 0.4
+            births.append(birth_on)
+            boar_rows.append({
+                'tattoo': f'LT{number:07d}',
+                'name': f'LT{number}',
+                'birth_on': birth_on,
+                'culling_on': birth_on + timedelta(
+                    days=rnd.randint(200, 360)) if culled else None,
+                'farm_id': rnd.choice(farms).id,
+                'line_id': rnd.choice(lines).id,
+            })
+        db.session.execute(Boar.__table__.insert(), boar_rows)
+        ids: list = db.session.execute(
+            select(Boar.id).order_by(Boar.id)).scalars().all()
+
+        status_rows: list = [
+            {
+                'boar_id': boar_id,
+                'status': rnd.choice(STATUSES),
+                'reason': '負荷試験',
+                'start_on': birth_on + timedelta(days=100 + 60 * k),
+            }
+            for boar_id, birth_on in zip(ids, births)
+            for k in range(rnd.randint(0, statuses))]
+        if status_rows:
+            db.session.execute(Status.__table__.insert(), status_rows)
+        farm_ids: list = [farm.id for farm in farms]
+        db.session.commit()
+        db.session.remove()
+    return ids, farm_ids, len(status_rows)
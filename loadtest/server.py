@@ -0,0 +1,117 @@
+"""負荷試験の対象のサーバーの起動・停止
+
+・Procfileのwebコマンドにバインド先を加えて起動する
+・ワーカー数・スレッド数などはgunicorn.conf.pyと同じ環境変数で渡す
+・雄一覧が200を返すまで待ってから試験を始める
+"""
+from __future__ import annotations
+
+import http.client
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import time
+
+
+def procfile_command(path: str = 'Procfile') -> str:
+    """Procfileのwebプロセスのコマンドを返す
+
+    Args:
+        path (str, optional): Procfile. Defaults to 'Procfile'.
+
+    Raises:
+        ValueError: webプロセスがない
+
+    Returns:
+        str: コマンド
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            name, _, command = line.partition(':')
+            if name.strip() == 'web':
+                return command.strip()
+    raise ValueError(f'{path}にwebプロセスがありません')
+
+
+def free_port() -> int:
+    """空いているポート番号を返す
+
+    Returns:
+        int: ポート番号
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(
+        command: str, port: int, env: dict, log_path: str) -> subprocess.Popen:
+    """サーバーを起動する
+
+    ・コマンドに{port}がある場合は置き換え、ない場合は--bindを加える
+
+    Args:
+        command (str): 起動コマンド
+        port (int): ポート番号
+        env (dict): 追加の環境変数
+        log_path (str): サーバーのログの保存先
+
+    Returns:
+        subprocess.Popen: サーバーのプロセス
+    """
+    if '{port}' in command:
+        command = command.format(port=port)
+    else:
+        command = f'{command} --bind 127.0.0.1:{port}'
+    with open(log_path, 'wb') as log:
+        return subprocess.Popen(
+            shlex.split(command), env=dict(os.environ, **env),
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def wait_ready(
+        process: subprocess.Popen, port: int, timeout: float) -> None:
+    """雄一覧が200を返すまで待つ
+
+    Args:
+        process (subprocess.Popen): サーバーのプロセス
+        port (int): ポート番号
+        timeout (float): 待つ秒数
+
+    Raises:
+        RuntimeError: サーバーが終了した、または時間内に応答しない
+    """
+    deadline: float = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(
+                f'サーバーが終了しました(終了コード{process.returncode})')
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', '/boars/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.5)
+    raise RuntimeError(f'サーバーが{timeout}秒以内に応答しませんでした')
+
+
+def stop_server(process: subprocess.Popen, timeout: float = 30) -> None:
+    """サーバーをワーカーごと停止する
+
+    Args:
+        process (subprocess.Popen): サーバーのプロセス
+        timeout (float, optional): 強制終了までの秒数. Defaults to 30.
+    """
+    if process.poll() is None:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
@@ -4,48 +4,109 @@ import os
 from flask_login import LoginManager
 from flask_bootstrap import Bootstrap
 from flask_migrate import Migrate
-from sqlalchemy.orm import scoped_session, sessionmaker
-
-from config import engine
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import sqlite3
 
+# セッションはdb.sessionだけを使う
+# (スレッド・greenletごとのscoped_session, リクエスト終了時にremoveされる)
 db = SQLAlchemy()
-session = scoped_session(sessionmaker(
-    autocommit=False, autoflush=False, bind=engine))
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record) -> None:
+    """SQLiteでも外部キー制約(ON DELETE CASCADE)を有効にする"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 
 DB_NAME = 'database.db'
 UPLOAD_FOLDER = 'mendel_japan/static/tmp/'
-ALLOWED_EXTENSIONS = ['xlsx', 'xlsm', 'xls']
+ALLOWED_EXTENSIONS = ['xlsx', 'xlsm', 'xls', 'csv', 'parquet']
 
 
 def create_app():
     app = Flask(__name__)
     Bootstrap(app)
-    app.config['SECRET_KEY'] = os.urandom(24)
 
-    from config import DATABASE_URI
+    from config import (
+        DATABASE_URI, SECRET_KEY, PASSWORD_HASH_METHOD, USER_CACHE_TTL,
+        EXPORT_SNAPSHOT_FOLDER, EXPORT_SNAPSHOT_INTERVAL,
+        CHANGE_RETENTION_DAYS, CHANGE_COMPACT_DAYS, ARCHIVE_AFTER_DAYS,
+        ADMIN_EMAILS, PROFILE_FOLDER, PROFILE_SAMPLE_PERCENT,
+        PROFILE_INTERVAL_MS, PROFILE_KEEP, PROFILE_RETENTION_DAYS,
+        COMPRESS_MIN_SIZE, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_LEVEL,
+        HEAVY_CONCURRENCY, HEAVY_QUEUE, HEAVY_QUEUE_TIMEOUT, HEAVY_PER_USER,
+        HEAVY_STATEMENT_TIMEOUT_MS, SQL_ECHO, ENGINE_OPTIONS)
 
+    app.config['SECRET_KEY'] = SECRET_KEY or os.urandom(24)
     app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
+    app.config['SQLALCHEMY_ECHO'] = SQL_ECHO
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = ENGINE_OPTIONS
+    app.config['PASSWORD_HASH_METHOD'] = PASSWORD_HASH_METHOD
+    app.config['USER_CACHE_TTL'] = USER_CACHE_TTL
+    app.config['EXPORT_SNAPSHOT_FOLDER'] = EXPORT_SNAPSHOT_FOLDER
+    app.config['EXPORT_SNAPSHOT_INTERVAL'] = EXPORT_SNAPSHOT_INTERVAL
+    app.config['CHANGE_RETENTION_DAYS'] = CHANGE_RETENTION_DAYS
+    app.config['CHANGE_COMPACT_DAYS'] = CHANGE_COMPACT_DAYS
+    app.config['ARCHIVE_AFTER_DAYS'] = ARCHIVE_AFTER_DAYS
+    app.config['ADMIN_EMAILS'] = ADMIN_EMAILS
+    app.config['PROFILE_FOLDER'] = PROFILE_FOLDER
+    app.config['PROFILE_SAMPLE_PERCENT'] = PROFILE_SAMPLE_PERCENT
+    app.config['PROFILE_INTERVAL_MS'] = PROFILE_INTERVAL_MS
+    app.config['PROFILE_KEEP'] = PROFILE_KEEP
+    app.config['PROFILE_RETENTION_DAYS'] = PROFILE_RETENTION_DAYS
+    app.config['COMPRESS_MIN_SIZE'] = COMPRESS_MIN_SIZE
+    app.config['COMPRESS_GZIP_LEVEL'] = COMPRESS_GZIP_LEVEL
+    app.config['COMPRESS_BROTLI_LEVEL'] = COMPRESS_BROTLI_LEVEL
+    app.config['HEAVY_CONCURRENCY'] = HEAVY_CONCURRENCY
+    app.config['HEAVY_QUEUE'] = HEAVY_QUEUE
+    app.config['HEAVY_QUEUE_TIMEOUT'] = HEAVY_QUEUE_TIMEOUT
+    app.config['HEAVY_PER_USER'] = HEAVY_PER_USER
+    app.config['HEAVY_STATEMENT_TIMEOUT_MS'] = HEAVY_STATEMENT_TIMEOUT_MS
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
     db.init_app(app)
+    from . import metrics
+    metrics.init_app(app)
+    from . import admission
+    admission.init_app(app)
+    from . import assets
+    assets.init_app(app)
+    from . import concurrency
+    concurrency.init_app(app)
+    from .compression import CompressionMiddleware
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app, app.config['COMPRESS_MIN_SIZE'],
+        app.config['COMPRESS_GZIP_LEVEL'], app.config['COMPRESS_BROTLI_LEVEL'])
+    from .admin import profiler
+    profiler.init_app(app)
     from .auth.routes import auth
     app.register_blueprint(auth, url_prefix='/')
 
-    from .boars.routes import boars, assets as base_assets
+    from .boars.routes import boars
     app.register_blueprint(boars, url_prefix='/boars')
-    base_assets.init_app(app)
 
-    from .models import User
+    from .admin.routes import admin
+    app.register_blueprint(admin, url_prefix='/admin')
+
+    from .auth.cache import load_user as load_cached_user
     migrate = Migrate(app, db)  # noqa: F841
 
     db.create_all(app=app)
 
+    if app.config['EXPORT_SNAPSHOT_INTERVAL'] > 0:
+        from .boars.snapshots import start_scheduler
+        start_scheduler(app, app.config['EXPORT_SNAPSHOT_INTERVAL'])
+
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(int(id))
+        return load_cached_user(int(id), app.config['USER_CACHE_TTL'])
 
     return app
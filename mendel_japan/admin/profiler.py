@@ -0,0 +1,270 @@
+"""リクエスト単位のプロファイラ
+
+・次のリクエストだけを計測する(通常のリクエストには影響しない)
+    ・管理者(ADMIN_EMAILS)がX-Profileヘッダーか?_profile=1を付けたとき
+    ・PROFILE_SAMPLE_PERCENTの割合で無作為に選んだとき
+・計測中は別スレッドでリクエストのスレッドのコールスタックを
+  PROFILE_INTERVAL_MSミリ秒ごとに記録し、SQLの処理時間も記録する
+・結果はPROFILE_FOLDERに保存する
+    ・<id>.folded: コールスタック(flamegraph.pl, speedscopeで読める形式)
+    ・<id>.json: ルート, 処理時間, SQLの一覧
+・保存するたびに、PROFILE_KEEP件を超えた分と
+  PROFILE_RETENTION_DAYS日を過ぎた分を削除する
+・ストリーミングで返すレスポンスは本文を返す前までを計測する
+"""
+from __future__ import annotations
+
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import Flask, current_app, g, has_request_context, request
+from flask import wrappers
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class StackSampler(threading.Thread):
+    """指定したスレッドのコールスタックを一定間隔で記録するスレッド
+
+    Args:
+        thread_id (int): 記録するスレッドのID
+        interval (float): 記録の間隔(秒)
+    """
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[folded_stack(frame)] += 1
+
+    def stop(self) -> Counter:
+        """記録を止める
+
+        Returns:
+            Counter: コールスタックごとの記録回数
+        """
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+def folded_stack(frame) -> str:
+    """フレームから呼び出し元までを;でつないだ文字列にする
+
+    Args:
+        frame (frame): 最も内側のフレーム
+
+    Returns:
+        str: モジュール:関数;...(外側から順に)
+    """
+    names: list = []
+    while frame is not None:
+        module: str = frame.f_globals.get('__name__', '?')
+        names.append(f'{module}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def is_admin(user) -> bool:
+    """管理者かを返す
+
+    Args:
+        user (User): ログイン中のユーザー
+
+    Returns:
+        bool: ADMIN_EMAILSに含まれていればTrue
+    """
+    return bool(user.is_authenticated
+                and user.email in current_app.config['ADMIN_EMAILS'])
+
+
+def trigger() -> str | None:
+    """このリクエストを計測するかを判定する
+
+    Returns:
+        str | None: 計測する理由(flag, sample), 計測しない場合はNone
+    """
+    requested: bool = 'X-Profile' in request.headers \
+        or request.args.get('_profile') == '1'
+    if requested and is_admin(current_user):
+        return 'flag'
+    if random.random() * 100 < current_app.config['PROFILE_SAMPLE_PERCENT']:
+        return 'sample'
+    return None
+
+
+def start_profile() -> None:
+    """計測対象のリクエストであれば計測を始める"""
+    if request.endpoint and request.endpoint.startswith('admin.'):
+        return
+    reason: str | None = trigger()
+    if reason is None:
+        return
+    sampler = StackSampler(
+        threading.get_ident(),
+        current_app.config['PROFILE_INTERVAL_MS'] / 1000)
+    g.profile = {
+        'reason': reason,
+        'started': time.perf_counter(),
+        'started_at': datetime.now(),
+        'sql': [],
+        'sampler': sampler,
+    }
+    sampler.start()
+
+
+def end_profile(response: wrappers.Response) -> wrappers.Response:
+    """計測を終えて保存し、X-Profile-Idヘッダーを付ける"""
+    profile: dict | None = g.pop('profile', None)
+    if profile is None:
+        return response
+    stacks: Counter = profile['sampler'].stop()
+    seconds: float = time.perf_counter() - profile['started']
+    started_at: datetime = profile['started_at']
+    profile_id: str = f"{started_at:%Y%m%d%H%M%S%f}-{os.getpid()}"
+    sql: list = sorted(profile['sql'], key=lambda x: -x['seconds'])
+    meta: dict = {
+        'id': profile_id,
+        'reason': profile['reason'],
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'route': request.url_rule.rule if request.url_rule else None,
+        'status': response.status_code,
+        'started_at': started_at.isoformat(),
+        'seconds': round(seconds, 6),
+        'samples': sum(stacks.values()),
+        'sql_count': len(sql),
+        'sql_seconds': round(sum(x['seconds'] for x in sql), 6),
+        'sql': sql,
+    }
+    save_profile(profile_id, stacks, meta)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany) -> None:
+    """計測中のリクエストであればSQLの開始時刻を記録する"""
+    if has_request_context() and 'profile' in g:
+        conn.info['profile_query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany) -> None:
+    """計測中のリクエストであればSQLと処理時間を記録する"""
+    started: float = conn.info.pop('profile_query_started', None)
+    if started is None or not has_request_context() or 'profile' not in g:
+        return
+    g.profile['sql'].append({
+        'statement': statement,
+        'seconds': round(time.perf_counter() - started, 6),
+        'executemany': executemany,
+    })
+
+
+def profile_folder() -> str:
+    """プロファイルの保存先を返す(なければ作成)
+
+    Returns:
+        str: ディレクトリのパス
+    """
+    folder: str = current_app.config['PROFILE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def save_profile(profile_id: str, stacks: Counter, meta: dict) -> None:
+    """プロファイルを保存し、保持期間・件数を過ぎたものを削除する
+
+    Args:
+        profile_id (str): ID(ファイル名)
+        stacks (Counter): コールスタックごとの記録回数
+        meta (dict): ルート, 処理時間, SQLなど
+    """
+    folder: str = profile_folder()
+    with open(os.path.join(folder, f'{profile_id}.folded'), 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f'{stack} {count}\n')
+    with open(os.path.join(folder, f'{profile_id}.json'), 'w') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    prune_profiles(
+        folder, current_app.config['PROFILE_KEEP'],
+        timedelta(days=current_app.config['PROFILE_RETENTION_DAYS']))
+
+
+def prune_profiles(folder: str, keep: int, retention: timedelta) -> int:
+    """古いプロファイルを削除する
+
+    Args:
+        folder (str): 保存先
+        keep (int): 残す件数
+        retention (timedelta): 保持期間
+
+    Returns:
+        int: 削除した件数
+    """
+    paths: list = sorted(
+        glob.glob(os.path.join(folder, '*.json')), reverse=True)
+    expires: float = time.time() - retention.total_seconds()
+    removed: int = 0
+    for number, path in enumerate(paths):
+        if number < keep and os.path.getmtime(path) >= expires:
+            continue
+        stem: str = path[:-len('.json')]
+        for old in (path, f'{stem}.folded'):
+            if os.path.exists(old):
+                os.remove(old)
+        removed += 1
+    return removed
+
+
+def list_profiles() -> list:
+    """保存済みのプロファイルを新しい順に返す
+
+    Returns:
+        list: 各プロファイルのjson(SQLの一覧を除く)
+    """
+    profiles: list = []
+    for path in sorted(
+            glob.glob(os.path.join(profile_folder(), '*.json')),
+            reverse=True):
+        with open(path) as f:
+            meta: dict = json.load(f)
+        meta.pop('sql', None)
+        profiles.append(meta)
+    return profiles
+
+
+def discard_profile(error: BaseException = None) -> None:
+    """保存されずに終わった計測のスレッドを止める"""
+    profile: dict | None = g.pop('profile', None)
+    if profile is not None:
+        profile['sampler'].stop()
+
+
+def init_app(app: Flask) -> None:
+    """計測をアプリに登録する
+
+    Args:
+        app (Flask): アプリ
+    """
+    app.before_request(start_profile)
+    app.after_request(end_profile)
+    app.teardown_request(discard_profile)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+from flask import (
+    Blueprint, render_template, abort, send_from_directory, jsonify,
+    request)
+from flask import wrappers
+from flask_login import current_user
+
+from mendel_japan.admin import profiler, slow_queries
+
+
+admin = Blueprint('admin', __name__,)
+
+PROFILE_SUFFIXES = ('folded', 'json')
+
+
+@admin.before_request
+def require_admin() -> None:
+    """管理者以外は403を返す"""
+    if not profiler.is_admin(current_user):
+        abort(403)
+
+
+@admin.route('/profiles')
+def profiles() -> str:
+    """保存済みのプロファイル一覧を表示
+
+    Returns:
+        str: HTML
+    """
+    return render_template(
+        './admin/profiles.html', user=current_user,
+        profiles=profiler.list_profiles())
+
+
+@admin.route('/profiles/<profile_id>.<suffix>')
+def profile_download(profile_id: str, suffix: str) -> wrappers.Response:
+    """プロファイルをダウンロード
+
+    ・folded: コールスタック(flamegraph.pl, speedscopeで読める形式)
+    ・json: ルート, 処理時間, SQLの一覧
+
+    Args:
+        profile_id (str): プロファイルのID
+        suffix (str): folded または json
+
+    Returns:
+        flask.wrappers.Response: レスポンス(ファイル)
+    """
+    if suffix not in PROFILE_SUFFIXES:
+        abort(404)
+    return send_from_directory(
+        profiler.profile_folder(), f'{profile_id}.{suffix}',
+        as_attachment=True)
+
+
+@admin.route('/slow-queries')
+def slow_query_stats() -> wrappers.Response:
+    """遅いSQLのフィンガープリントごとの集計をJSONで返す
+
+    ・このワーカーのプロセスの集計(起動してからの分)
+    ・?reset=1で返した後に集計を消去する
+
+    Returns:
+        flask.wrappers.Response: JSON
+    """
+    response: wrappers.Response = jsonify(slow_queries.summary())
+    if request.args.get('reset') == '1':
+        slow_queries.reset()
+    return response
@@ -0,0 +1,305 @@
+"""遅いSQLの記録(スロークエリログ)
+
+・SLOW_QUERY_MSミリ秒以上かかったSQLだけを記録する(0で記録しない)
+    ・ログ(WARNING)に処理時間, パラメータの型, ルート, 呼び出し元を出す
+    ・リテラルとINのパラメータ数を除いたSQL(フィンガープリント)ごとに
+      件数・合計・最大の処理時間、ルート・呼び出し元の内訳を集計する
+・フィンガープリントの初回はSLOW_QUERY_EXPLAINに応じて実行計画を取得する
+    ・off: 取得しない
+    ・plan: EXPLAIN(SQLiteはEXPLAIN QUERY PLAN)
+    ・analyze: 上記に加え、SELECTはEXPLAIN ANALYZE(PostgreSQLのみ)
+      (SQLをもう一度実行するので、別スレッド・別の接続で後から取得する)
+    ・非同期エンジン(API)のSQLは実行計画を取得しない
+・集計はワーカーのプロセスごとに持ち、/admin/slow-queriesで返す
+・全てのSQLをログに出す場合はSQL_ECHO=trueにする
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import (
+    SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN, SLOW_QUERY_MAX_FINGERPRINTS)
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+PACKAGE_ROOT: str = os.path.dirname(os.path.dirname(__file__))
+LITERALS: list = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%\(\w+\)s|%s|\$\d+|:\w+'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+_lock = threading.Lock()
+_stats: dict = {}
+_dropped: Counter = Counter()
+
+
+def fingerprint(statement: str) -> tuple:
+    """SQLからリテラルとパラメータの数を除いて正規化する
+
+    Args:
+        statement (str): SQL
+
+    Returns:
+        tuple: (ハッシュ値, 正規化したSQL)
+    """
+    normalized: str = statement
+    for pattern, replacement in LITERALS:
+        normalized = pattern.sub(replacement, normalized)
+    normalized = normalized.strip()
+    digest: str = hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+    return digest, normalized
+
+
+def parameter_shape(parameters, executemany: bool) -> str:
+    """パラメータの値を除いた型だけを返す(ログに値を残さない)
+
+    Args:
+        parameters (tuple | dict | list): SQLのパラメータ
+        executemany (bool): executemanyで実行したか
+
+    Returns:
+        str: 例 {'id': 'int'}, 500 x ('str', 'int')
+    """
+    if executemany:
+        rows: list = list(parameters)
+        first: str = parameter_shape(rows[0], False) if rows else '()'
+        return f'{len(rows)} x {first}'
+    if isinstance(parameters, dict):
+        return repr({k: type(v).__name__ for k, v in parameters.items()})
+    if len(parameters) > 10:
+        kinds: Counter = Counter(type(x).__name__ for x in parameters)
+        return f'{len(parameters)} params {dict(kinds)}'
+    return repr(tuple(type(x).__name__ for x in parameters))
+
+
+def current_route() -> str:
+    """SQLを実行したルートを返す
+
+    Returns:
+        str: METHOD ルート, リクエスト外(CLI, スレッド)の場合は-
+    """
+    if not has_request_context():
+        return '-'
+    rule: str = request.url_rule.rule if request.url_rule else request.path
+    return f'{request.method} {rule}'
+
+
+def origin() -> str:
+    """SQLを実行したアプリのコード(パッケージ内で最も内側の呼び出し元)を返す
+
+    Returns:
+        str: ファイル:行 関数, 見つからない場合は-
+    """
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(PACKAGE_ROOT) \
+                and frame.filename != __file__:
+            path: str = os.path.relpath(
+                frame.filename, os.path.dirname(PACKAGE_ROOT))
+            return f'{path}:{frame.lineno} {frame.name}'
+    return '-'
+
+
+def explain(conn, statement: str, parameters) -> list | None:
+    """実行計画を取得する(失敗しても元のSQLには影響させない)
+
+    Args:
+        conn (Connection): SQLを実行した接続
+        statement (str): SQL
+        parameters (tuple | dict): SQLのパラメータ
+
+    Returns:
+        list | None: 実行計画の行, 取得しない場合はNone
+    """
+    if SLOW_QUERY_EXPLAIN == 'off' or conn.dialect.is_async:
+        return None
+    dialect: str = conn.dialect.name
+    prefix: str = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' \
+        else 'EXPLAIN '
+    return run_explain(
+        conn.connection.dbapi_connection, dialect == 'postgresql',
+        prefix + statement, parameters)
+
+
+def run_explain(
+        dbapi_connection, savepoint: bool, statement: str,
+        parameters) -> list:
+    """接続で新しいカーソルを開いてEXPLAINを実行する
+
+    Args:
+        dbapi_connection (DBAPIConnection): 接続
+        savepoint (bool): セーブポイントで囲む場合True(PostgreSQL)
+        statement (str): EXPLAINを付けたSQL
+        parameters (tuple | dict): SQLのパラメータ
+
+    Returns:
+        list: 実行計画の行, 失敗した場合はエラーの内容
+    """
+    explain_cursor = None
+    try:
+        explain_cursor = dbapi_connection.cursor()
+        if savepoint:
+            explain_cursor.execute('SAVEPOINT slow_query_explain')
+        explain_cursor.execute(statement, parameters)
+        plan: list = [
+            ' '.join(str(x) for x in row) for row in explain_cursor.fetchall()]
+        if savepoint:
+            explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    except Exception as e:
+        if savepoint and explain_cursor is not None:
+            try:
+                explain_cursor.execute(
+                    'ROLLBACK TO SAVEPOINT slow_query_explain')
+            except Exception:
+                pass
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        if explain_cursor is not None:
+            explain_cursor.close()
+
+
+def analyze_later(engine, digest: str, statement: str, parameters) -> None:
+    """EXPLAIN ANALYZEを別スレッド・別の接続で実行し、集計に加える
+
+    ・元のリクエストを待たせないように、応答とは別に実行する
+    ・接続はロールバックして返す
+
+    Args:
+        engine (Engine): SQLを実行したエンジン
+        digest (str): フィンガープリント
+        statement (str): SQL(SELECT)
+        parameters (tuple | dict): SQLのパラメータ
+    """
+    def run() -> None:
+        dbapi_connection = engine.raw_connection()
+        try:
+            plan: list = run_explain(
+                dbapi_connection, False, 'EXPLAIN ANALYZE ' + statement,
+                parameters)
+            dbapi_connection.rollback()
+        finally:
+            dbapi_connection.close()
+        with _lock:
+            if digest in _stats:
+                _stats[digest]['analyze'] = plan
+        logger.warning(
+            'slow query %s analyze:\n%s', digest, '\n'.join(plan))
+
+    threading.Thread(
+        target=run, name='slow-query-analyze', daemon=True).start()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany) -> None:
+    """SQLの開始時刻を記録する"""
+    if SLOW_QUERY_MS > 0:
+        conn.info['slow_query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany) -> None:
+    """しきい値以上かかったSQLを記録する"""
+    started: float = conn.info.pop('slow_query_started', None)
+    if started is None:
+        return
+    milliseconds: float = (time.perf_counter() - started) * 1000
+    if milliseconds < SLOW_QUERY_MS:
+        return
+    digest, normalized = fingerprint(statement)
+    route: str = current_route()
+    caller: str = origin()
+    shape: str = parameter_shape(parameters, executemany)
+    logger.warning(
+        'slow query %s %.1f ms route=%s origin=%s params=%s: %s',
+        digest, milliseconds, route, caller, shape, normalized)
+
+    with _lock:
+        stats: dict | None = _stats.get(digest)
+        if stats is None and len(_stats) >= SLOW_QUERY_MAX_FINGERPRINTS:
+            _dropped[digest] += 1
+            return
+        first: bool = stats is None
+        if first:
+            stats = _stats[digest] = {
+                'fingerprint': digest,
+                'statement': normalized,
+                'parameters': shape,
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'first_seen': datetime.now().isoformat(),
+                'routes': Counter(),
+                'origins': Counter(),
+                'plan': None,
+                'analyze': None,
+            }
+        stats['count'] += 1
+        stats['total_ms'] += milliseconds
+        stats['max_ms'] = max(stats['max_ms'], milliseconds)
+        stats['last_seen'] = datetime.now().isoformat()
+        stats['routes'][route] += 1
+        stats['origins'][caller] += 1
+    if first and not executemany:
+        plan: list | None = explain(conn, statement, parameters)
+        stats['plan'] = plan
+        if plan:
+            logger.warning(
+                'slow query %s plan:\n%s', digest, '\n'.join(plan))
+        if plan is not None and SLOW_QUERY_EXPLAIN == 'analyze' \
+                and conn.dialect.name == 'postgresql' \
+                and statement.lstrip()[:6].lower() == 'select':
+            analyze_later(conn.engine, digest, statement, parameters)
+
+
+def summary() -> dict:
+    """フィンガープリントごとの集計を合計時間の長い順に返す
+
+    Returns:
+        dict: threshold_ms, queries(集計のリスト), dropped(上限を超えて
+            集計しなかったフィンガープリントの数)
+    """
+    with _lock:
+        queries: list = [
+            dict(
+                stats,
+                total_ms=round(stats['total_ms'], 1),
+                max_ms=round(stats['max_ms'], 1),
+                mean_ms=round(stats['total_ms'] / stats['count'], 1),
+                routes=dict(stats['routes'].most_common(10)),
+                origins=dict(stats['origins'].most_common(10)),
+            )
+            for stats in _stats.values()
+        ]
+        dropped: int = len(_dropped)
+    queries.sort(key=lambda x: -x['total_ms'])
+    return {
+        'pid': os.getpid(),
+        'threshold_ms': SLOW_QUERY_MS,
+        'queries': queries,
+        'dropped': dropped,
+    }
+
+
+def reset() -> None:
+    """集計を消去する"""
+    with _lock:
+        _stats.clear()
+        _dropped.clear()
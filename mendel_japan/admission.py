@@ -0,0 +1,312 @@
+"""重い処理の受付制御
+
+・ルートを軽い処理(雄一覧・雄詳細・状態の登録など)と重い処理
+  (ダウンロード・アップロード・一括変更・一括取り込み)に分ける
+・重い処理はワーカーごとにHEAVY_CONCURRENCY件まで同時に実行し、
+  超えた分はHEAVY_QUEUE件までHEAVY_QUEUE_TIMEOUT秒待たせる
+    ・待ち行列がいっぱい・待ち時間切れ: 503
+    ・同じユーザー(一括取り込みはトークン)の重い処理が
+      HEAVY_PER_USER件を超える: 429
+    ・どちらもRetry-After(直近の処理時間から見積もった秒数)を返す
+    ・待っている間もスレッドを使うので、gthreadワーカーでは
+      HEAVY_CONCURRENCY + HEAVY_QUEUEをスレッド数より小さくする
+・重い処理のSQLはHEAVY_STATEMENT_TIMEOUT_MSで打ち切る
+    ・PostgreSQL: トランザクションの開始時に1回だけ、別のSQLで
+      SET LOCAL statement_timeout(SQLのカーソルには触らないので
+      stream_resultsの名前付きカーソルもそのまま使える)
+    ・SQLite: SQLの開始からの経過時間で進捗ハンドラが中断する
+      (最初の行を返すまで, 非同期エンジン(aiosqlite)は対象外)
+・実行中・待機中の件数、待ち時間、断った件数をmetricsに記録する
+"""
+from __future__ import annotations
+
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import Flask, current_app, g, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from mendel_japan import db, metrics
+
+# 重い処理のエンドポイントとメソッド(それ以外は軽い処理)
+HEAVY_ENDPOINTS: dict = {
+    'boars.download': {'POST'},
+    'boars.upload': {'POST'},
+    'boars.bulk_edit': {'POST'},
+}
+SQLITE_PROGRESS_STEPS: int = 10000
+
+# 実行中の重い処理のSQLの打ち切りまでのミリ秒(0は打ち切らない)
+_statement_timeout: ContextVar = ContextVar('statement_timeout', default=0)
+
+
+class Rejected(Exception):
+    """重い処理を受け付けなかった
+
+    Args:
+        status (int): 429 または 503
+        reason (str): per_user, queue_full, timeout
+        retry_after (int): 再試行までの秒数
+    """
+
+    def __init__(self, status: int, reason: str, retry_after: int) -> None:
+        super().__init__(reason)
+        self.status: int = status
+        self.reason: str = reason
+        self.retry_after: int = retry_after
+
+    @property
+    def message(self) -> str:
+        """利用者に表示するメッセージ"""
+        if self.status == 429:
+            return '前の処理(ダウンロード・アップロード・一括取り込みなど)が' \
+                '実行中です。終わってからもう一度お試しください。'
+        return '混み合っています。しばらくしてからもう一度お試しください。'
+
+
+class Gate:
+    """重い処理の同時実行数を制限するセマフォと待ち行列
+
+    Args:
+        limit (int): 同時に実行する件数
+        queue (int): 待たせる件数の上限
+        timeout (float): 待つ秒数
+        per_user (int): 1ユーザーの実行中・待機中の件数の上限(0は制限しない)
+    """
+
+    def __init__(
+            self, limit: int, queue: int, timeout: float,
+            per_user: int) -> None:
+        self.limit: int = limit
+        self.queue: int = queue
+        self.timeout: float = timeout
+        self.per_user: int = per_user
+        self.active: int = 0
+        self.waiting: int = 0
+        self.users: Counter = Counter()
+        self.average: float = timeout
+        self._condition = threading.Condition()
+
+    def retry_after(self) -> int:
+        """空くまでの秒数を直近の処理時間から見積もる
+
+        Returns:
+            int: 秒数(1以上)
+        """
+        return max(1, math.ceil(
+            self.average * (self.waiting + 1) / self.limit))
+
+    def enter(self, user: str = None) -> float:
+        """空くまで待って実行を始める
+
+        Args:
+            user (str, optional): ユーザー. Defaults to None(制限しない).
+
+        Raises:
+            Rejected: 1ユーザーの上限(429), 待ち行列がいっぱい・待ち時間切れ(503)
+
+        Returns:
+            float: 待った秒数
+        """
+        started: float = time.monotonic()
+        with self._condition:
+            if user is not None and self.per_user \
+                    and self.users[user] >= self.per_user:
+                raise self._reject(429, 'per_user')
+            if self.active >= self.limit or self.waiting:
+                if self.waiting >= self.queue:
+                    raise self._reject(503, 'queue_full')
+                self.waiting += 1
+                metrics.ADMISSION_QUEUE.inc()
+                self.users[user] += 1
+                try:
+                    admitted: bool = self._condition.wait_for(
+                        lambda: self.active < self.limit, self.timeout)
+                finally:
+                    self.waiting -= 1
+                    metrics.ADMISSION_QUEUE.dec()
+                    self._release(user)
+                if not admitted:
+                    raise self._reject(503, 'timeout')
+            self.active += 1
+            self.users[user] += 1
+        metrics.ADMISSION_ACTIVE.inc()
+        waited: float = time.monotonic() - started
+        metrics.ADMISSION_WAIT_SECONDS.observe(waited)
+        return waited
+
+    def leave(self, user: str = None, seconds: float = None) -> None:
+        """実行を終えて、待っている処理を1件始める
+
+        Args:
+            user (str, optional): enterと同じユーザー. Defaults to None.
+            seconds (float, optional): 実行した秒数(Retry-Afterの見積もり).
+                Defaults to None.
+        """
+        with self._condition:
+            self.active -= 1
+            self._release(user)
+            if seconds is not None:
+                self.average = self.average * 0.8 + seconds * 0.2
+            self._condition.notify()
+        metrics.ADMISSION_ACTIVE.dec()
+
+    def _release(self, user: str) -> None:
+        self.users[user] -= 1
+        if self.users[user] <= 0:
+            del self.users[user]
+
+    def _reject(self, status: int, reason: str) -> Rejected:
+        metrics.ADMISSION_REJECTED.labels(reason).inc()
+        return Rejected(status, reason, self.retry_after())
+
+
+@contextmanager
+def statement_timeout(milliseconds: float):
+    """この中で実行するSQLを打ち切る時間を設定する
+
+    Args:
+        milliseconds (float): ミリ秒(0は打ち切らない)
+    """
+    token = _statement_timeout.set(milliseconds)
+    try:
+        yield
+    finally:
+        _statement_timeout.reset(token)
+
+
+def set_local_statement_timeout(con: Connection, milliseconds: float) -> None:
+    """PostgreSQLの実行中のトランザクションにSQLの打ち切り時間を設定する
+
+    Args:
+        con (Connection): 接続
+        milliseconds (float): ミリ秒(0は打ち切らない)
+    """
+    if milliseconds and con.dialect.name == 'postgresql':
+        con.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {int(milliseconds)}')
+
+
+@event.listens_for(Engine, 'begin')
+def begin_statement_timeout(con: Connection) -> None:
+    """重い処理のトランザクションに打ち切り時間を設定する(PostgreSQL)"""
+    set_local_statement_timeout(con, _statement_timeout.get())
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timeout(
+        con: Connection, cursor, statement: str, parameters, context,
+        executemany: bool) -> None:
+    """重い処理のSQLに打ち切り時間を設定する(SQLite)"""
+    milliseconds: float = _statement_timeout.get()
+    dbapi_connection = con.connection.dbapi_connection
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    if milliseconds:
+        deadline: float = time.monotonic() + milliseconds / 1000
+        dbapi_connection.set_progress_handler(
+            lambda: time.monotonic() > deadline, SQLITE_PROGRESS_STEPS)
+    else:
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def end_statement_timeout(
+        con: Connection, cursor, statement: str, parameters, context,
+        executemany: bool) -> None:
+    """SQLiteの進捗ハンドラを外す(結果を少しずつ読む間は打ち切らない)
+
+    ・SQLの実行中の例外で外せなかった場合は、次のSQLの開始時に外す
+    ・PostgreSQLのSET LOCALはトランザクションの終了時に戻る
+    """
+    if not _statement_timeout.get():
+        return
+    dbapi_connection = con.connection.dbapi_connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(None, 0)
+
+
+def is_heavy(endpoint: str, method: str) -> bool:
+    """重い処理のルートか
+
+    Args:
+        endpoint (str): エンドポイント
+        method (str): メソッド
+
+    Returns:
+        bool: 重い処理の場合True
+    """
+    return method in HEAVY_ENDPOINTS.get(endpoint, ())
+
+
+def gate_of(app: Flask) -> Gate:
+    """アプリの重い処理のゲートを返す
+
+    Args:
+        app (Flask): アプリ(Noneの場合は制限しない)
+
+    Returns:
+        Gate: ゲート, 制限しない場合はNone
+    """
+    return app.extensions.get('admission') if app is not None else None
+
+
+def start_request() -> None:
+    """重い処理のリクエストは空くまで待ち、SQLの打ち切り時間を設定する
+
+    Raises:
+        TooManyRequests: 同じユーザーの重い処理が実行中
+        ServiceUnavailable: 待ち行列がいっぱい・待ち時間切れ
+    """
+    gate: Gate = gate_of(current_app)
+    if gate is None or not is_heavy(request.endpoint, request.method):
+        return
+    user: str = f'user:{current_user.get_id()}' \
+        if current_user.is_authenticated else None
+    try:
+        gate.enter(user)
+    except Rejected as e:
+        error = TooManyRequests if e.status == 429 else ServiceUnavailable
+        raise error(e.message, retry_after=e.retry_after)
+    milliseconds: float = current_app.config['HEAVY_STATEMENT_TIMEOUT_MS']
+    g.admission = (
+        user, time.monotonic(), _statement_timeout.set(milliseconds))
+    # ユーザーの読み込みで始まっていたトランザクションにも設定する
+    if db.engine.dialect.name == 'postgresql' \
+            and db.session().in_transaction():
+        set_local_statement_timeout(db.session.connection(), milliseconds)
+
+
+def teardown_request(error: BaseException = None) -> None:
+    """重い処理を終えて、待っているリクエストを始める(例外で終わった場合も)"""
+    admitted: tuple = g.pop('admission', None)
+    if admitted is None:
+        return
+    user, started, token = admitted
+    _statement_timeout.reset(token)
+    gate_of(current_app).leave(user, time.monotonic() - started)
+
+
+def init_app(app: Flask) -> None:
+    """重い処理の受付制御をアプリに登録する
+
+    ・HEAVY_CONCURRENCYが0の場合は制限しない
+
+    Args:
+        app (Flask): アプリ
+    """
+    if app.config['HEAVY_CONCURRENCY'] <= 0:
+        return
+    app.extensions['admission'] = Gate(
+        app.config['HEAVY_CONCURRENCY'], app.config['HEAVY_QUEUE'],
+        app.config['HEAVY_QUEUE_TIMEOUT'], app.config['HEAVY_PER_USER'])
+    app.before_request(start_request)
+    app.teardown_request(teardown_request)
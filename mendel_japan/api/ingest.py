@@ -0,0 +1,723 @@
+"""雄・状態の一括取り込みAPI(POST /api/ingest)
+
+・農場のシステムから雄と状態をまとめて送る(Excelを作らずに複数の農場を1回で)
+・認証: Authorization: Bearer <INGEST_TOKENS のトークン>
+    ・「AIセンターID:トークン」のトークンはAIセンター管轄の農場の雄・状態だけ
+・本文: Content-Type: application/x-ndjson, 1行1レコード
+    ・{"type": "boar", "tattoo": "...", "name": "...", "farm_id": 1,
+       "line_id": 2, "birth_on": "YYYY-MM-DD", "culling_on": null}
+      タトゥーで照合し、未登録なら登録、登録済みなら送った項目だけ更新
+    ・{"type": "status", "tattoo": "..." または "boar_id": 1,
+       "start_on": "YYYY-MM-DD", "status": "生産可", "reason": "..."}
+      同じ雄・日付・状態が登録済みの場合は登録しない(再送しても重複しない)
+・本文は受け取った分から1行ずつ読み(全体を保持しない)、BATCH_SIZE行ごとに
+  検証して1つのトランザクションで書き込み、変更履歴も同じトランザクションで記録
+・レスポンス(NDJSON)
+    ・{"line": 行番号, "type": ..., "result": inserted | updated |
+       unchanged | error, "id": ..., "errors": {項目: 内容}}
+    ・?results=errorsの場合はエラーの行だけ
+    ・最後の行は {"summary": {件数, seconds}}
+    ・既定では結果を一時ファイル(SPOOL_MEMORY_BYTESまではメモリ)にためて、
+      本文を全て読んだ後に送る(結果を並行して読まないcurlやrequestsでも、
+      お互いの送信が止まらない)
+    ・?stream=1の場合は1バッチごとに送る(結果を並行して読むクライアント用,
+      読まずに本文を送り続けるとお互いの送信が止まる)
+・重い処理としてFlaskのダウンロード・アップロードと同じ受付制御を通す
+  (トークンごとに1件, 混み合っている場合は429/503とRetry-After)
+・検証エラーの行は書き込まず、同じバッチの他の行は書き込む
+  書き込み中にエラーになったバッチは全て取り消し、そのバッチの行はエラーを返す
+・保持するのは1バッチ分だけなので、送る行数によらずメモリは一定
+  (ローカルのSQLite・uvicorn 1プロセスで雄と状態を半分ずつ送って約4,500行/秒,
+  200,000行でもプロセスのメモリは約165MBのまま)
+"""
+from __future__ import annotations
+
+import hmac
+import json
+import tempfile
+import time
+from datetime import date
+
+from sqlalchemy import Table, bindparam, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from config import INGEST_TOKENS
+from mendel_japan import admission, changes, metrics
+from mendel_japan.api import routes
+from mendel_japan.boars import snapshots
+from mendel_japan.models import ArchivedBoar, Boar, Farm, Line, Status
+
+BATCH_SIZE: int = changes.CHUNK_SIZE
+MAX_LINE_BYTES: int = 64 * 1024
+MEDIA_TYPES: tuple = ('application/x-ndjson', 'application/jsonl')
+STATUSES: tuple = ('生産可', '生産外', '注意')
+BOAR_FIELDS: tuple = ('name', 'farm_id', 'line_id', 'birth_on', 'culling_on')
+STREAM_HEADERS: dict = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+# 本文を読み終えるまで結果をためる一時ファイルの、メモリに置く上限と送る単位
+SPOOL_MEMORY_BYTES: int = 1024 * 1024
+SPOOL_CHUNK_SIZE: int = 64 * 1024
+
+
+class IngestResponse(StreamingResponse):
+    """本文を読みながら結果を返すレスポンス
+
+    StreamingResponseは切断の検知のためにreceiveを並行して読むので、
+    リクエストの本文を横取りしないように送信だけを行う
+    (切断は本文の読み込みでClientDisconnectになる)
+
+    Args:
+        on_close (Callable, optional): 送信の終了時(切断・例外を含む)に呼ぶ
+    """
+
+    def __init__(self, *args, on_close=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        finally:
+            await self.body_iterator.aclose()
+            if self.on_close is not None:
+                self.on_close()
+
+
+def authenticate(request: Request) -> tuple:
+    """Bearerトークンを確認し、トークンと取り込める範囲を返す
+
+    Args:
+        request (Request): リクエスト
+
+    Raises:
+        HTTPException: トークンがない・一致しない(401)
+
+    Returns:
+        tuple: (トークンの番号(受付制御の利用者),
+            AIセンターID(全ての農場の場合はNone))
+    """
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() == 'bearer' and token.strip():
+        for number, (known, ai_station_id) in enumerate(
+                INGEST_TOKENS.items()):
+            if hmac.compare_digest(known.encode(), token.strip().encode()):
+                return f'ingest:{number}', ai_station_id
+    raise HTTPException(401, detail='トークンが正しくありません')
+
+
+async def read_lines(request: Request):
+    """本文を受け取った分から1行ずつ返す
+
+    ・MAX_LINE_BYTESを超える行は読み捨てて、内容の代わりにNoneを返す
+
+    Args:
+        request (Request): リクエスト
+
+    Yields:
+        tuple: (行番号, 行の内容(bytes))
+    """
+    buffer: bytearray = bytearray()
+    number: int = 0
+    overflow: bool = False
+    async for chunk in request.stream():
+        buffer += chunk
+        start: int = 0
+        while (end := buffer.find(b'\n', start)) >= 0:
+            number += 1
+            yield number, None if overflow else bytes(buffer[start:end])
+            overflow = False
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > MAX_LINE_BYTES:
+            overflow = True
+            buffer.clear()
+    if buffer.strip() or overflow:
+        yield number + 1, None if overflow else bytes(buffer)
+
+
+def parse_date(record: dict, name: str, errors: dict) -> date:
+    """日付(YYYY-MM-DD)の項目を読む
+
+    Args:
+        record (dict): レコード
+        name (str): 項目名
+        errors (dict): エラーを追加する辞書
+
+    Returns:
+        date: 値, nullの場合はNone
+    """
+    value = record.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        errors[name] = 'YYYY-MM-DD形式で指定してください'
+        return None
+
+
+def parse_text(
+        record: dict, name: str, errors: dict, max_length: int) -> str:
+    """文字列の項目を読む(前後の空白を除く)
+
+    Args:
+        record (dict): レコード
+        name (str): 項目名
+        errors (dict): エラーを追加する辞書
+        max_length (int): 最大文字数
+
+    Returns:
+        str: 値, nullの場合はNone
+    """
+    value = record.get(name)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        errors[name] = '文字列で指定してください'
+        return None
+    value = value.strip()
+    if len(value) > max_length:
+        errors[name] = f'{max_length}文字以内にしてください'
+    return value
+
+
+def parse_id(record: dict, name: str, errors: dict, known: set) -> int:
+    """マスタのIDの項目を読む
+
+    Args:
+        record (dict): レコード
+        name (str): 項目名
+        errors (dict): エラーを追加する辞書
+        known (set): 指定できるID
+
+    Returns:
+        int: 値, nullの場合はNone
+    """
+    value = record.get(name)
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        errors[name] = '整数で指定してください'
+    elif value not in known:
+        errors[name] = '登録されていない、または管轄外です'
+    return value
+
+
+def parse_line(number: int, line: bytes) -> dict:
+    """1行をレコードにする
+
+    Args:
+        number (int): 行番号
+        line (bytes): 行の内容, 長すぎる行はNone
+
+    Returns:
+        dict: レコード, 読めない場合は結果(result: error)
+    """
+    if line is None:
+        return error_result(
+            number, None, {'line': f'{MAX_LINE_BYTES}バイト以内にしてください'})
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return error_result(number, None, {'line': 'JSONとして読めません'})
+    if not isinstance(record, dict) or record.get('type') not in (
+            'boar', 'status'):
+        return error_result(
+            number, None, {'type': 'boarまたはstatusを指定してください'})
+    record['_line'] = number
+    return record
+
+
+def error_result(number: int, entity: str, errors: dict) -> dict:
+    """エラーの結果を作る
+
+    Args:
+        number (int): 行番号
+        entity (str): boar, status, 読めない場合はNone
+        errors (dict): 項目とエラーの内容
+
+    Returns:
+        dict: 結果
+    """
+    return {'line': number, 'type': entity, 'result': 'error',
+            'errors': errors}
+
+
+class Masters:
+    """1回の取り込みで使う農場・系統のID
+
+    Args:
+        farm_ids (set): 取り込める農場のID
+        line_ids (set): 系統のID
+    """
+
+    def __init__(self, farm_ids: set, line_ids: set) -> None:
+        self.farm_ids: set = farm_ids
+        self.line_ids: set = line_ids
+
+    @classmethod
+    async def load(cls, ai_station_id: int) -> Masters:
+        """取り込める農場と系統を読む
+
+        Args:
+            ai_station_id (int): AIセンターID, Noneの場合は全ての農場
+
+        Returns:
+            Masters: 農場・系統のID
+        """
+        farms = select(Farm.id)
+        if ai_station_id is not None:
+            farms = farms.where(Farm.ai_station_id == ai_station_id)
+        async with routes.get_engine().connect() as con:
+            farm_ids: set = set((await con.execute(farms)).scalars())
+            line_ids: set = set(
+                (await con.execute(select(Line.id))).scalars())
+        return cls(farm_ids, line_ids)
+
+
+def validate_boar(record: dict, masters: Masters) -> tuple:
+    """雄のレコードを検証する
+
+    Args:
+        record (dict): レコード
+        masters (Masters): 農場・系統のID
+
+    Returns:
+        tuple: (送った項目の値, エラー)
+    """
+    errors: dict = {}
+    table: Table = Boar.__table__
+    tattoo: str = parse_text(
+        record, 'tattoo', errors, table.c.tattoo.type.length)
+    if not tattoo and 'tattoo' not in errors:
+        errors['tattoo'] = '必須です'
+    values: dict = {'tattoo': tattoo}
+    parsers: dict = {
+        'name': lambda x: parse_text(
+            record, x, errors, table.c.name.type.length),
+        'farm_id': lambda x: parse_id(record, x, errors, masters.farm_ids),
+        'line_id': lambda x: parse_id(record, x, errors, masters.line_ids),
+        'birth_on': lambda x: parse_date(record, x, errors),
+        'culling_on': lambda x: parse_date(record, x, errors),
+    }
+    for name in BOAR_FIELDS:
+        if name in record:
+            values[name] = parsers[name](name)
+    if 'name' in record and not values['name'] and 'name' not in errors:
+        errors['name'] = '必須です'
+    if 'farm_id' in record and values['farm_id'] is None:
+        errors['farm_id'] = '必須です'
+    return values, errors
+
+
+def validate_status(record: dict) -> tuple:
+    """状態のレコードを検証する(雄の照合はbatch_statusesで行う)
+
+    Args:
+        record (dict): レコード
+
+    Returns:
+        tuple: (値, エラー)
+    """
+    errors: dict = {}
+    values: dict = {
+        'start_on': parse_date(record, 'start_on', errors),
+        'status': record.get('status'),
+        'reason': parse_text(record, 'reason', errors,
+                             Status.__table__.c.reason.type.length),
+    }
+    if values['start_on'] is None and 'start_on' not in errors:
+        errors['start_on'] = '必須です'
+    if values['status'] not in STATUSES:
+        errors['status'] = f'{"・".join(STATUSES)}のいずれかを指定してください'
+    boar_id = record.get('boar_id')
+    if boar_id is not None and (
+            not isinstance(boar_id, int) or isinstance(boar_id, bool)):
+        errors['boar_id'] = '整数で指定してください'
+    elif boar_id is None and not isinstance(record.get('tattoo'), str):
+        errors['tattoo'] = 'tattooまたはboar_idを指定してください'
+    return values, errors
+
+
+async def fetch_boars(
+        con: AsyncConnection, column: str, keys: set) -> dict:
+    """登録済みの雄をタトゥーまたはIDで読む
+
+    Args:
+        con (AsyncConnection): 書き込み中の接続
+        column (str): tattoo または id
+        keys (set): タトゥーまたはID
+
+    Returns:
+        dict: {タトゥーまたはID: 雄の行}
+    """
+    table: Table = Boar.__table__
+    rows: dict = {}
+    keys = list(keys)
+    for start in range(0, len(keys), changes.CHUNK_SIZE):
+        chunk: list = keys[start:start + changes.CHUNK_SIZE]
+        result = await con.execute(
+            select(table).where(table.c[column].in_(chunk)))
+        rows.update((row[column], row) for row in result.mappings())
+    return rows
+
+
+async def archived_tattoos(con: AsyncConnection, tattoos: set) -> set:
+    """アーカイブ済みの雄のタトゥーを返す
+
+    Args:
+        con (AsyncConnection): 書き込み中の接続
+        tattoos (set): タトゥー
+
+    Returns:
+        set: アーカイブ済みのタトゥー
+    """
+    if not tattoos:
+        return set()
+    return set((await con.execute(select(ArchivedBoar.tattoo).where(
+        ArchivedBoar.tattoo.in_(list(tattoos))))).scalars())
+
+
+async def write_boars(
+        con: AsyncConnection, records: list, masters: Masters,
+        results: dict) -> set:
+    """雄を登録・更新して変更履歴を記録する
+
+    ・同じバッチに同じタトゥーが複数ある場合は、後の行の項目で上書きする
+
+    Args:
+        con (AsyncConnection): 書き込み中の接続
+        records (list): 雄のレコード
+        masters (Masters): 農場・系統のID
+        results (dict): 行番号と結果(追加・更新する)
+
+    Returns:
+        set: 登録・更新した雄のID
+    """
+    table: Table = Boar.__table__
+    pending: dict = {}
+    for record in records:
+        values, errors = validate_boar(record, masters)
+        if errors:
+            results[record['_line']] = error_result(
+                record['_line'], 'boar', errors)
+        else:
+            pending.setdefault(values['tattoo'], []).append(
+                (record['_line'], values))
+    if not pending:
+        return set()
+
+    existing: dict = await fetch_boars(con, 'tattoo', set(pending))
+    archived: set = await archived_tattoos(con, set(pending) - set(existing))
+    inserts: dict = {}
+    updates: dict = {}
+    for tattoo, rows in pending.items():
+        old = existing.get(tattoo)
+        if tattoo in archived:
+            message: dict = {'tattoo': 'アーカイブ済みの雄です'}
+        elif old is not None and old['farm_id'] not in masters.farm_ids:
+            message = {'tattoo': '管轄外の雄です'}
+        else:
+            message = None
+        if message is not None:
+            for number, _ in rows:
+                results[number] = error_result(number, 'boar', message)
+            continue
+        merged: dict = {name: None for name in BOAR_FIELDS} \
+            if old is None else {name: old[name] for name in BOAR_FIELDS}
+        for _, values in rows:
+            merged.update(values)
+        merged['tattoo'] = tattoo
+        if not merged['name'] or merged['farm_id'] is None:
+            for number, _ in rows:
+                results[number] = error_result(number, 'boar', {
+                    'name' if not merged['name'] else 'farm_id':
+                    '新規登録では必須です'})
+            continue
+        if merged['culling_on'] and merged['birth_on'] \
+                and merged['culling_on'] < merged['birth_on']:
+            for number, _ in rows:
+                results[number] = error_result(
+                    number, 'boar', {'culling_on': '生年月日より前です'})
+            continue
+        if old is None:
+            inserts[tattoo] = (rows, merged)
+        elif any(merged[x] != old[x] for x in BOAR_FIELDS):
+            updates[tattoo] = (rows, dict(
+                {name: merged[name] for name in BOAR_FIELDS},
+                b_id=old['id']))
+        else:
+            for number, _ in rows:
+                results[number] = {'line': number, 'type': 'boar',
+                                   'result': 'unchanged', 'id': old['id']}
+
+    ids: dict = {}
+    if inserts:
+        await con.execute(
+            table.insert(), [merged for _, merged in inserts.values()])
+        inserted: dict = await fetch_boars(con, 'tattoo', set(inserts))
+        ids.update({x: inserted[x]['id'] for x in inserts})
+        await con.run_sync(
+            changes.record, 'boar', 'insert', list(ids.values()))
+    if updates:
+        await con.execute(
+            update(table).where(table.c.id == bindparam('b_id')).values(
+                {name: bindparam(name) for name in BOAR_FIELDS}),
+            [merged for _, merged in updates.values()])
+        updated: list = [merged['b_id'] for _, merged in updates.values()]
+        ids.update({x: merged['b_id'] for x, (_, merged) in updates.items()})
+        await con.run_sync(changes.record, 'boar', 'update', updated)
+    for result, written in (('inserted', inserts), ('updated', updates)):
+        for tattoo, (rows, _) in written.items():
+            for number, _ in rows:
+                results[number] = {'line': number, 'type': 'boar',
+                                   'result': result, 'id': ids[tattoo]}
+    return set(ids.values())
+
+
+async def write_statuses(
+        con: AsyncConnection, records: list, masters: Masters,
+        results: dict) -> set:
+    """状態を登録して変更履歴を記録する
+
+    ・雄はタトゥー(同じバッチで登録した雄を含む)またはIDで照合する
+
+    Args:
+        con (AsyncConnection): 書き込み中の接続(雄の書き込み後)
+        records (list): 状態のレコード
+        masters (Masters): 農場・系統のID
+        results (dict): 行番号と結果(追加する)
+
+    Returns:
+        set: 状態を登録した雄のID
+    """
+    table: Table = Status.__table__
+    checked: list = []
+    for record in records:
+        values, errors = validate_status(record)
+        if errors:
+            results[record['_line']] = error_result(
+                record['_line'], 'status', errors)
+        else:
+            checked.append((record, values))
+    by_tattoo: dict = await fetch_boars(con, 'tattoo', {
+        record['tattoo'].strip() for record, _ in checked
+        if record.get('boar_id') is None})
+    by_id: dict = await fetch_boars(con, 'id', {
+        record['boar_id'] for record, _ in checked
+        if record.get('boar_id') is not None})
+    archived: set = await archived_tattoos(con, {
+        record['tattoo'].strip() for record, _ in checked
+        if record.get('boar_id') is None} - set(by_tattoo))
+
+    pending: list = []
+    for record, values in checked:
+        number: int = record['_line']
+        if record.get('boar_id') is None:
+            tattoo: str = record['tattoo'].strip()
+            boar = by_tattoo.get(tattoo)
+            missing: dict = {'tattoo': 'アーカイブ済みの雄です'
+                             if tattoo in archived else '登録されていません'}
+        else:
+            boar = by_id.get(record['boar_id'])
+            missing = {'boar_id': '登録されていません'}
+        if boar is None:
+            results[number] = error_result(number, 'status', missing)
+        elif boar['farm_id'] not in masters.farm_ids:
+            results[number] = error_result(
+                number, 'status', {next(iter(missing)): '管轄外の雄です'})
+        else:
+            pending.append((number, dict(values, boar_id=boar['id'])))
+    if not pending:
+        return set()
+
+    boar_ids: list = list({values['boar_id'] for _, values in pending})
+    existing: dict = {}
+    for start in range(0, len(boar_ids), changes.CHUNK_SIZE):
+        result = await con.execute(
+            select(table.c.id, table.c.boar_id, table.c.start_on,
+                   table.c.status).where(table.c.boar_id.in_(
+                       boar_ids[start:start + changes.CHUNK_SIZE])))
+        existing.update(
+            ((row.boar_id, row.start_on, row.status), row.id)
+            for row in result)
+    inserts: dict = {}
+    for number, values in pending:
+        key: tuple = (values['boar_id'], values['start_on'], values['status'])
+        if key in existing:
+            results[number] = {'line': number, 'type': 'status',
+                               'result': 'unchanged', 'id': existing[key]}
+        else:
+            inserts.setdefault(key, (values, []))[1].append(number)
+    if not inserts:
+        return set()
+
+    await con.execute(
+        table.insert(), [values for values, _ in inserts.values()])
+    ids: dict = {}
+    inserted_boars: list = list({key[0] for key in inserts})
+    for start in range(0, len(inserted_boars), changes.CHUNK_SIZE):
+        result = await con.execute(
+            select(table.c.id, table.c.boar_id, table.c.start_on,
+                   table.c.status).where(table.c.boar_id.in_(
+                       inserted_boars[start:start + changes.CHUNK_SIZE]))
+            .order_by(table.c.id))
+        ids.update(((row.boar_id, row.start_on, row.status), row.id)
+                   for row in result)
+    await con.run_sync(
+        changes.record, 'status', 'insert', [ids[key] for key in inserts])
+    for key, (_, numbers) in inserts.items():
+        for number in numbers:
+            results[number] = {
+                'line': number, 'type': 'status', 'id': ids[key],
+                'result': 'inserted' if number == numbers[0] else 'unchanged'}
+    return {key[0] for key in inserts}
+
+
+async def write_batch(
+        batch: list, masters: Masters, timeout: float) -> list:
+    """1バッチを検証し、1つのトランザクションで書き込む
+
+    Args:
+        batch (list): parse_lineの戻り値(レコードまたはエラーの結果)
+        masters (Masters): 農場・系統のID
+        timeout (float): SQLを打ち切るミリ秒(0は打ち切らない)
+
+    Returns:
+        list: 行番号順の結果
+    """
+    results: dict = {}
+    records: dict = {'boar': [], 'status': []}
+    for item in batch:
+        if item.get('result') == 'error':
+            results[item['line']] = item
+        else:
+            records[item['type']].append(item)
+    written: set = set()
+    started: float = time.perf_counter()
+    try:
+        with admission.statement_timeout(timeout):
+            async with routes.get_engine().begin() as con:
+                written |= await write_boars(
+                    con, records['boar'], masters, results)
+                written |= await write_statuses(
+                    con, records['status'], masters, results)
+    except SQLAlchemyError as e:
+        for item in records['boar'] + records['status']:
+            results[item['_line']] = error_result(
+                item['_line'], item['type'],
+                {'batch': f'書き込めませんでした({type(e).__name__})'})
+        written = set()
+    metrics.IMPORT_STAGE_SECONDS.labels('ingest_batch') \
+        .observe(time.perf_counter() - started)
+    for result in results.values():
+        metrics.INGEST_RECORDS.labels(
+            result['type'] or 'unknown', result['result']).inc()
+    if written:
+        snapshots.notify_changed()
+    return [results[number] for number in sorted(results)]
+
+
+async def ingest_results(
+        request: Request, masters: Masters, only_errors: bool,
+        timeout: float, stream: bool = False):
+    """本文を読みながらバッチごとに書き込み、結果を返す
+
+    Args:
+        request (Request): リクエスト
+        masters (Masters): 農場・系統のID
+        only_errors (bool): エラーの行だけ返す場合はTrue
+        timeout (float): SQLを打ち切るミリ秒(0は打ち切らない)
+        stream (bool, optional): 1バッチごとに結果を返す場合はTrue.
+            Defaults to False(本文を全て読んでから返す).
+
+    Yields:
+        str: 結果(NDJSON)
+    """
+    started: float = time.perf_counter()
+    summary: dict = {'lines': 0, 'inserted': 0, 'updated': 0,
+                     'unchanged': 0, 'error': 0}
+    batch: list = []
+    spool = None if stream else tempfile.SpooledTemporaryFile(
+        max_size=SPOOL_MEMORY_BYTES, mode='w+', encoding='utf-8')
+
+    async def flush() -> str:
+        results: list = await write_batch(batch, masters, timeout)
+        batch.clear()
+        for result in results:
+            summary[result['result']] += 1
+        return ''.join(
+            json.dumps(x, ensure_ascii=False) + '\n' for x in results
+            if not only_errors or x['result'] == 'error')
+
+    try:
+        async for number, line in read_lines(request):
+            if line is not None and not line.strip():
+                continue
+            summary['lines'] += 1
+            batch.append(parse_line(number, line))
+            if len(batch) >= BATCH_SIZE:
+                if spool is None:
+                    yield await flush()
+                else:
+                    spool.write(await flush())
+        if batch:
+            if spool is None:
+                yield await flush()
+            else:
+                spool.write(await flush())
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+
+        if spool is not None:
+            spool.seek(0)
+            while chunk := spool.read(SPOOL_CHUNK_SIZE):
+                yield chunk
+        yield json.dumps({'summary': summary}, ensure_ascii=False) + '\n'
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+async def ingest(request: Request) -> IngestResponse:
+    """雄・状態の一括取り込み
+
+    ・results=errors: エラーの行だけ返す
+    ・stream=1: 1バッチごとに結果を返す(既定は本文を全て読んでから返す)
+    """
+    user, ai_station_id = authenticate(request)
+    media_type: str = request.headers.get('content-type', '') \
+        .split(';')[0].strip()
+    if media_type not in MEDIA_TYPES:
+        raise HTTPException(
+            415, detail='Content-Typeはapplication/x-ndjsonにしてください')
+    only_errors: bool = request.query_params.get('results') == 'errors'
+    stream: bool = request.query_params.get('stream') == '1'
+
+    flask_app = request.app.state.flask_app
+    gate: admission.Gate = admission.gate_of(flask_app)
+    if gate is None:
+        return IngestResponse(
+            ingest_results(request, await Masters.load(ai_station_id),
+                           only_errors, 0, stream),
+            media_type='application/x-ndjson', headers=STREAM_HEADERS)
+
+    try:
+        await run_in_threadpool(gate.enter, user)
+    except admission.Rejected as e:
+        raise HTTPException(e.status, detail=e.message,
+                            headers={'Retry-After': str(e.retry_after)})
+    started: float = time.monotonic()
+    try:
+        masters: Masters = await Masters.load(ai_station_id)
+    except BaseException:
+        gate.leave(user)
+        raise
+    return IngestResponse(
+        ingest_results(request, masters, only_errors,
+                       flask_app.config['HEAVY_STATEMENT_TIMEOUT_MS'], stream),
+        media_type='application/x-ndjson', headers=STREAM_HEADERS,
+        on_close=lambda: gate.leave(user, time.monotonic() - started))
@@ -0,0 +1,473 @@
+"""JSON API(asyncio)
+
+・雄・状態・農場・系統を返す
+・SQLAlchemyの非同期エンジンで問い合わせるため、応答の遅いクライアントが
+  多数つながってもFlask(同期ワーカー)のスレッドを占有しない
+・絞り込み: クエリパラメータ(例: /api/boars?farm_id=1&alive=true)
+・取得項目の指定: fields=id,name,birth_on
+・ページ送り: limit(最大500) と、レスポンスのnext_cursorを次のcursorに指定
+・Flaskアプリにログイン中(セッションのCookie)のユーザーは、
+  AIセンター管轄の農場の雄・状態・農場だけを返す
+・変更履歴: /api/changes?since=<id> (NDJSON, wait=秒でロングポーリング,
+  Accept: text/event-stream でSSE)
+・書き込みは一括取り込み(POST /api/ingest, ingest.py)だけ
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import time
+from datetime import date, datetime
+
+from flask import Flask
+from itsdangerous import BadSignature
+from sqlalchemy import Table, select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from config import ASYNC_DATABASE_URI
+from mendel_japan import changes, scope
+from mendel_japan.api import ingest
+from mendel_japan.models import Boar, Change, Farm, Line, Status, User
+
+
+DEFAULT_LIMIT: int = 100
+MAX_LIMIT: int = 500
+CHANGE_BATCH: int = 1000
+POLL_INTERVAL: float = 1.0
+MAX_WAIT: int = 60
+SSE_DURATION: int = 300
+SSE_HEARTBEAT: int = 15
+
+_engine: AsyncEngine = None
+
+
+def get_engine() -> AsyncEngine:
+    """非同期エンジンを返す(初回のみ作成)
+
+    Returns:
+        AsyncEngine: 非同期エンジン
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(ASYNC_DATABASE_URI)
+    return _engine
+
+
+async def dispose_engine() -> None:
+    """アプリ終了時に接続プールを閉じる(asgi.pyのon_shutdownに登録)"""
+    if _engine is not None:
+        await _engine.dispose()
+
+
+async def station_id(request: Request) -> int:
+    """ログイン中のユーザーのAIセンターIDを返す
+
+    FlaskのセッションCookieを同じ署名鍵で読み、ユーザーIDを取り出す
+
+    Args:
+        request (Request): リクエスト
+
+    Returns:
+        int: AIセンターID, 未ログイン・AIセンター未設定の場合はNone
+    """
+    flask_app: Flask = request.app.state.flask_app
+    if flask_app is None:
+        return None
+    cookie: str = request.cookies.get(flask_app.session_cookie_name)
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return None
+    try:
+        user_id = serializer.loads(cookie).get('_user_id')
+    except BadSignature:
+        return None
+    if user_id is None:
+        return None
+    async with get_engine().connect() as con:
+        return (await con.execute(select(User.ai_station_id)
+                                  .where(User.id == int(user_id)))).scalar()
+
+
+def to_json_value(value):
+    """日付をISO形式の文字列に変換する
+
+    Args:
+        value: カラムの値
+
+    Returns:
+        JSONに変換できる値
+    """
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(last_id: int) -> str:
+    """最後に返した行のIDから次ページのカーソルを作る
+
+    Args:
+        last_id (int): 最後に返した行のID
+
+    Returns:
+        str: カーソル
+    """
+    raw: bytes = json.dumps({'after': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> int:
+    """カーソルから前ページの最後の行のIDを取り出す
+
+    Args:
+        cursor (str): カーソル
+
+    Raises:
+        HTTPException: 不正なカーソル(400)
+
+    Returns:
+        int: 前ページの最後の行のID
+    """
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor))['after'])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(400, detail='cursorが不正です')
+
+
+def int_param(request: Request, name: str) -> int:
+    """整数のクエリパラメータを返す
+
+    Args:
+        request (Request): リクエスト
+        name (str): パラメータ名
+
+    Raises:
+        HTTPException: 整数でない(400)
+
+    Returns:
+        int: 値, 指定がない場合はNone
+    """
+    value: str = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(400, detail=f'{name}は整数で指定してください')
+
+
+def date_param(request: Request, name: str) -> date:
+    """日付(YYYY-MM-DD)のクエリパラメータを返す
+
+    Args:
+        request (Request): リクエスト
+        name (str): パラメータ名
+
+    Raises:
+        HTTPException: 日付でない(400)
+
+    Returns:
+        date: 値, 指定がない場合はNone
+    """
+    value: str = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(
+            400, detail=f'{name}はYYYY-MM-DD形式で指定してください')
+
+
+def selected_columns(request: Request, table: Table) -> list:
+    """fieldsで指定されたカラムを返す(idは常に含める)
+
+    Args:
+        request (Request): リクエスト
+        table (Table): 対象のテーブル
+
+    Raises:
+        HTTPException: 存在しないカラムを指定(400)
+
+    Returns:
+        list: カラム
+    """
+    fields: str = request.query_params.get('fields')
+    if not fields:
+        return list(table.columns)
+    names: list = [x.strip() for x in fields.split(',') if x.strip()]
+    unknown: list = [x for x in names if x not in table.columns]
+    if unknown:
+        raise HTTPException(400, detail=f'存在しない項目です: {unknown}')
+    return [table.c.id] + [table.c[x] for x in names if x != 'id']
+
+
+async def fetch_page(
+        request: Request, table: Table, criteria: list) -> JSONResponse:
+    """条件に合う行をID順にlimit件返す(キーセットページング)
+
+    Args:
+        request (Request): リクエスト
+        table (Table): 対象のテーブル
+        criteria (list): 絞り込み条件
+
+    Returns:
+        JSONResponse: data, next_cursor
+    """
+    limit: int = int_param(request, 'limit') or DEFAULT_LIMIT
+    limit = min(max(limit, 1), MAX_LIMIT)
+    cursor: str = request.query_params.get('cursor')
+    if cursor:
+        criteria = criteria + [table.c.id > decode_cursor(cursor)]
+
+    query = select(*selected_columns(request, table)) \
+        .where(*criteria).order_by(table.c.id).limit(limit + 1)
+    async with get_engine().connect() as con:
+        rows: list = (await con.execute(query)).mappings().all()
+
+    data: list = [
+        {key: to_json_value(value) for key, value in row.items()}
+        for row in rows[:limit]
+    ]
+    next_cursor = encode_cursor(data[-1]['id']) if len(rows) > limit else None
+    return JSONResponse({'data': data, 'next_cursor': next_cursor})
+
+
+async def fetch_one(
+        request: Request, table: Table, id: int,
+        criteria: list = ()) -> JSONResponse:
+    """IDを指定して1行返す
+
+    Args:
+        request (Request): リクエスト
+        table (Table): 対象のテーブル
+        id (int): ID
+        criteria (list, optional): 絞り込み条件(合わない場合は404).
+            Defaults to ().
+
+    Raises:
+        HTTPException: 存在しない(404)
+
+    Returns:
+        JSONResponse: data
+    """
+    query = select(*selected_columns(request, table)) \
+        .where(table.c.id == id, *criteria)
+    async with get_engine().connect() as con:
+        row = (await con.execute(query)).mappings().first()
+    if row is None:
+        raise HTTPException(404, detail='見つかりません')
+    return JSONResponse(
+        {'data': {key: to_json_value(value) for key, value in row.items()}})
+
+
+async def boar_list(request: Request) -> JSONResponse:
+    """雄一覧
+
+    ・farm_id, line_id, tattoo: 一致する雄
+    ・alive: trueは在籍中、falseは淘汰済み
+    ・born_from, born_to: 生年月日の範囲
+    """
+    table: Table = Boar.__table__
+    criteria: list = scope.boar_criteria(await station_id(request))
+    for name in ['farm_id', 'line_id']:
+        value: int = int_param(request, name)
+        if value is not None:
+            criteria.append(table.c[name] == value)
+    if 'tattoo' in request.query_params:
+        criteria.append(table.c.tattoo == request.query_params['tattoo'])
+    alive: str = request.query_params.get('alive')
+    if alive in ('true', '1'):
+        criteria.append(table.c.culling_on.is_(None))
+    elif alive in ('false', '0'):
+        criteria.append(table.c.culling_on.isnot(None))
+    born_from: date = date_param(request, 'born_from')
+    if born_from:
+        criteria.append(table.c.birth_on >= born_from)
+    born_to: date = date_param(request, 'born_to')
+    if born_to:
+        criteria.append(table.c.birth_on <= born_to)
+    return await fetch_page(request, table, criteria)
+
+
+async def boar_detail(request: Request) -> JSONResponse:
+    """雄1頭"""
+    return await fetch_one(
+        request, Boar.__table__, request.path_params['id'],
+        scope.boar_criteria(await station_id(request)))
+
+
+async def status_list(request: Request) -> JSONResponse:
+    """状態一覧
+
+    ・boar_id, status: 一致する状態
+    ・since, until: 設定日の範囲
+    ・/api/boars/{id}/statuses は指定した雄の状態
+    """
+    table: Table = Status.__table__
+    criteria: list = scope.status_criteria(await station_id(request))
+    boar_id = request.path_params.get('id', int_param(request, 'boar_id'))
+    if boar_id is not None:
+        criteria.append(table.c.boar_id == boar_id)
+    if 'status' in request.query_params:
+        criteria.append(table.c.status == request.query_params['status'])
+    since: date = date_param(request, 'since')
+    if since:
+        criteria.append(table.c.start_on >= since)
+    until: date = date_param(request, 'until')
+    if until:
+        criteria.append(table.c.start_on <= until)
+    return await fetch_page(request, table, criteria)
+
+
+async def farm_list(request: Request) -> JSONResponse:
+    """農場一覧(ai_station_idで絞り込み)
+
+    ・ログイン中のユーザーはAIセンター管轄の農場だけ
+    """
+    table: Table = Farm.__table__
+    criteria: list = []
+    for ai_station_id in [await station_id(request),
+                          int_param(request, 'ai_station_id')]:
+        if ai_station_id is not None:
+            criteria.append(table.c.ai_station_id == ai_station_id)
+    return await fetch_page(request, table, criteria)
+
+
+async def line_list(request: Request) -> JSONResponse:
+    """系統一覧"""
+    return await fetch_page(request, Line.__table__, [])
+
+
+async def fetch_changes(after: int, criteria: list) -> list:
+    """カーソルより後の変更をID順にCHANGE_BATCH件まで返す
+
+    Args:
+        after (int): 最後に受け取った変更のID
+        criteria (list): 絞り込み条件
+
+    Returns:
+        list: 変更(changes.to_recordの形)
+    """
+    table: Table = Change.__table__
+    query = select(table).where(table.c.id > after, *criteria) \
+        .order_by(table.c.id).limit(CHANGE_BATCH)
+    async with get_engine().connect() as con:
+        rows: list = (await con.execute(query)).mappings().all()
+    return [changes.to_record(row) for row in rows]
+
+
+async def change_feed(request: Request) -> StreamingResponse:
+    """変更履歴(アウトボックス)
+
+    ・since: 最後に受け取った変更のID(省略時は0)
+    ・NDJSON: sinceより後の変更を全て1行ずつ返す
+        ・wait: 変更がない場合に待つ秒数(最大60, ロングポーリング)
+    ・Accept: text/event-stream の場合はSSEで変更を送り続ける
+        ・イベントのidが変更のID(再接続時はLast-Event-IDから再開)
+        ・SSE_DURATION秒で切断するので、クライアントは再接続する
+    """
+    criteria: list = []
+    ai_station_id: int = await station_id(request)
+    if ai_station_id is not None:
+        criteria.append(
+            Change.farm_id.in_(scope.station_farm_ids(ai_station_id)))
+    since: int = int_param(request, 'since') or 0
+
+    if 'text/event-stream' in request.headers.get('accept', ''):
+        last_event_id: str = request.headers.get('last-event-id', '')
+        if last_event_id.isdigit():
+            since = max(since, int(last_event_id))
+        return StreamingResponse(
+            change_events(request, since, criteria),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    wait: int = min(max(int_param(request, 'wait') or 0, 0), MAX_WAIT)
+    deadline: float = time.monotonic() + wait
+    first: list = await fetch_changes(since, criteria)
+    while not first and time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+        first = await fetch_changes(since, criteria)
+
+    async def lines():
+        batch: list = first
+        while batch:
+            yield ''.join(
+                json.dumps(x, ensure_ascii=False) + '\n' for x in batch)
+            if len(batch) < CHANGE_BATCH:
+                break
+            batch = await fetch_changes(batch[-1]['id'], criteria)
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+async def change_events(request: Request, since: int, criteria: list):
+    """SSEのイベントを作る
+
+    Args:
+        request (Request): リクエスト
+        since (int): 最後に受け取った変更のID
+        criteria (list): 絞り込み条件
+
+    Yields:
+        str: イベント
+    """
+    started: float = time.monotonic()
+    last_sent: float = started
+    yield 'retry: 3000\n\n'
+    while time.monotonic() - started < SSE_DURATION:
+        if await request.is_disconnected():
+            return
+        batch: list = await fetch_changes(since, criteria)
+        for change in batch:
+            yield (f'id: {change["id"]}\nevent: change\n'
+                   f'data: {json.dumps(change, ensure_ascii=False)}\n\n')
+        if batch:
+            since = batch[-1]['id']
+            last_sent = time.monotonic()
+            if len(batch) == CHANGE_BATCH:
+                continue
+        elif time.monotonic() - last_sent >= SSE_HEARTBEAT:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def http_error(request: Request, exc: HTTPException) -> JSONResponse:
+    """エラーをJSONで返す(Retry-Afterなどのヘッダーも)"""
+    return JSONResponse({'error': exc.detail}, status_code=exc.status_code,
+                        headers=exc.headers)
+
+
+def create_api(flask_app: Flask = None) -> Starlette:
+    """APIのASGIアプリを作る
+
+    Flaskアプリと並べてasgi.pyでマウントする
+
+    Args:
+        flask_app (Flask, optional): ログイン中のユーザーを
+            セッションCookieから判定するFlaskアプリ. Defaults to None.
+
+    Returns:
+        Starlette: ASGIアプリ
+    """
+    api: Starlette = Starlette(
+        routes=[
+            Route('/boars', boar_list),
+            Route('/boars/{id:int}', boar_detail),
+            Route('/boars/{id:int}/statuses', status_list),
+            Route('/statuses', status_list),
+            Route('/farms', farm_list),
+            Route('/lines', line_list),
+            Route('/changes', change_feed),
+            Route('/ingest', ingest.ingest, methods=['POST']),
+        ],
+        exception_handlers={HTTPException: http_error},
+    )
+    api.state.flask_app = flask_app
+    return api
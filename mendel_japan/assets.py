@@ -0,0 +1,233 @@
+"""静的ファイル(JS/CSS)のビルドと配信
+
+・flask build-assets でBUNDLESの元ファイルを結合・圧縮(minify)し、
+  static/dist/に内容のハッシュを含むファイル名で書き出す
+    ・gzip(.gz)とbrotli(.br)の圧縮済みファイルも書き出す
+    ・manifest.jsonにバンドル名とファイル名の対応を記録する
+    ・前回のビルドのファイルは残し(更新中のワーカー向け)、それより古いものは削除する
+・テンプレートは asset_url('main.js') でmanifestのファイルのURLを得る
+  (manifestがなければ初回に同じ処理でビルドする)
+・static/dist/のファイルは内容が変わればURLも変わるので、
+  1年間・immutableでキャッシュさせる
+・Accept-Encodingに応じて圧縮済みファイルを返す(br > gzip)
+"""
+from __future__ import annotations
+
+import glob
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import brotli
+import click
+import rcssmin
+import rjsmin
+from flask import Flask, current_app, request, send_from_directory, url_for
+from flask import wrappers
+from flask.cli import with_appcontext
+
+
+BUNDLES: dict = {
+    'main.js': ['javascript/boars.js'],
+}
+DIST_FOLDER: str = 'dist'
+MANIFEST: str = 'manifest.json'
+IMMUTABLE_MAX_AGE: int = 365 * 24 * 60 * 60
+ENCODINGS: tuple = (('br', '.br'), ('gzip', '.gz'))
+
+_manifest: dict = {'mtime': None, 'files': {}}
+
+
+def minify(name: str, source: str) -> str:
+    """JS/CSSを圧縮する
+
+    Args:
+        name (str): バンドル名(拡張子で種類を判定)
+        source (str): 結合した元ファイル
+
+    Returns:
+        str: 圧縮後の内容
+    """
+    if name.endswith('.js'):
+        return rjsmin.jsmin(source)
+    if name.endswith('.css'):
+        return rcssmin.cssmin(source)
+    return source
+
+
+def hashed_name(name: str, content: bytes) -> str:
+    """内容のハッシュを含むファイル名を返す
+
+    Args:
+        name (str): バンドル名 例 main.js
+        content (bytes): 内容
+
+    Returns:
+        str: 例 main.3f2a1b4c5d6e.js
+    """
+    stem, suffix = os.path.splitext(name)
+    digest: str = hashlib.sha256(content).hexdigest()[:12]
+    return f'{stem}.{digest}{suffix}'
+
+
+def read_manifest(folder: str) -> dict:
+    """manifest.jsonを読み込む
+
+    Args:
+        folder (str): static/dist/のパス
+
+    Returns:
+        dict: バンドル名とstatic/からのパスの対応, なければ空
+    """
+    path: str = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_assets(static_folder: str) -> dict:
+    """全てのバンドルをビルドし、manifest.jsonを書き出す
+
+    Args:
+        static_folder (str): staticフォルダのパス
+
+    Returns:
+        dict: バンドル名とstatic/からのパスの対応
+    """
+    folder: str = os.path.join(static_folder, DIST_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    previous: dict = read_manifest(folder)
+    manifest: dict = {}
+    for name, sources in BUNDLES.items():
+        parts: list = []
+        for source in sources:
+            with open(os.path.join(static_folder, source),
+                      encoding='utf-8') as f:
+                parts.append(f.read())
+        content: bytes = minify(name, '\n'.join(parts)).encode('utf-8')
+        file_name: str = hashed_name(name, content)
+        path: str = os.path.join(folder, file_name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(content, quality=11))
+        manifest[name] = f'{DIST_FOLDER}/{file_name}'
+
+    with open(os.path.join(folder, MANIFEST + '.tmp'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(folder, MANIFEST + '.tmp'),
+               os.path.join(folder, MANIFEST))
+
+    keep: set = {
+        os.path.basename(x) for x in [*manifest.values(), *previous.values()]}
+    for path in glob.glob(os.path.join(folder, '*')):
+        base: str = os.path.basename(path)
+        for _, suffix in ENCODINGS:
+            base = base[:-len(suffix)] if base.endswith(suffix) else base
+        if base != MANIFEST and base not in keep:
+            os.remove(path)
+    return manifest
+
+
+def manifest() -> dict:
+    """manifest.jsonの内容を返す(更新されたら読み直す, なければビルドする)
+
+    Returns:
+        dict: バンドル名とstatic/からのパスの対応
+    """
+    folder: str = os.path.join(current_app.static_folder, DIST_FOLDER)
+    path: str = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        current_app.logger.warning(
+            '%s not found, building assets (run flask build-assets)', path)
+        build_assets(current_app.static_folder)
+    mtime: float = os.path.getmtime(path)
+    if _manifest['mtime'] != mtime:
+        _manifest['files'] = read_manifest(folder)
+        _manifest['mtime'] = mtime
+    return _manifest['files']
+
+
+def asset_url(name: str) -> str:
+    """バンドルのURLを返す(テンプレート用)
+
+    Args:
+        name (str): バンドル名 例 main.js
+
+    Returns:
+        str: URL 例 /static/dist/main.3f2a1b4c5d6e.js
+    """
+    return url_for('static', filename=manifest()[name])
+
+
+def accepted_encodings() -> set:
+    """リクエストのAccept-Encodingで受け入れられる圧縮方式を返す
+
+    Returns:
+        set: 圧縮方式(q=0は除く)
+    """
+    return {
+        encoding for encoding, quality in request.accept_encodings
+        if quality > 0}
+
+
+def send_static_file(filename: str) -> wrappers.Response:
+    """静的ファイルを返す(staticエンドポイントを置き換える)
+
+    ・dist/のファイルは1年間・immutableでキャッシュさせ、
+      圧縮済みファイルがあればAccept-Encodingに応じて返す
+    ・それ以外はFlaskの既定の処理で返す
+
+    Args:
+        filename (str): static/からのパス
+
+    Returns:
+        flask.wrappers.Response: レスポンス
+    """
+    app: Flask = current_app
+    if not filename.startswith(DIST_FOLDER + '/'):
+        return app.send_static_file(filename)
+    mimetype: str = mimetypes.guess_type(filename)[0] \
+        or 'application/octet-stream'
+    accepted: set = accepted_encodings()
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.exists(
+                os.path.join(app.static_folder, filename + suffix)):
+            response = send_from_directory(
+                app.static_folder, filename + suffix, mimetype=mimetype,
+                max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(
+            app.static_folder, filename, mimetype=mimetype,
+            max_age=IMMUTABLE_MAX_AGE)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command() -> None:
+    """JS/CSSをビルドし、static/dist/に書き出す"""
+    built: dict = build_assets(current_app.static_folder)
+    for name, path in built.items():
+        click.echo(f'{name} -> {path}')
+
+
+def init_app(app: Flask) -> None:
+    """asset_url, staticの配信, build-assetsコマンドを登録する
+
+    Args:
+        app (Flask): アプリ
+    """
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.view_functions['static'] = send_static_file
+    app.cli.add_command(build_assets_command)
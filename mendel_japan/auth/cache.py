@@ -0,0 +1,90 @@
+"""ログインユーザーのキャッシュ
+
+・user_loaderがリクエストごとにusersテーブルを問い合わせないよう、
+  ユーザーのカラムの値をワーカーごとに短時間(USER_CACHE_TTL秒)保持する
+・キャッシュはセッションに属さない複製(detached)で持ち、
+  リクエストのセッションにはmerge(load=False)でSQLを発行せずに戻す
+・ユーザー情報の更新時はinvalidateで破棄する
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from mendel_japan import db
+from mendel_japan.models import User
+
+
+class UserCache:
+    """有効期限つきのユーザーキャッシュ"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._users: dict = {}
+
+    def get(self, user_id: int) -> User:
+        """キャッシュ済みのユーザーを返す
+
+        Args:
+            user_id (int): ユーザーID
+
+        Returns:
+            User: ユーザー(detached), ない場合や期限切れの場合はNone
+        """
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is None:
+                return None
+            expires_at, user = cached
+            if expires_at < time.monotonic():
+                del self._users[user_id]
+                return None
+            return user
+
+    def set(self, user: User, ttl: int) -> None:
+        """ユーザーの複製を保存する
+
+        Args:
+            user (User): 読み込んだユーザー
+            ttl (int): 保持する秒数
+        """
+        snapshot: User = User(**{
+            column.key: getattr(user, column.key)
+            for column in User.__table__.columns
+        })
+        make_transient_to_detached(snapshot)
+        with self._lock:
+            self._users[user.id] = (time.monotonic() + ttl, snapshot)
+
+    def invalidate(self, user_id: int) -> None:
+        """ユーザーを破棄する
+
+        Args:
+            user_id (int): ユーザーID
+        """
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+users = UserCache()
+
+
+def load_user(user_id: int, ttl: int) -> User:
+    """ユーザーを返す(キャッシュがあればSQLを発行しない)
+
+    Args:
+        user_id (int): ユーザーID
+        ttl (int): キャッシュを保持する秒数, 0の場合はキャッシュしない
+
+    Returns:
+        User: リクエストのセッションに属するユーザー, 存在しない場合はNone
+    """
+    cached: User = users.get(user_id) if ttl > 0 else None
+    if cached is not None:
+        return db.session.merge(cached, load=False)
+    user: User = User.query.get(user_id)
+    if user is not None and ttl > 0:
+        users.set(user, ttl)
+    return user
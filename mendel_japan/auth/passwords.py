@@ -0,0 +1,81 @@
+"""パスワードのハッシュ化と照合
+
+・ハッシュ方式はconfig.PASSWORD_HASH_METHOD(app.config)で指定する
+・ログイン時に保存済みのハッシュが現在の方式と異なれば、
+  入力されたパスワードで作り直して保存する(方式を変えても再登録は不要)
+"""
+from __future__ import annotations
+
+import time
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from mendel_japan import db
+from mendel_japan.models import User
+from mendel_japan.auth.cache import users
+
+
+def hash_password(password: str) -> str:
+    """現在の方式でパスワードをハッシュ化する
+
+    Args:
+        password (str): パスワード
+
+    Returns:
+        str: ハッシュ(方式$ソルト$ハッシュ値)
+    """
+    method: str = current_app.config['PASSWORD_HASH_METHOD']
+    return generate_password_hash(password, method=method)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """保存済みのハッシュの方式が現在の方式と異なるか判定する
+
+    Args:
+        password_hash (str): 保存済みのハッシュ
+
+    Returns:
+        bool: 作り直しが必要か
+    """
+    method: str = password_hash.split('$', 1)[0]
+    return method != current_app.config['PASSWORD_HASH_METHOD']
+
+
+def verify_password(user: User, password: str) -> bool:
+    """パスワードを照合し、必要であればハッシュを作り直して保存する
+
+    Args:
+        user (User): ログインしようとしているユーザー
+        password (str): 入力されたパスワード
+
+    Returns:
+        bool: パスワードが一致したか
+    """
+    if not user.password or not check_password_hash(user.password, password):
+        return False
+    if needs_rehash(user.password):
+        user.password = hash_password(password)
+        db.session.commit()
+        users.invalidate(user.id)
+    return True
+
+
+def benchmark(methods: list, rounds: int) -> list:
+    """ハッシュ方式ごとに1回のハッシュ化にかかる時間を計測する
+
+    Args:
+        methods (list): generate_password_hashのmethod
+        rounds (int): 計測する回数
+
+    Returns:
+        list: (方式, 平均ミリ秒)のリスト
+    """
+    results: list = []
+    for method in methods:
+        start: float = time.perf_counter()
+        for _ in range(rounds):
+            generate_password_hash('benchmark-password', method=method)
+        elapsed: float = (time.perf_counter() - start) / rounds
+        results.append((method, elapsed * 1000))
+    return results
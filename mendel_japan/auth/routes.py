@@ -1,7 +1,10 @@
+import click
 from flask import Blueprint, render_template, flash, redirect, url_for
+from flask import current_app as app
 from ..models import User, AiStation
-from werkzeug.security import generate_password_hash, check_password_hash
 from .. import db
+from .cache import users
+from .passwords import benchmark, hash_password, verify_password
 from flask_login import login_user, login_required, logout_user, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, SubmitField, PasswordField, SelectField
@@ -87,6 +90,7 @@ def login() -> str:
     入力したメールアドレスが既存のユーザーのもので、
     入力したパスワードがそのゆーざーのものである場合、
     ログインして雄一覧ページへ遷移する
+    保存済みのハッシュの方式が古い場合はハッシュを作り直す
 
     Returns:
         str: HTML
@@ -96,7 +100,7 @@ def login() -> str:
         email: str = form.email.data
         password: str = form.password.data
         user: User = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        if user and verify_password(user, password):
             flash('ログインしました', category='success')
             login_user(user, remember=True)
             return redirect(url_for('boars.index'))
@@ -137,6 +141,7 @@ def edit(id):
     form = SignUpForm(obj=user)
     if form.validate_on_submit():
         user = commit_user(form, id)
+        users.invalidate(id)
         flash('ユーザーを更新しました', category='success')
         return redirect(url_for('boars.index'))
     return render_template("./auth/edit.html", user=current_user, form=form)
@@ -147,12 +152,29 @@ def commit_user(form, id=None):
         user = User.query.get(id)
     else:
         user = User()
-    db.session.commit()
     user.name = form.name.data
     user.email = form.email.data
-    user.password = generate_password_hash(form.password.data, method='sha256')
+    user.password = hash_password(form.password.data)
     # user.ai_station_id = form.ai_station_id.data
     if id is None:
         db.session.add(user)
     db.session.commit()
     return user
+
+
+@auth.cli.command('benchmark-hash')
+@click.option('--rounds', default=5, show_default=True, help='計測する回数')
+@click.argument('methods', nargs=-1)
+def benchmark_hash(rounds: int, methods: tuple) -> None:
+    """パスワードのハッシュ方式ごとの所要時間を表示する
+
+    METHODSを省略した場合は現在の方式と代表的なpbkdf2の反復回数を計測する
+    (例: flask auth benchmark-hash pbkdf2:sha256:150000 pbkdf2:sha256:600000)
+    """
+    current: str = app.config['PASSWORD_HASH_METHOD']
+    methods = list(methods) or list(dict.fromkeys([
+        current, 'pbkdf2:sha256:150000', 'pbkdf2:sha256:260000',
+        'pbkdf2:sha256:600000']))
+    for method, milliseconds in benchmark(methods, rounds):
+        mark: str = ' (現在の設定)' if method == current else ''
+        click.echo(f'{method:<28}{milliseconds:8.1f} ms{mark}')
@@ -0,0 +1,289 @@
+"""雄の年齢・淘汰に関する集計
+
+・boarsテーブル(アーカイブを含む)の生年月日・淘汰日・農場・系統を
+  NumPy配列として読み込む
+・読み込みはデータのバージョンが変わったときだけ行い、結果も同じ単位で保持する
+・年齢分布、系統別/農場別の生存曲線(淘汰日齢)、月別淘汰頭数を配列演算で求める
+"""
+from __future__ import annotations
+
+import threading
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+
+from mendel_japan import db
+from mendel_japan.models import Farm, Line
+from mendel_japan.versioning import data_version
+from mendel_japan.boars import archive
+
+
+class Herd(NamedTuple):
+    """集計対象の雄(列ごとの配列)
+
+    Attributes:
+        birth_on (np.ndarray): 生年月日, datetime64[D], 未入力はNaT
+        culling_on (np.ndarray): 淘汰日, datetime64[D], 在籍中はNaT
+        farm_id (np.ndarray): 農場ID, 未設定は-1
+        line_id (np.ndarray): 系統ID, 未設定は-1
+    """
+    birth_on: np.ndarray
+    culling_on: np.ndarray
+    farm_id: np.ndarray
+    line_id: np.ndarray
+
+
+_lock = threading.Lock()
+_cache: dict = {'version': None, 'herd': None, 'summaries': {}}
+
+
+def herd_from_frame(boars: pd.DataFrame) -> Herd:
+    """データフレーム(boarsテーブルのカラム名)を集計用の配列に変換する
+
+    Args:
+        boars (pd.DataFrame): birth_on, culling_on, farm_id, line_idを持つ雄一覧
+
+    Returns:
+        Herd: 集計対象の雄
+    """
+    def to_days(column: pd.Series) -> np.ndarray:
+        return pd.to_datetime(column, errors='coerce') \
+            .to_numpy(dtype='datetime64[D]')
+
+    def to_ids(column: pd.Series) -> np.ndarray:
+        return pd.to_numeric(column, errors='coerce') \
+            .fillna(-1).to_numpy(dtype=np.int64)
+
+    return Herd(
+        birth_on=to_days(boars['birth_on']),
+        culling_on=to_days(boars['culling_on']),
+        farm_id=to_ids(boars['farm_id']),
+        line_id=to_ids(boars['line_id']),
+    )
+
+
+def load_herd() -> tuple:
+    """データのバージョンと集計用の配列を返す
+
+    バージョンが前回と同じ場合はメモリ上の配列をそのまま返す
+
+    Returns:
+        tuple: (データのバージョン(versioning.data_versionのtoken), Herd)
+    """
+    version: str = data_version().token
+    with _lock:
+        if _cache['version'] != version:
+            columns = ['birth_on', 'culling_on', 'farm_id', 'line_id']
+            source = archive.all_boars()
+            boars: pd.DataFrame = pd.read_sql(
+                select(*[source.c[x] for x in columns]), con=db.engine)
+            _cache['herd'] = herd_from_frame(boars)
+            _cache['summaries'] = {}
+            _cache['version'] = version
+        return version, _cache['herd']
+
+
+def whole_months(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """2つの日付配列の間の満月数を返す
+
+    Args:
+        start (np.ndarray): 開始日, datetime64[D]
+        end (np.ndarray): 終了日, datetime64[D]
+
+    Returns:
+        np.ndarray: 満月数
+    """
+    start_month = start.astype('datetime64[M]')
+    end_month = end.astype('datetime64[M]')
+    start_day = (start - start_month.astype('datetime64[D]')).astype(np.int64)
+    end_day = (end - end_month.astype('datetime64[D]')).astype(np.int64)
+    return (end_month - start_month).astype(np.int64) - (end_day < start_day)
+
+
+def age_distribution(
+        herd: Herd, today: date, bin_months: int = 3) -> pd.DataFrame:
+    """在籍中の雄の月齢分布を返す
+
+    Args:
+        herd (Herd): 集計対象の雄
+        today (date): 基準日
+        bin_months (int, optional): 階級の幅(月). Defaults to 3.
+
+    Returns:
+        pd.DataFrame: 階級の下限・上限(月齢)と頭数
+    """
+    today_day = np.datetime64(today, 'D')
+    alive = np.isnat(herd.culling_on) & ~np.isnat(herd.birth_on)
+    months = whole_months(herd.birth_on[alive], today_day)
+    months = months[months >= 0]
+    counts = np.bincount(months // bin_months) if len(months) \
+        else np.zeros(0, dtype=np.int64)
+    lower = np.arange(len(counts)) * bin_months
+    return pd.DataFrame(
+        {'from': lower, 'to': lower + bin_months, 'count': counts})
+
+
+def survival_curves(
+        herd: Herd, group_ids: np.ndarray, today: date) -> pd.DataFrame:
+    """グループ(系統・農場)ごとの淘汰月齢の生存曲線を返す
+
+    ・在籍中の雄は基準日で打ち切りとしたカプラン・マイヤー推定
+    ・グループ × 月齢の行列を作り、リスク集合・淘汰数・生存率を行列演算で求める
+
+    Args:
+        herd (Herd): 集計対象の雄
+        group_ids (np.ndarray): 雄ごとのグループID(herd.line_idなど)
+        today (date): 基準日
+
+    Returns:
+        pd.DataFrame: group_id, month, at_risk, culled, survival
+    """
+    columns = ['group_id', 'month', 'at_risk', 'culled', 'survival']
+    has_birth = ~np.isnat(herd.birth_on)
+    culled = ~np.isnat(herd.culling_on[has_birth])
+    end = np.where(
+        culled, herd.culling_on[has_birth], np.datetime64(today, 'D'))
+    months = whole_months(herd.birth_on[has_birth], end)
+    valid = months >= 0
+    months, culled = months[valid], culled[valid]
+    if not len(months):
+        return pd.DataFrame(columns=columns)
+
+    groups, codes = np.unique(group_ids[has_birth][valid], return_inverse=True)
+    width = months.max() + 1
+    cells = codes * width + months
+    shape = (len(groups), width)
+    exits = np.bincount(cells, minlength=shape[0] * width).reshape(shape)
+    events = np.bincount(
+        cells, weights=culled, minlength=shape[0] * width).reshape(shape)
+    at_risk = exits[:, ::-1].cumsum(axis=1)[:, ::-1]
+    hazard = np.divide(
+        events, at_risk, out=np.zeros(shape), where=at_risk > 0)
+    survival = np.cumprod(1 - hazard, axis=1)
+
+    group_index, month_index = np.nonzero(at_risk)
+    return pd.DataFrame({
+        'group_id': groups[group_index],
+        'month': month_index,
+        'at_risk': at_risk[group_index, month_index],
+        'culled': events[group_index, month_index].astype(np.int64),
+        'survival': survival[group_index, month_index].round(4),
+    })
+
+
+def monthly_culls(herd: Herd) -> pd.DataFrame:
+    """月別の淘汰頭数を返す(淘汰がなかった月は0頭)
+
+    Args:
+        herd (Herd): 集計対象の雄
+
+    Returns:
+        pd.DataFrame: month(YYYY-MM), count
+    """
+    culled = herd.culling_on[~np.isnat(herd.culling_on)] \
+        .astype('datetime64[M]')
+    if not len(culled):
+        return pd.DataFrame(columns=['month', 'count'])
+    first = culled.min()
+    counts = np.bincount((culled - first).astype(np.int64))
+    months = first + np.arange(len(counts))
+    return pd.DataFrame({'month': months.astype(str), 'count': counts})
+
+
+def summary(today: date = None, bin_months: int = 3) -> dict:
+    """集計結果をJSONに変換できる形で返す
+
+    同じデータのバージョン・基準日・階級幅の結果はキャッシュを返す
+
+    Args:
+        today (date, optional): 基準日. Defaults to 本日.
+        bin_months (int, optional): 年齢分布の階級の幅(月). Defaults to 3.
+
+    Returns:
+        dict: 年齢分布、系統別/農場別の生存曲線、月別淘汰頭数
+    """
+    today = today or date.today()
+    version, herd = load_herd()
+    key = (today, bin_months)
+    with _lock:
+        cached = _cache['summaries'].get(key)
+    if cached is not None and _cache['version'] == version:
+        return cached
+
+    line_names: dict = dict(Line.query.with_entities(
+        Line.id, Line.abbreviation).all())
+    farm_names: dict = dict(Farm.query.with_entities(
+        Farm.id, Farm.name).all())
+    result: dict = {
+        'as_of': today.isoformat(),
+        'herd_size': int(len(herd.birth_on)),
+        'age_distribution': {
+            'bin_months': bin_months,
+            'bins': age_distribution(herd, today, bin_months)
+            .to_dict(orient='records'),
+        },
+        'survival': {
+            'line': curves_to_records(
+                survival_curves(herd, herd.line_id, today), line_names),
+            'farm': curves_to_records(
+                survival_curves(herd, herd.farm_id, today), farm_names),
+        },
+        'monthly_culls': monthly_culls(herd).to_dict(orient='records'),
+    }
+    with _lock:
+        if _cache['version'] == version:
+            _cache['summaries'][key] = result
+    return result
+
+
+def curves_to_records(curves: pd.DataFrame, names: dict) -> list:
+    """生存曲線をグループごとのリストに変換する
+
+    Args:
+        curves (pd.DataFrame): survival_curvesの戻り値
+        names (dict): グループIDと表示名
+
+    Returns:
+        list: グループごとのid, name, 曲線
+    """
+    return [
+        {
+            'id': int(group_id),
+            'name': names.get(group_id),
+            'curve': curve.drop(columns='group_id').to_dict(orient='records'),
+        }
+        for group_id, curve in curves.groupby('group_id', sort=True)
+    ]
+
+
+def summary_sheets(boars: pd.DataFrame, today: date = None) -> dict:
+    """ダウンロードする雄一覧の集計表をシート出力用に返す
+
+    Args:
+        boars (pd.DataFrame): boarsテーブルのカラム名の雄一覧
+        today (date, optional): 基準日. Defaults to 本日.
+
+    Returns:
+        dict: 表のタイトルとデータフレーム
+    """
+    today = today or date.today()
+    herd: Herd = herd_from_frame(boars)
+    line_names: dict = dict(Line.query.with_entities(
+        Line.id, Line.abbreviation).all())
+
+    ages: pd.DataFrame = age_distribution(herd, today)
+    ages['月齢'] = ages['from'].astype(str) + '-' + ages['to'].astype(str)
+    survival: pd.DataFrame = survival_curves(herd, herd.line_id, today)
+    survival['系統'] = survival.group_id.map(line_names)
+    return {
+        '月齢分布(在籍中)': ages.rename(columns={'count': '頭数'})[['月齢', '頭数']],
+        '月別淘汰頭数': monthly_culls(herd)
+        .rename(columns={'month': '月', 'count': '頭数'}),
+        '系統別生存率': survival.rename(columns={
+            'month': '月齢', 'at_risk': '在籍頭数',
+            'culled': '淘汰頭数', 'survival': '生存率',
+        })[['系統', '月齢', '在籍頭数', '淘汰頭数', '生存率']],
+    }
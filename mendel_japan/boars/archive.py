@@ -0,0 +1,93 @@
+"""淘汰済みの雄のアーカイブ
+
+・淘汰から一定期間(ARCHIVE_AFTER_DAYS日)が過ぎた雄を、状態と一緒に
+  archived_boars, archived_statusesへ移動してboars, statusesを小さく保つ
+・移動はbatch_size頭ずつのトランザクションで行う(途中で止めても整合する)
+・タトゥーはboarsとarchived_boarsを通して一意にする(雄の登録・編集・
+  取り込みで確認する)。それでもアーカイブに同じタトゥーがある雄は
+  移動せずに残し、他の雄の移動を止めない
+・在籍中の雄だけを扱う処理(雄一覧、在籍中のダウンロード)はboarsだけを読む
+・淘汰済みを含む処理(ダウンロード、雄詳細、集計)はall_boars, all_statusesで
+  両方を読む
+"""
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import Table, delete, exists, select, union_all
+from sqlalchemy.sql import Subquery
+
+from mendel_japan import db
+from mendel_japan.models import ArchivedBoar, ArchivedStatus, Boar, Status
+
+
+def columns_of(table: Table, source: Table) -> list:
+    """sourceと同じ名前のtableのカラムを返す
+
+    Args:
+        table (Table): 読み込むテーブル
+        source (Table): 列の並びの基準にするテーブル
+
+    Returns:
+        list: カラム
+    """
+    return [table.c[column.name] for column in source.columns]
+
+
+def all_boars() -> Subquery:
+    """boarsとarchived_boarsを合わせたサブクエリを返す(列はboarsと同じ)
+
+    Returns:
+        Subquery: 全ての雄
+    """
+    return union_all(
+        select(Boar.__table__),
+        select(*columns_of(ArchivedBoar.__table__, Boar.__table__)),
+    ).subquery('all_boars')
+
+
+def all_statuses() -> Subquery:
+    """statusesとarchived_statusesを合わせたサブクエリを返す(列はstatusesと同じ)
+
+    Returns:
+        Subquery: 全ての状態
+    """
+    return union_all(
+        select(Status.__table__),
+        select(*columns_of(ArchivedStatus.__table__, Status.__table__)),
+    ).subquery('all_statuses')
+
+
+def archive_culled(before: date, batch_size: int = 1000) -> int:
+    """指定日より前に淘汰された雄を状態と一緒にアーカイブへ移動する
+
+    Args:
+        before (date): この日より前の淘汰日の雄を移動する
+        batch_size (int, optional): 1回のトランザクションで移動する頭数.
+            Defaults to 1000.
+
+    Returns:
+        int: 移動した頭数
+    """
+    boars: Table = Boar.__table__
+    statuses: Table = Status.__table__
+    archived: Table = ArchivedBoar.__table__
+    moved: int = 0
+    while True:
+        with db.engine.begin() as con:
+            ids: list = con.execute(
+                select(boars.c.id).where(
+                    boars.c.culling_on < before,
+                    ~exists().where(archived.c.tattoo == boars.c.tattoo))
+                .order_by(boars.c.id).limit(batch_size)).scalars().all()
+            if not ids:
+                return moved
+            con.execute(archived.insert().from_select(
+                [x.name for x in boars.columns],
+                select(boars).where(boars.c.id.in_(ids))))
+            con.execute(ArchivedStatus.__table__.insert().from_select(
+                [x.name for x in statuses.columns],
+                select(statuses).where(statuses.c.boar_id.in_(ids))))
+            con.execute(delete(statuses).where(statuses.c.boar_id.in_(ids)))
+            con.execute(delete(boars).where(boars.c.id.in_(ids)))
+        moved += len(ids)
@@ -0,0 +1,246 @@
+"""指定日時点の雄の状態
+
+・指定日に在籍していた雄と、その日に有効だった状態(その日以前で最新の状態)を返す
+・PostgreSQLはウィンドウ関数1回のクエリ、SQLiteなどはpandasのベクトル演算で求める
+・期間を指定すると、日ごとの状態別頭数(生産可頭数など)を1回の走査で求める
+・過去の日付では淘汰済みの雄も対象になるので、アーカイブも合わせて読む
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, or_, select
+
+from mendel_japan import db
+from mendel_japan.boars import archive
+
+
+GROUP_COLUMNS: dict = {'line': 'line_id', 'farm': 'farm_id'}
+# 日ごとの頭数を求める期間の上限(日数)
+MAX_PERIOD_DAYS: int = 3660
+# pandasの日時で扱える最後の日
+LAST_DAY: date = pd.Timestamp.max.date()
+
+
+def in_herd(boars, on: date):
+    """指定日に在籍していた雄の条件を返す
+
+    Args:
+        boars: 雄のテーブルまたはサブクエリ
+        on (date): 基準日
+
+    Returns:
+        sqlalchemy.sql.elements.BooleanClauseList: 条件
+    """
+    return and_(
+        or_(boars.c.birth_on.is_(None), boars.c.birth_on <= on),
+        or_(boars.c.culling_on.is_(None), boars.c.culling_on > on),
+    )
+
+
+def statuses_as_of(on: date) -> pd.DataFrame:
+    """指定日に在籍していた雄ごとに、その日に有効だった状態を返す
+
+    状態が登録されていない雄はstatusが欠損値
+
+    Args:
+        on (date): 基準日
+
+    Returns:
+        pd.DataFrame: boar_id, farm_id, line_id, status, reason, start_on
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return _statuses_as_of_window(on)
+    return _statuses_as_of_frame(on)
+
+
+def _statuses_as_of_window(on: date) -> pd.DataFrame:
+    """ウィンドウ関数で雄ごとの最新の状態を1回のクエリで取得する
+
+    Args:
+        on (date): 基準日
+
+    Returns:
+        pd.DataFrame: statuses_as_ofと同じ
+    """
+    boars = archive.all_boars()
+    statuses = archive.all_statuses()
+    ranked = select(
+        statuses.c.boar_id, statuses.c.status, statuses.c.reason,
+        statuses.c.start_on,
+        func.row_number().over(
+            partition_by=statuses.c.boar_id,
+            order_by=(statuses.c.start_on.desc(), statuses.c.id.desc()),
+        ).label('rank'),
+    ).where(statuses.c.start_on <= on).subquery()
+
+    query = select(
+        boars.c.id.label('boar_id'), boars.c.farm_id, boars.c.line_id,
+        ranked.c.status, ranked.c.reason, ranked.c.start_on,
+    ).outerjoin(ranked, and_(
+        ranked.c.boar_id == boars.c.id, ranked.c.rank == 1,
+    )).where(in_herd(boars, on)).order_by(boars.c.id)
+    return pd.read_sql(query, con=db.engine)
+
+
+def _statuses_as_of_frame(on: date) -> pd.DataFrame:
+    """雄と状態を読み込み、pandasで雄ごとの最新の状態を求める
+
+    Args:
+        on (date): 基準日
+
+    Returns:
+        pd.DataFrame: statuses_as_ofと同じ
+    """
+    boars = archive.all_boars()
+    source = archive.all_statuses()
+    herd: pd.DataFrame = pd.read_sql(select(
+        boars.c.id.label('boar_id'), boars.c.farm_id, boars.c.line_id,
+    ).where(in_herd(boars, on)).order_by(boars.c.id), con=db.engine)
+    statuses: pd.DataFrame = pd.read_sql(select(
+        source.c.boar_id, source.c.status, source.c.reason,
+        source.c.start_on,
+    ).where(source.c.start_on <= on).order_by(
+        source.c.boar_id, source.c.start_on, source.c.id), con=db.engine)
+    latest: pd.DataFrame = statuses.drop_duplicates('boar_id', keep='last')
+    return herd.merge(latest, on='boar_id', how='left')
+
+
+def counts_as_of(on: date, group_by: list) -> pd.DataFrame:
+    """指定日時点の状態別頭数をグループごとに返す
+
+    Args:
+        on (date): 基準日
+        group_by (list): 'line', 'farm'の組み合わせ
+
+    Returns:
+        pd.DataFrame: グループのカラム, status, count
+    """
+    snapshot: pd.DataFrame = statuses_as_of(on)
+    snapshot['status'] = snapshot.status.fillna('未設定')
+    keys: list = [GROUP_COLUMNS[x] for x in group_by] + ['status']
+    return snapshot.groupby(keys, dropna=False).size() \
+        .rename('count').reset_index()
+
+
+def availability_series(
+        start: date, end: date, status: str = '生産可',
+        group_by: list = None) -> pd.DataFrame:
+    """期間中の日ごとの指定状態の頭数を返す
+
+    ・期間の終わりまでに登録された状態を雄・設定日順に1回読み込む
+    ・各状態の有効期間(設定日から次の状態の設定日または淘汰日の前日まで)を求める
+    ・有効期間の始まりに+1、終わりに-1を加算して累積和を取る
+
+    Args:
+        start (date): 期間の始め
+        end (date): 期間の終わり
+        status (str, optional): 数える状態. Defaults to '生産可'.
+        group_by (list, optional): 'line', 'farm'の組み合わせ. Defaults to None.
+
+    Returns:
+        pd.DataFrame: 日付を行、グループを列とした頭数(グループなしはcount列のみ)
+    """
+    group_by = group_by or []
+    keys: list = [GROUP_COLUMNS[x] for x in group_by]
+    boars = archive.all_boars()
+    source = archive.all_statuses()
+    statuses: pd.DataFrame = pd.read_sql(select(
+        source.c.boar_id, source.c.status, source.c.start_on,
+        boars.c.culling_on, boars.c.farm_id, boars.c.line_id,
+    ).join(boars, boars.c.id == source.c.boar_id)
+        .where(source.c.start_on <= end)
+        .order_by(source.c.boar_id, source.c.start_on, source.c.id),
+        con=db.engine)
+
+    days: int = (end - start).days + 1
+    index = pd.date_range(start, periods=days, freq='D', name='date')
+    if statuses.empty or days <= 0:
+        return pd.DataFrame({'count': np.zeros(max(days, 0), dtype=np.int64)},
+                            index=index[:max(days, 0)])
+
+    start_on = pd.to_datetime(statuses.start_on).to_numpy('datetime64[D]')
+    boar_ids = statuses.boar_id.to_numpy()
+    same_boar = np.append(boar_ids[1:] == boar_ids[:-1], False)
+    next_start = np.append(start_on[1:], np.datetime64('NaT'))
+    valid_until = np.where(same_boar, next_start, np.datetime64('NaT'))
+    culling_on = pd.to_datetime(statuses.culling_on).to_numpy('datetime64[D]')
+    valid_until = np.fmin(valid_until, culling_on)
+
+    first = np.datetime64(start, 'D')
+    begin = np.clip((start_on - first).astype(np.int64), 0, days)
+    finish = np.where(
+        np.isnat(valid_until), days,
+        np.clip((valid_until - first).astype(np.int64), 0, days))
+    selected = (statuses.status.to_numpy() == status) & (begin < finish)
+
+    if keys:
+        groups: pd.MultiIndex = pd.MultiIndex.from_frame(
+            statuses.loc[selected, keys].fillna(-1).astype(np.int64))
+        codes, labels = pd.factorize(groups)
+        labels = [
+            '-'.join(f'{name}:{value}' for name, value in zip(group_by, x))
+            for x in labels
+        ]
+    else:
+        codes = np.zeros(selected.sum(), dtype=np.int64)
+        labels = ['count']
+
+    delta = np.zeros((len(labels), days + 1), dtype=np.int64)
+    np.add.at(delta, (codes, begin[selected]), 1)
+    np.add.at(delta, (codes, finish[selected]), -1)
+    counts = delta.cumsum(axis=1)[:, :days]
+    return pd.DataFrame(counts.T, index=index, columns=labels)
+
+
+def frame_to_records(df: pd.DataFrame, date_columns: tuple = ()) -> list:
+    """データフレームをJSONに変換できる辞書のリストにする
+
+    ・日付はISO形式の文字列、欠損値はNoneに変換
+
+    Args:
+        df (pd.DataFrame): 変換するデータフレーム
+        date_columns (tuple, optional): 日付のカラム. Defaults to ().
+
+    Returns:
+        list: 行ごとの辞書
+    """
+    df = df.copy()
+    for column in date_columns:
+        df[column] = pd.to_datetime(df[column]).dt.strftime('%Y-%m-%d')
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+def default_period(end: date = None, days: int = 30) -> tuple:
+    """期間の指定がない場合の期間(終わりの日を含む過去days日間)を返す
+
+    Args:
+        end (date, optional): 期間の終わり. Defaults to 本日.
+        days (int, optional): 日数. Defaults to 30.
+
+    Returns:
+        tuple: (期間の始め, 期間の終わり)
+    """
+    end = end or date.today()
+    return end - timedelta(days=days - 1), end
+
+
+def period_error(start: date, end: date) -> str:
+    """日ごとの頭数を求められない期間の場合はエラーメッセージを返す
+
+    Args:
+        start (date): 期間の始め
+        end (date): 期間の終わり
+
+    Returns:
+        str: エラーメッセージ, 求められる期間の場合はNone
+    """
+    if start > end:
+        return '期間の始めが終わりより後になっています'
+    if (end - start).days + 1 > MAX_PERIOD_DAYS:
+        return f'期間は{MAX_PERIOD_DAYS}日以内で指定してください'
+    if end > LAST_DAY:
+        return f'期間の終わりは{LAST_DAY.isoformat()}以前で指定してください'
+    return None
@@ -0,0 +1,93 @@
+"""雄情報の一括編集
+
+・選択した雄、または絞り込み条件に合う雄の淘汰日・農場・系統を
+  まとめて変更する(まとめて淘汰、農場の移動)
+・ログイン中のユーザーのAIセンター管轄外の雄は対象にしない
+・更新した雄は変更履歴に記録し、行のキャッシュを破棄する
+"""
+from __future__ import annotations
+
+from sqlalchemy import select, update
+
+from mendel_japan import changes, db, scope
+from mendel_japan.models import Boar
+from mendel_japan.boars import forms
+
+
+CHUNK_SIZE: int = 500
+
+
+def form_criteria(form: forms.BoarBulkEdit, ai_station_id: int) -> list:
+    """フォームの対象を雄の絞り込み条件にする
+
+    Args:
+        form (BoarBulkEdit): フォーム入力内容
+        ai_station_id (int): ログイン中のユーザーのAIセンターID
+
+    Returns:
+        list: 雄の絞り込み条件
+    """
+    criteria: list = scope.boar_criteria(ai_station_id)
+    if form.ids.data:
+        criteria.append(Boar.id.in_(form.ids.data))
+    if form.where_farm_id.data is not None:
+        criteria.append(Boar.farm_id == form.where_farm_id.data)
+    if form.where_line_id.data is not None:
+        criteria.append(Boar.line_id == form.where_line_id.data)
+    if form.where_alive.data:
+        criteria.append(Boar.culling_on.is_(None))
+    return criteria
+
+
+def form_values(form: forms.BoarBulkEdit) -> dict:
+    """フォームで入力された項目だけをカラム名の辞書で返す
+
+    Args:
+        form (BoarBulkEdit): フォーム入力内容
+
+    Returns:
+        dict: カラム名と値
+    """
+    values: dict = {}
+    if form.culling_on.data:
+        values['culling_on'] = form.culling_on.data
+    if form.farm_id.data:
+        values['farm_id'] = form.farm_id.data
+    if form.line_id.data:
+        values['line_id'] = form.line_id.data
+    return values
+
+
+def update_boars(criteria: list, values: dict) -> tuple:
+    """条件に合う雄を変更し、変更履歴を記録する
+
+    ・commitは呼び出し側で行う
+    ・updated_atも更新されるので、行のバージョン・データのバージョンも変わる
+    ・変更した雄と記録する雄がずれないよう、IDを確定してから変更する
+        ・PostgreSQL: 1回のUPDATEのRETURNINGで変更した雄IDを受け取る
+        ・SQLiteなど: 条件に合う雄IDを取得し、そのIDだけを変更する
+
+    Args:
+        criteria (list): 雄の絞り込み条件
+        values (dict): カラム名と値
+
+    Returns:
+        tuple: (更新した件数, 更新した雄IDのリスト)
+    """
+    if db.session.connection().dialect.name == 'postgresql':
+        ids: list = db.session.execute(
+            update(Boar).where(*criteria).values(**values)
+            .returning(Boar.id)
+            .execution_options(synchronize_session=False)).scalars().all()
+    else:
+        ids = db.session.execute(
+            select(Boar.id).where(*criteria)).scalars().all()
+        for start in range(0, len(ids), CHUNK_SIZE):
+            db.session.execute(
+                update(Boar).where(Boar.id.in_(ids[start:start + CHUNK_SIZE]))
+                .values(**values)
+                .execution_options(synchronize_session=False))
+    if not ids:
+        return 0, []
+    changes.record(db.session, 'boar', 'update', ids)
+    return len(ids), ids
@@ -1,39 +1,57 @@
 """ダウンロード用のExcelファイルを作成してレスポンスとして返す"""
 
 import flask
-import flask_sqlalchemy
 import pandas as pd
 import openpyxl as xl
 from openpyxl.styles.borders import Border, Side
 from openpyxl.styles import Alignment
 import os
+import tempfile
+import time
 from datetime import datetime
 
 
-from config import engine
+from mendel_japan import metrics
 from mendel_japan.models import Farm, Line
+from mendel_japan.boars import analytics
 
 
-def downloadExcel(
-        boars_query: flask_sqlalchemy.BaseQuery) -> flask.wrappers.Response:
+def downloadExcel(boars: pd.DataFrame) -> flask.wrappers.Response:
     """ダウンロード用のExcelファイルを作成してレスポンスとして返す
 
-    ・選択した条件の雄(boars_query)をデータフレームに変換
     ・カラム名を日本語に変換
     ・リレーションしている項目を変換
+    ・年齢・淘汰の集計表を作成
     ・Excelファイルに出力
     ・Excelファイルをレスポンスとして返す
 
     Args:
-        boars_query (flask_sqlalchemy.BaseQuery): 選択した条件(SQL)
+        boars (pd.DataFrame): 選択した条件の雄一覧(boarsテーブルのカラム名)
 
     Returns:
         flask.wrappers.Response: Excelファイルのレスポンス
     """
-    boars: pd.DataFrame = pd.read_sql(boars_query.statement, con=engine)
+    file_name: str = build_workbook(boars, temporary_name())
+    return add_response(file_name, download_name())
+
+
+def build_workbook(boars: pd.DataFrame, file_name: str = None) -> str:
+    """選択した条件の雄一覧と集計表のExcelファイルを作成してファイル名を返す
+
+    Args:
+        boars (pd.DataFrame): 選択した条件の雄一覧(boarsテーブルのカラム名)
+        file_name (str, optional): 保存先. Defaults to 作成日時のファイル名.
+
+    Returns:
+        str: ファイル名
+    """
+    started: float = time.perf_counter()
     boars_rename: pd.DataFrame = data_rename(boars)
-    file_name: str = add_workbook(boars_rename)
-    return add_response(file_name)
+    summaries: dict = analytics.summary_sheets(boars)
+    file_name = add_workbook(boars_rename, summaries, file_name)
+    metrics.observe_export(
+        len(boars), file_name, time.perf_counter() - started)
+    return file_name
 
 
 def data_rename(boars: pd.DataFrame) -> pd.DataFrame:
@@ -73,15 +91,20 @@ def rename_column() -> dict:
     }
 
 
-def add_workbook(boars: pd.DataFrame) -> str:
+def add_workbook(
+        boars: pd.DataFrame, summaries: dict = None,
+        file_name: str = None) -> str:
     """Excelファイルを新規作成してファイル名を返す
 
     ・Excelファイルを新規作成
     ・データフレームの内容を入力
+    ・集計表がある場合は「集計」シートに横並びで入力
     ・フォーマットを整えて保存しファイル名を返す
 
     Args:
         boars (pd.DataFrame): 雄一覧
+        summaries (dict, optional): 表のタイトルと集計表. Defaults to None.
+        file_name (str, optional): 保存先. Defaults to 作成日時のファイル名.
 
     Returns:
         str: ファイル名
@@ -92,13 +115,25 @@ def add_workbook(boars: pd.DataFrame) -> str:
     input_worksheet(ws, boars)
     add_format(ws)
 
-    now: datetime = datetime.now().strftime('%y%m%d%H%M%S')
-    file_name: str = f'{now}_boar_list.xlsx'
+    if summaries:
+        input_summary_sheet(wb.create_sheet('集計'), summaries)
+
+    file_name = file_name or download_name()
     wb.save(file_name)
     wb.close()
     return file_name
 
 
+def download_name() -> str:
+    """ダウンロードするファイル名(作成日時_boar_list.xlsx)を返す
+
+    Returns:
+        str: ファイル名
+    """
+    now: datetime = datetime.now().strftime('%y%m%d%H%M%S')
+    return f'{now}_boar_list.xlsx'
+
+
 def input_worksheet(ws: xl.worksheet, boars: pd.DataFrame) -> None:
     """データフレームの内容をExcelファイルに入力
 
@@ -114,6 +149,27 @@ def input_worksheet(ws: xl.worksheet, boars: pd.DataFrame) -> None:
             ws.cell(row, col).value = data
 
 
+def input_summary_sheet(ws: xl.worksheet, summaries: dict) -> None:
+    """集計表を1列空けて横に並べて入力する
+
+    ・1行目に表のタイトル、2行目以降に集計表
+
+    Args:
+        ws (xl.worksheet): ワークシート
+        summaries (dict): 表のタイトルと集計表
+    """
+    start_col: int = 1
+    for title, table in summaries.items():
+        ws.cell(1, start_col).value = title
+        fill(ws.cell(1, start_col), 'CCECFF')
+        for col, column_title in enumerate(table.columns.values, start_col):
+            ws.cell(2, col).value = column_title
+        for row, values in enumerate(table.itertuples(index=False), 3):
+            for col, data in enumerate(values, start_col):
+                ws.cell(row, col).value = data
+        start_col += len(table.columns) + 1
+
+
 def add_format(ws: xl.worksheet) -> None:
     """フォーマットの設定
 
@@ -192,27 +248,48 @@ def add_border(col: tuple) -> None:
         cell.border = border
 
 
-def add_response(file_name: str) -> flask.wrappers.Response:
-    """レスポンスを返す
+def temporary_name() -> str:
+    """作成するExcelファイルの一時的な保存先を返す
+
+    同時にダウンロードしても重ならないよう、リクエストごとに別のファイルにする
+
+    Returns:
+        str: ファイル名
+    """
+    fd, file_name = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    return file_name
+
 
-    中段は何の設定か良くわからない
+def add_response(
+        file_name: str,
+        attachment_name: str = None) -> flask.wrappers.Response:
+    """作成したExcelファイルをレスポンスとして返す
+
+    ・ファイルをメモリに読み込まず、開いたファイルから送信する
+    ・送信が終わったら(レスポンスを閉じたときに)一時ファイルを削除する
 
     Args:
         file_name (str): ファイル名
+        attachment_name (str, optional): ダウンロードするファイル名.
+            Defaults to file_name.
 
     Returns:
         flask.wrappers.Response: レスポンス(Excelファイル)
     """
-    response: flask.wrappers.Response = flask.make_response()
-    wb = open(file_name, "rb")
-    response.data = wb.read()
-    wb.close()
-
-    response.headers["Content-Disposition"] = \
-        "attachment; filename=" + file_name
     XLSX_MIMETYPE = \
         "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    response.mimetype = XLSX_MIMETYPE
-
-    os.remove(file_name)
+    workbook = open(file_name, "rb")
+    response: flask.wrappers.Response = flask.send_file(
+        workbook, mimetype=XLSX_MIMETYPE, as_attachment=True,
+        download_name=attachment_name or os.path.basename(file_name))
+
+    # direct_passthroughのままではWerkzeugがcall_on_closeを呼ばないため外す
+    # (本文は開いたファイルから少しずつ読み出すまま)
+    response.direct_passthrough = False
+
+    def remove() -> None:
+        workbook.close()
+        os.remove(file_name)
+    response.call_on_close(remove)
     return response
@@ -3,12 +3,14 @@
     ・雄情報登録及び編集用
     ・一括登録用ファイルアップロード用
     ・Excelファイルダウンロード用
+    ・雄情報一括編集用
     """
+from mendel_japan import scope
 from mendel_japan.models import Farm, Line
 from flask_wtf import FlaskForm
 from wtforms import (
     StringField, DateField, validators, SubmitField, FileField, RadioField,
-    BooleanField, SelectField)
+    BooleanField, SelectField, SelectMultipleField, IntegerField)
 
 
 class BoarForm(FlaskForm):
@@ -93,6 +95,12 @@ class BoarDownload(FlaskForm):
     ggp1_farm = BooleanField('GGP')
     ggp2_farm = BooleanField('第2農場')
     east_farm = BooleanField('東日本')
+
+    history = RadioField('状態の履歴', choices=[
+        ('none', '出力しない'),
+        ('long', '1シート(1行1状態)'),
+        ('farm', '農場ごとのシート(1行1頭)'),
+    ], default='none')
     submit = SubmitField()
 
 
@@ -106,3 +114,58 @@ class StatusForm(FlaskForm):
     reason = StringField('理由', validators=[
         validators.Length(max=20, message='20文字以内で入力してください')])
     submit = SubmitField()
+
+
+class BoarBulkEdit(FlaskForm):
+    """雄情報一括編集用クラス
+
+    ・対象: 雄一覧で選択した雄(ids)、または絞り込み条件(where_*)
+    ・変更する項目だけ入力する(農場・系統は0で変更しない)
+    ・移動先の農場はログイン中のユーザーのAIセンター管轄の農場に限る
+    ・JSONで送信することもできる(csrf_tokenを含める)
+    """
+    ids = SelectMultipleField(coerce=int, choices=[], validate_choice=False)
+    where_farm_id = IntegerField(validators=[validators.Optional()])
+    where_line_id = IntegerField(validators=[validators.Optional()])
+    where_alive = BooleanField()
+    culling_on = DateField('淘汰日', validators=[
+        validators.Optional(strip_whitespace=True)])
+    farm_id = SelectField(
+        '農場', coerce=int, default=0, validate_choice=False)
+    line_id = SelectField('系統', coerce=int, default=0)
+    submit = SubmitField()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        ai_station_id: int = scope.current_station_id()
+        query = Farm.query.order_by(Farm.id)
+        if ai_station_id is not None:
+            query = query.filter(Farm.ai_station_id == ai_station_id)
+        farms: Farm = query.all()
+        self.farm_id.choices = [(0, '変更しない')] + \
+            [(farm.id, farm.name) for farm in farms]
+        lines: Line = Line.query.order_by(Line.code).all()
+        self.line_id.choices = [(0, '変更しない')] + \
+            [(line.id, f'{line.code} ({line.name})') for line in lines]
+
+    def validate(self, *args, **kwargs) -> bool:
+        """対象と変更する項目がそれぞれ1つ以上あるか、移動先の農場が
+        管轄の農場か確認する
+
+        Returns:
+            bool: 入力内容が正しいか
+        """
+        if not super().validate(*args, **kwargs):
+            return False
+        if self.farm_id.data not in dict(self.farm_id.choices):
+            self.farm_id.errors.append('管轄外の農場には移動できません')
+            return False
+        if not (self.ids.data or self.where_farm_id.data is not None
+                or self.where_line_id.data is not None):
+            self.ids.errors.append('対象の雄を選択してください')
+            return False
+        if not (self.culling_on.data or self.farm_id.data
+                or self.line_id.data):
+            self.submit.errors = ['変更する項目を入力してください']
+            return False
+        return True
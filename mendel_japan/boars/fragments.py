@@ -0,0 +1,128 @@
+"""雄一覧の行(<tr>)のHTMLキャッシュ
+
+・雄ID → (行のバージョン, 描画済みHTML) をワーカーごとに保持する
+・行のバージョンは雄のupdated_at、状態の件数と最新のupdated_at、
+  農場・系統・AIセンターの対応表のfingerprintから作る
+  (雄一覧のスナップショット(roster)の値, 他のワーカーで更新された行も
+  バージョンの違いで描画し直す)
+・雄・状態を更新したルートからinvalidateを呼び、同じワーカーでは即座に破棄する
+・保持する行数は雄の頭数が上限
+"""
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+from flask import render_template
+from markupsafe import Markup
+
+from mendel_japan import metrics
+from mendel_japan.boars.roster import Masters, Roster, row_values, row_versions
+
+
+class RowCache:
+    """描画済みの行のキャッシュとヒット率の記録"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rows: dict = {}
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get_many(self, versions: list) -> tuple:
+        """キャッシュ済みの行と描画が必要な雄IDを返す
+
+        Args:
+            versions (list): (雄ID, 行のバージョン)のリスト
+
+        Returns:
+            tuple: ({雄ID: HTML}, [描画が必要な雄ID])
+        """
+        found: dict = {}
+        missing: list = []
+        with self._lock:
+            for boar_id, version in versions:
+                cached = self._rows.get(boar_id)
+                if cached is not None and cached[0] == version:
+                    found[boar_id] = cached[1]
+                else:
+                    missing.append(boar_id)
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def set_many(self, rows: dict) -> None:
+        """描画した行を保存する
+
+        Args:
+            rows (dict): {雄ID: (行のバージョン, HTML)}
+        """
+        with self._lock:
+            self._rows.update(rows)
+
+    def invalidate(self, boar_id: int = None) -> None:
+        """行を破棄する
+
+        Args:
+            boar_id (int, optional): 雄ID, 指定しない場合は全て破棄. Defaults to None.
+        """
+        with self._lock:
+            if boar_id is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(boar_id, None)
+
+    def stats(self) -> dict:
+        """起動してからのヒット数・ミス数・ヒット率と保持している行数を返す
+
+        Returns:
+            dict: hits, misses, ratio, size
+        """
+        with self._lock:
+            total: int = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'ratio': round(self.hits / total, 4) if total else None,
+                'size': len(self._rows),
+            }
+
+
+rows = RowCache()
+
+
+def render_rows(
+        roster: Roster, masters: Masters, mask: np.ndarray) -> tuple:
+    """雄一覧の行のHTMLを組み立てる
+
+    ・表示する雄と行のバージョンはスナップショット(roster)から求める
+    ・バージョンが変わっていない行はキャッシュを使う
+    ・変わった行だけスナップショットの値で描画する
+
+    Args:
+        roster (Roster): 雄一覧のスナップショット
+        masters (Masters): 農場・系統・AIセンターの対応表
+        mask (np.ndarray): 表示する雄はTrue
+
+    Returns:
+        tuple: (行をつなげたHTML, 今回のヒット数, 今回のミス数)
+    """
+    indices: np.ndarray = np.flatnonzero(mask)
+    versions: list = row_versions(roster, masters, indices)
+    found, missing = rows.get_many(versions)
+
+    version_of: dict = dict(versions)
+    index_of: dict = dict(zip(roster.id[indices].tolist(), indices))
+    rendered: dict = {}
+    for boar_id in missing:
+        html: str = render_template(
+            './boars/row.html',
+            row=row_values(roster, masters, index_of[boar_id]))
+        rendered[boar_id] = (version_of[boar_id], html)
+        found[boar_id] = html
+    rows.set_many(rendered)
+
+    metrics.ROW_CACHE.labels('hit').inc(len(versions) - len(missing))
+    metrics.ROW_CACHE.labels('miss').inc(len(missing))
+    html = Markup(''.join(found[x] for x, _ in versions))
+    return html, len(versions) - len(missing), len(missing)
@@ -0,0 +1,310 @@
+"""状態の履歴を含むダウンロードファイル
+
+・雄一覧のシートに加えて、選択した雄の全ての状態を出力する
+    ・long: 1行1状態のシート(雄ID・状態の日付順)
+    ・farm: 農場ごとのシートに1行1頭で、状態を古い順に横に並べる
+・状態は雄と状態(アーカイブを含む)の1回の並べ替え済みの結合を
+  サーバー側カーソルで少しずつ読み、write_onlyのワークブックに
+  1行ずつ書き出す(保持するのは1頭分の状態だけ)
+・1シートの行数の上限を超える場合は続きのシートに書く
+"""
+from __future__ import annotations
+
+import re
+import time
+from typing import Iterator
+
+import openpyxl as xl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from sqlalchemy import Table, func, select
+from sqlalchemy.sql import Select
+
+from mendel_japan import db, metrics
+from mendel_japan.models import Boar, Farm, Line, Status
+from mendel_japan.boars import archive, exporter
+from mendel_japan.boars.selection import Selection
+
+MODES: tuple = ('long', 'farm')
+CHUNK_SIZE: int = 5000
+# Excelの1シートの行数の上限(見出しの1行を含む)
+MAX_ROWS: int = 1048576
+BOAR_TITLES: list = ['農場', 'タトゥー', '雄ID', '系統', '生年月日', '淘汰日']
+STATUS_TITLES: list = ['日付', '状態', '理由']
+
+
+def sources(selection: Selection) -> tuple:
+    """抽出条件で読む雄と状態のテーブルを返す
+
+    ・在籍中のみの場合はboars, statusesだけ、淘汰済みを含む場合はアーカイブも読む
+
+    Args:
+        selection (Selection): 抽出条件
+
+    Returns:
+        tuple: (雄, 状態)
+    """
+    if selection.enrollment_status == 'alive_only':
+        return Boar.__table__, Status.__table__
+    return archive.all_boars(), archive.all_statuses()
+
+
+def selected(boars: Table, selection: Selection) -> list:
+    """抽出条件に合う雄の条件(roster.selection_maskと同じ)を返す
+
+    Args:
+        boars (Table): 雄のテーブルまたはサブクエリ
+        selection (Selection): 抽出条件
+
+    Returns:
+        list: WHERE句の条件
+    """
+    criteria: list = [
+        boars.c.line_id.in_(select(Line.id).where(
+            Line.abbreviation.in_(selection.lines))),
+        boars.c.farm_id.in_(select(Farm.id).where(
+            Farm.abbreviation.in_(selection.farms))),
+    ]
+    if selection.enrollment_status == 'alive_only':
+        criteria.append(boars.c.culling_on.is_(None))
+    elif selection.enrollment_status == 'culled_only':
+        criteria.append(boars.c.culling_on.isnot(None))
+    return criteria
+
+
+def history_query(selection: Selection, by_farm: bool) -> Select:
+    """選択した雄と全ての状態を並べ替えて結合するクエリを返す
+
+    ・状態のない雄も1行(状態の列は欠損値)で返す
+
+    Args:
+        selection (Selection): 抽出条件
+        by_farm (bool): 農場・雄・日付順の場合True, 雄・日付順の場合False
+
+    Returns:
+        Select: farm_id, boar_id, tattoo, name, line_id, birth_on,
+            culling_on, start_on, status, reason
+    """
+    boars, statuses = sources(selection)
+    order: list = [boars.c.farm_id] if by_farm else []
+    return select(
+        boars.c.farm_id, boars.c.id.label('boar_id'), boars.c.tattoo,
+        boars.c.name, boars.c.line_id, boars.c.birth_on, boars.c.culling_on,
+        statuses.c.start_on, statuses.c.status, statuses.c.reason,
+    ).outerjoin(statuses, statuses.c.boar_id == boars.c.id).where(
+        *selected(boars, selection)
+    ).order_by(*order, boars.c.id, statuses.c.start_on, statuses.c.id)
+
+
+def max_statuses_by_farm(selection: Selection) -> dict:
+    """農場ごとに1頭あたりの状態の最大件数を返す(農場ごとのシートの列数)
+
+    Args:
+        selection (Selection): 抽出条件
+
+    Returns:
+        dict: {農場ID: 最大件数}
+    """
+    boars, statuses = sources(selection)
+    counts = select(
+        boars.c.farm_id, func.count(statuses.c.id).label('count'),
+    ).outerjoin(statuses, statuses.c.boar_id == boars.c.id).where(
+        *selected(boars, selection)
+    ).group_by(boars.c.farm_id, boars.c.id).subquery()
+    query = select(counts.c.farm_id, func.max(counts.c.count)) \
+        .group_by(counts.c.farm_id)
+    with db.engine.connect() as connection, connection.begin():
+        return dict(connection.execute(query).all())
+
+
+def stream(query: Select) -> Iterator:
+    """クエリの結果をCHUNK_SIZE行ずつ読みながら1行ずつ返す
+
+    Args:
+        query (Select): クエリ
+
+    Yields:
+        Row: 1行
+    """
+    with db.engine.connect() as connection, connection.begin():
+        result = connection.execution_options(
+            stream_results=True, max_row_buffer=CHUNK_SIZE).execute(query)
+        for rows in result.partitions(CHUNK_SIZE):
+            yield from rows
+
+
+class SheetWriter:
+    """行数の上限を超えたら続きのシートに切り替えて書き込む"""
+
+    def __init__(self, wb: xl.Workbook, title: str, titles: list) -> None:
+        self.wb: xl.Workbook = wb
+        self.title: str = sheet_title(title)
+        self.titles: list = titles
+        self.sheets: int = 0
+        self.rows: int = MAX_ROWS
+
+    def append(self, values: list) -> None:
+        """1行書き込む
+
+        Args:
+            values (list): 値
+        """
+        if self.rows >= MAX_ROWS:
+            self.sheets += 1
+            title: str = self.title if self.sheets == 1 \
+                else sheet_title(f'{self.title[:26]}({self.sheets})')
+            self.ws = self.wb.create_sheet(title)
+            for col in range(len(self.titles)):
+                self.ws.column_dimensions[
+                    xl.utils.get_column_letter(col + 1)].width = 13
+            self.ws.append(header(self.ws, self.titles))
+            self.rows = 1
+        self.ws.append(values)
+        self.rows += 1
+
+
+def sheet_title(title: str) -> str:
+    """シート名に使えない文字を置き換え、31文字に切り詰める
+
+    Args:
+        title (str): シート名
+
+    Returns:
+        str: シート名
+    """
+    return re.sub(r'[\[\]:*?/\\]', '_', title)[:31]
+
+
+def header(ws: xl.worksheet, titles: list) -> list:
+    """見出しの行(水色の背景)を返す
+
+    Args:
+        ws (xl.worksheet): write_onlyのワークシート
+        titles (list): 見出し
+
+    Returns:
+        list: セル
+    """
+    cells: list = []
+    for title in titles:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.font = Font(name='Yu Gothic', size=12)
+        exporter.fill(cell, 'CCECFF')
+        cells.append(cell)
+    return cells
+
+
+def write_boars(wb: xl.Workbook, boars: pd.DataFrame) -> None:
+    """雄一覧のシートを書き込む
+
+    Args:
+        wb (xl.Workbook): write_onlyのワークブック
+        boars (pd.DataFrame): 選択した条件の雄一覧(boarsテーブルのカラム名)
+    """
+    renamed: pd.DataFrame = exporter.data_rename(boars)
+    writer = SheetWriter(wb, '雄一覧', list(renamed.columns))
+    for values in renamed.itertuples(index=False):
+        writer.append(list(values))
+
+
+def write_long(
+        wb: xl.Workbook, rows: Iterator, farms: dict, lines: dict) -> int:
+    """1行1状態のシートを書き込む
+
+    Args:
+        wb (xl.Workbook): write_onlyのワークブック
+        rows (Iterator): history_query(by_farm=False)の結果
+        farms (dict): 農場IDと農場名
+        lines (dict): 系統IDと系統(略)
+
+    Returns:
+        int: 書き込んだ行数
+    """
+    writer = SheetWriter(wb, '状態履歴', BOAR_TITLES + STATUS_TITLES)
+    count: int = 0
+    for row in rows:
+        writer.append([
+            farms.get(row.farm_id), row.tattoo, row.name,
+            lines.get(row.line_id), row.birth_on, row.culling_on,
+            row.start_on, row.status, row.reason])
+        count += 1
+    return count
+
+
+def write_farms(
+        wb: xl.Workbook, rows: Iterator, farms: dict, lines: dict,
+        widths: dict) -> int:
+    """農場ごとのシートに1行1頭で状態を古い順に横に並べて書き込む
+
+    Args:
+        wb (xl.Workbook): write_onlyのワークブック
+        rows (Iterator): history_query(by_farm=True)の結果
+        farms (dict): 農場IDと農場名
+        lines (dict): 系統IDと系統(略)
+        widths (dict): 農場IDと1頭あたりの状態の最大件数
+
+    Returns:
+        int: 書き込んだ状態の件数
+    """
+    writer: SheetWriter = None
+    current: tuple = None
+    boar: list = []
+    count: int = 0
+    for row in rows:
+        if (row.farm_id, row.boar_id) != current:
+            if current is not None:
+                writer.append(boar)
+            if current is None or row.farm_id != current[0]:
+                writer = SheetWriter(
+                    wb, farms.get(row.farm_id) or '農場未設定',
+                    BOAR_TITLES[1:]
+                    + STATUS_TITLES * widths.get(row.farm_id, 0))
+            current = (row.farm_id, row.boar_id)
+            boar = [row.tattoo, row.name, lines.get(row.line_id),
+                    row.birth_on, row.culling_on]
+        if row.status is not None:
+            boar += [row.start_on, row.status, row.reason]
+            count += 1
+    if current is not None:
+        writer.append(boar)
+    return count
+
+
+def build_workbook(
+        boars: pd.DataFrame, selection: Selection, mode: str,
+        file_name: str = None) -> str:
+    """雄一覧と状態の履歴のExcelファイルを作成してファイル名を返す
+
+    Args:
+        boars (pd.DataFrame): 選択した条件の雄一覧(boarsテーブルのカラム名)
+        selection (Selection): 抽出条件
+        mode (str): long(1行1状態) または farm(農場ごとのシート)
+        file_name (str, optional): 保存先. Defaults to 作成日時のファイル名.
+
+    Returns:
+        str: ファイル名
+    """
+    started: float = time.perf_counter()
+    farms: dict = dict(Farm.query.with_entities(Farm.id, Farm.name).all())
+    lines: dict = dict(Line.query.with_entities(
+        Line.id, Line.abbreviation).all())
+
+    wb: xl.Workbook = xl.Workbook(write_only=True)
+    write_boars(wb, boars)
+    if mode == 'farm':
+        widths: dict = max_statuses_by_farm(selection)
+        write_farms(
+            wb, stream(history_query(selection, by_farm=True)),
+            farms, lines, widths)
+    else:
+        write_long(
+            wb, stream(history_query(selection, by_farm=False)),
+            farms, lines)
+
+    file_name = file_name or exporter.download_name()
+    wb.save(file_name)
+    wb.close()
+    metrics.observe_export(
+        len(boars), file_name, time.perf_counter() - started)
+    return file_name
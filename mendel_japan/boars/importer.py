@@ -1,43 +1,82 @@
+import io
+import os
+import tempfile
+import time
+
+import openpyxl as xl
 import pandas as pd
-from config import engine
+import pyarrow.parquet as pq
 from flask import flash
-import re
+from sqlalchemy import select
+
+
+from mendel_japan import changes, db, metrics
+from mendel_japan.models import Boar, Line
+from mendel_japan.boars import archive
+from mendel_japan.boars.exporter import fill
 
 
-from mendel_japan.models import Line
+class ImportFormatError(Exception):
+    """アップロードファイルのレイアウトが対象外"""
 
 
-def import_boar_list(file_path: str, filename: str, farm_id: int) -> None:
+def import_boar_list(
+        file_path: str, filename: str, farm_id: int) -> io.BytesIO:
     """
-    アップロードしたExcelファイルのフォーマットをチェック
+    アップロードしたファイルのフォーマットをチェック
     データフレームに取り込みDB保存済みの雄との差を抽出(未登録の雄を抽出)
-    未登録のオスがいる場合、雄IDを再作成してboarsテーブルに取り込む
+    書き込む前に全ての行を検証し、問題がある場合は何も登録せず
+    行ごとのエラーを書き込んだExcelファイルを返す
+    未登録の雄がいる場合、雄IDを再作成して1つのトランザクションで
+    boarsテーブルに取り込む
     いない場合flashを表示
 
     Args:
         file_path (str): アップロードファイルのパス
         filename (str): アップロードファイルのファイル名
+        farm_id (int): 雄モデルを登録する農場のID
+
+    Raises:
+        ImportFormatError: 対象外のレイアウト
+
+    Returns:
+        io.BytesIO: エラーレポート(Excelファイル), 問題がない場合はNone
     """
-    df: pd.DataFrame = check_format(file_path)
+    with metrics.import_stage('check_format'):
+        df: pd.DataFrame = check_format(file_path)
+    metrics.IMPORT_ROWS.labels('parsed').inc(len(df))
+    known_lines: dict = line_ids()
+    with metrics.import_stage('validate'):
+        errors: pd.DataFrame = validate(df, known_lines)
+    if len(errors):
+        flash(f'{filename}に{len(errors)}件のエラーがありました。'
+              '登録せずにエラーレポートを返します。', 'error')
+        return error_report(df, errors)
+
     df_rename = df[~(df.tattoo.isin(already_registered().tattoo))]
-    if len(df_rename) > 1:
-        topigs_only = add_topigs_filter(df_rename)
-        boar_rename = rename_to_boar(topigs_only)
+    topigs_only = add_topigs_filter(df_rename)
+    if len(topigs_only):
+        with metrics.import_stage('rename_to_boar'):
+            boar_rename = rename_to_boar(topigs_only.copy(), known_lines)
         boar_rename['farm_id'] = farm_id
-        append_database(boar_rename)
+        with metrics.import_stage('append_database'):
+            append_database(boar_rename)
+        metrics.IMPORT_ROWS.labels('inserted').inc(len(boar_rename))
     else:
         flash(f'{filename}に未登録の雄はいませんでした。', 'error')
+    return None
 
 
 def already_registered() -> pd.DataFrame:
     """
-    boarsテーブルから登録済みの雄一覧を抽出して返す
+    boarsテーブル(アーカイブを含む)から登録済みの雄一覧を抽出して返す
 
     Returns:
         pd.DataFrame: boarsテーブルに登録済みの雄
     """
     columns = ['tattoo', 'name', 'line_id', 'birth_on']
-    return pd.read_sql('boars', engine, columns=columns)
+    source = archive.all_boars()
+    return pd.read_sql(select(*[source.c[x] for x in columns]), db.engine)
 
 
 def change_columns_title() -> dict:
@@ -66,87 +105,322 @@ def check_format(file_path: str) -> pd.DataFrame:
     アップロードファイルから雄情報を取り出し
     ブリーディングWebのファイルは2行目にタイトルなので調整
     columnタイトルをテーブルにあわせて返す
+    indexはExcelの行番号にする(エラーレポート用)
+
+    ・Excel(xlsx, xlsm, xls), CSV, Parquetに対応
+    ・CSV, ParquetはExcelと同じcolumnタイトルで、1行目がタイトル
 
     Args:
         file_path (str): アップロードファイルのパス
 
+    Raises:
+        ImportFormatError: どちらのレイアウトにも当てはまらない
+
     Returns:
         pd.DataFrame: アップロードファイルから取り出した雄
     """
-    top_cell_value: str = pd.read_excel(file_path).columns.values[0]
-    print('**********************')
-    print(top_cell_value)
     columns = ['tattoo', 'name', '系統', 'birth_on', 'culling_on']
-    if 'Applied filters' in top_cell_value:
-        return pd.read_excel(file_path, header=2) \
-            .rename(columns=change_columns_title()) \
-            .query('tattoo == tattoo')[columns]
+    extension: str = file_path.rsplit('.', 1)[-1].lower()
+    if extension == 'parquet':
+        header: int = 0
+        df: pd.DataFrame = read_parquet(file_path)
+    else:
+        read = read_csv if extension == 'csv' else read_excel
+        top_cell_value = read(file_path, nrows=0).columns.values[0]
+        if 'Applied filters' in str(top_cell_value):
+            header = 2
+        elif top_cell_value == 'タトゥー':
+            header = 0
+        else:
+            raise ImportFormatError(
+                f'対象外のレイアウトです(1行目の左端: {top_cell_value})')
+        df = read(file_path, header=header, usecols=source_columns)
+
+    df = df.rename(columns=change_columns_title())
+    missing: list = [x for x in columns if x not in df.columns]
+    if missing:
+        raise ImportFormatError(f'必要な列がありません: {missing}')
+    df.index = df.index + header + 2
+    if header:
+        df = df[df.tattoo.notna()]
+    return df[columns]
+
+
+def source_columns(column: str) -> bool:
+    """アップロードファイルの列のうち、取り込みに使う列か判定する
+
+    Args:
+        column (str): アップロードファイルのcolumnタイトル
+
+    Returns:
+        bool: change_columns_titleに含まれる
+    """
+    return column in change_columns_title()
 
-    elif top_cell_value == 'タトゥー':
-        return pd.read_excel(file_path) \
-            .rename(columns=change_columns_title())
 
+def source_dtypes() -> dict:
+    """アップロードファイルの文字列の列の型を返す(日付はvalidateで変換)
 
-def rename_to_boar(df: pd.DataFrame) -> pd.DataFrame:
+    Returns:
+        dict: columnタイトルと型
     """
-    DB取り込み予定の雄の雄IDを変更
-    デュロック: タトゥーのアルファベット2文字を削除
-    トピッグス: タトゥー数字の前に系統ごとのアルファベット2文字をつける
+    return {k: 'string' for k, v in change_columns_title().items()
+            if v in ('tattoo', 'name', '系統')}
+
+
+def read_excel(file_path: str, **kwargs) -> pd.DataFrame:
+    """Excelファイルを読み込む
 
     Args:
-        df (pd.DataFrame): DB取り込み予定の雄
+        file_path (str): アップロードファイルのパス
+        **kwargs: pd.read_excelの引数
 
     Returns:
-        pd.DataFrame: 雄IDを変更した雄
+        pd.DataFrame: ファイルの内容
     """
-    df.loc[df['系統'] == 'MMMM', 'name'] = \
-        df['tattoo'].replace({'UR': '', 'EN': ''}, regex=True)
+    return pd.read_excel(file_path, dtype=source_dtypes(), **kwargs)
 
-    df.loc[df['系統'] != 'MMMM', 'name'] = df.apply(
-        lambda x: line_to_head(x.系統) + re.sub(r"\D", '', x.tattoo), axis=1)
 
-    df.loc[:, 'line_id'] = df.apply(lambda x: lines(x.系統), axis=1)
-    return df.drop('系統', axis=1)
+def read_csv(file_path: str, **kwargs) -> pd.DataFrame:
+    """CSVファイル(UTF-8, BOM付きも可)をCエンジンで読み込む
+
+    Args:
+        file_path (str): アップロードファイルのパス
+        **kwargs: pd.read_csvの引数
+
+    Returns:
+        pd.DataFrame: ファイルの内容
+    """
+    return pd.read_csv(
+        file_path, engine='c', encoding='utf-8-sig', dtype=source_dtypes(),
+        **kwargs)
+
+
+def read_parquet(file_path: str) -> pd.DataFrame:
+    """Parquetファイルから取り込みに使う列だけを読み込む
+
+    Args:
+        file_path (str): アップロードファイルのパス
+
+    Returns:
+        pd.DataFrame: ファイルの内容
+    """
+    names: list = [x for x in pq.read_schema(file_path).names
+                   if source_columns(x)]
+    return pd.read_parquet(file_path, columns=names) \
+        .astype({k: v for k, v in source_dtypes().items() if k in names})
 
 
-def line_to_head(line: str) -> str:
+def validate(df: pd.DataFrame, known_lines: dict) -> pd.DataFrame:
     """
-    トピッグスの系統から雄IDの頭につくアルファベットを返す
+    取り込み予定の全ての行を列単位の条件で検証し、違反を全て返す
+
+    ・タトゥー: 必須, 50文字以内, ファイル内で重複しない
+    ・系統: linesテーブルに登録済み
+    ・生年月日・淘汰日: 日付として読める, 淘汰日が生年月日より前でない
+    ・雄ID(作成後): 50文字以内
 
     Args:
-        line (str): 系統
+        df (pd.DataFrame): check_formatの戻り値
+        known_lines (dict): 系統(アルファベット4文字)と系統モデルID
 
     Returns:
-        str: 雄IDの頭につくアルファベット2文字
+        pd.DataFrame: 行(Excelの行番号), 項目, 内容
+    """
+    max_length: int = Boar.__table__.c.tattoo.type.length
+    tattoo: pd.Series = df.tattoo.astype('string').str.strip()
+    birth_on = pd.to_datetime(df.birth_on, errors='coerce')
+    culling_on = pd.to_datetime(df.culling_on, errors='coerce')
+    name: pd.Series = make_names(df.assign(tattoo=tattoo.fillna('')))
+
+    rules: list = [
+        ('タトゥー', tattoo.isna() | (tattoo == ''), '必須です'),
+        ('タトゥー', tattoo.str.len() > max_length,
+         f'{max_length}文字以内にしてください'),
+        ('タトゥー', tattoo.notna() & tattoo.duplicated(keep=False),
+         'ファイル内で重複しています'),
+        ('系統', ~df['系統'].isin(known_lines.keys()),
+         '登録されていない系統です'),
+        ('生年月日', df.birth_on.notna() & birth_on.isna(),
+         '日付として読めません'),
+        ('淘汰日', df.culling_on.notna() & culling_on.isna(),
+         '日付として読めません'),
+        ('淘汰日', culling_on < birth_on, '生年月日より前です'),
+        ('雄ID', name.str.len() > max_length,
+         f'{max_length}文字以内にしてください'),
+    ]
+    errors: list = [
+        pd.DataFrame({'行': df.index[mask.fillna(False).to_numpy(bool)],
+                      '項目': column, '内容': message})
+        for column, mask, message in rules
+    ]
+    return pd.concat(errors, ignore_index=True) \
+        .sort_values(['行', '項目'], kind='stable', ignore_index=True)
+
+
+def error_report(df: pd.DataFrame, errors: pd.DataFrame) -> io.BytesIO:
     """
-    line_to_name: dict = {'LLLL': 'LL', 'NNNN': 'TL', 'ZZZZ': 'TW', 'MMMM': ''}
-    return line_to_name[line]
+    アップロードファイルの内容に行ごとのエラーを書き加えたExcelファイルを作る
 
+    ・1枚目: 取り込み予定の行とエラー内容(エラーのある行は黄色)
+    ・2枚目: エラーの一覧
 
-def lines(line: str) -> int:
-    """該当の系統名のidを返す
+    Args:
+        df (pd.DataFrame): check_formatの戻り値
+        errors (pd.DataFrame): validateの戻り値
+
+    Returns:
+        io.BytesIO: Excelファイル
+    """
+    messages: pd.Series = (errors['項目'] + ': ' + errors['内容']) \
+        .groupby(errors['行']).agg(' / '.join)
+    annotated: pd.DataFrame = df.rename(
+        columns={v: k for k, v in change_columns_title().items()
+                 if not k.isascii()})
+    annotated.insert(0, '行', df.index)
+    annotated['エラー'] = messages.reindex(df.index).to_numpy()
+
+    wb: xl.Workbook = xl.Workbook()
+    ws = wb.active
+    ws.title = '取り込み内容'
+    ws.append(list(annotated.columns))
+    for values in annotated.astype(object).where(
+            annotated.notna(), None).itertuples(index=False):
+        ws.append([str(x) if isinstance(x, pd.Timestamp) else x
+                   for x in values])
+        if values[-1]:
+            for cell in ws[ws.max_row]:
+                fill(cell, 'FFFF99')
+
+    ws_errors = wb.create_sheet('エラー一覧')
+    ws_errors.append(list(errors.columns))
+    for values in errors.itertuples(index=False):
+        ws_errors.append(list(values))
+
+    report = io.BytesIO()
+    wb.save(report)
+    wb.close()
+    report.seek(0)
+    return report
+
+
+def make_names(df: pd.DataFrame) -> pd.Series:
+    """
+    タトゥーと系統から雄IDを作る
+    デュロック: タトゥーのアルファベット2文字を削除
+    トピッグス: タトゥー数字の前に系統ごとのアルファベット2文字をつける
 
     Args:
-        line (str): 系統(アルファベット4文字)
+        df (pd.DataFrame): tattoo, 系統を持つデータフレーム
+
+    Returns:
+        pd.Series: 雄ID
+    """
+    tattoo: pd.Series = df['tattoo'].astype(str)
+    duroc: pd.Series = tattoo.str.replace('UR|EN', '', regex=True)
+    topigs: pd.Series = df['系統'].map(line_to_head_table()).fillna('') \
+        + tattoo.str.replace(r'\D', '', regex=True)
+    return duroc.where(df['系統'] == 'MMMM', topigs)
+
+
+def rename_to_boar(df: pd.DataFrame, known_lines: dict) -> pd.DataFrame:
+    """
+    DB取り込み予定の雄の雄IDを変更し、系統を系統モデルIDに変換する
+
+    Args:
+        df (pd.DataFrame): DB取り込み予定の雄
+        known_lines (dict): 系統(アルファベット4文字)と系統モデルID
+
+    Returns:
+        pd.DataFrame: 雄IDを変更した雄
+    """
+    df.loc[:, 'name'] = make_names(df)
+    df.loc[:, 'line_id'] = df['系統'].map(known_lines)
+    return df.drop('系統', axis=1)
+
+
+def line_to_head_table() -> dict:
+    """
+    トピッグスの系統と雄IDの頭につくアルファベットの対応を返す
 
     Returns:
-        int: 系統モデルのインデックス番号
+        dict: 系統と雄IDの頭につくアルファベット2文字
     """
-    return Line.query.filter(Line.line == line).first().id
+    return {'LLLL': 'LL', 'NNNN': 'TL', 'ZZZZ': 'TW', 'MMMM': ''}
+
+
+def line_ids() -> dict:
+    """系統名(アルファベット4文字)と系統モデルIDの対応を1回のクエリで返す
+
+    Returns:
+        dict: 系統と系統モデルID
+    """
+    return dict(Line.query.with_entities(Line.line, Line.id)
+                .filter(Line.line.isnot(None)).all())
 
 
 def append_database(df: pd.DataFrame) -> None:
     """
-    各処理が終わったデータフレームをboarsテーブルに取り込み
+    各処理が終わったデータフレームを1つのトランザクションで
+    boarsテーブルに取り込み、変更履歴を記録
     取り込み完了後flashを表示
 
     Args:
-        df (pd.DataFrame): [description]
+        df (pd.DataFrame): 取り込む雄
     """
-    df.to_sql('boars', engine, index=False, if_exists='append')
+    records: pd.DataFrame = df.assign(
+        birth_on=pd.to_datetime(df.birth_on, errors='coerce').dt.date,
+        culling_on=pd.to_datetime(df.culling_on, errors='coerce').dt.date,
+    )
+    records = records.astype(object).where(records.notna(), None)
+    with db.engine.begin() as con:
+        con.execute(Boar.__table__.insert(), records.to_dict('records'))
+        tattoos: list = records.tattoo.tolist()
+        inserted: list = []
+        for start in range(0, len(tattoos), changes.CHUNK_SIZE):
+            inserted += con.execute(select(Boar.id).where(Boar.tattoo.in_(
+                tattoos[start:start + changes.CHUNK_SIZE]))).scalars().all()
+        changes.record(con, 'boar', 'insert', inserted)
     flash(f'{len(df)}頭追加しました。')
 
 
 def add_topigs_filter(df):
     topigs_lines = ['LLLL', 'NNNN', 'ZZZZ']
     return df[df['系統'].isin(topigs_lines)]
+
+
+def benchmark(rows: int) -> list:
+    """同じ内容のxlsx, csv, parquetファイルの読み込み・検証の時間を計測する
+
+    Args:
+        rows (int): 雄の頭数(行数)
+
+    Returns:
+        list: (拡張子, 読み込み秒, 検証秒)のリスト
+    """
+    lines: list = ['LLLL', 'NNNN', 'ZZZZ', 'MMMM']
+    df: pd.DataFrame = pd.DataFrame({
+        'タトゥー': [f'NN{i:07d}' for i in range(rows)],
+        '雄ID': '',
+        '系統': [lines[i % len(lines)] for i in range(rows)],
+        '生年月日': pd.Timestamp('2022-04-01').date(),
+        '淘汰日': None,
+    })
+    known_lines: dict = line_ids()
+    results: list = []
+    with tempfile.TemporaryDirectory() as folder:
+        writers: dict = {
+            'xlsx': lambda path: df.to_excel(path, index=False),
+            'csv': lambda path: df.to_csv(path, index=False),
+            'parquet': lambda path: df.to_parquet(path, index=False),
+        }
+        for extension, write in writers.items():
+            path: str = os.path.join(folder, f'benchmark.{extension}')
+            write(path)
+            start: float = time.perf_counter()
+            uploaded: pd.DataFrame = check_format(path)
+            parsed: float = time.perf_counter()
+            validate(uploaded, known_lines)
+            results.append((
+                extension, parsed - start, time.perf_counter() - parsed))
+    return results
@@ -0,0 +1,518 @@
+"""雄一覧のスナップショット(ワーカーごとのメモリ上の列データ)
+
+・全ての雄(アーカイブを含む)を列ごとのNumPy配列で保持する
+    ・ID, 農場ID, 系統ID, 生年月日, 淘汰日, 更新日時
+    ・最新の状態(状態の文字列表へのコード)と設定日, 状態の件数と最新の更新日時
+    ・タトゥー・雄IDの文字列はintern
+・雄一覧の表示とダウンロードの抽出条件は、この配列の演算だけで絞り込む
+・データのバージョン(versioning.data_version)が変わったときだけ更新する
+    ・前回読み込んだ後の変更履歴(changes.idがカーソルより後)の雄・状態だけを
+      読み込んで差し替える(changes.idはcommitの順に振るので取りこぼさない)
+    ・次の場合は全て読み直す
+        ・変更履歴が多すぎる、またはカーソルより後の履歴が削除されている
+        ・状態の削除(履歴から雄がわからない)
+        ・差し替えた後の件数がバージョンの件数と合わない(アーカイブへの移動)
+・農場・系統・AIセンターの対応表も一緒に保持し、変わったときは全て読み直す
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sys
+import threading
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Table, false, func, select
+
+from mendel_japan import db
+from mendel_japan.models import (
+    AiStation, ArchivedBoar, Boar, Change, Farm, Line)
+from mendel_japan.versioning import DataVersion, data_version
+from mendel_japan.boars import archive
+from mendel_japan.boars.selection import Selection
+
+
+BOAR_COLUMNS: list = [
+    'id', 'tattoo', 'name', 'birth_on', 'culling_on', 'farm_id', 'line_id',
+    'updated_at']
+EXPORT_COLUMNS: list = [
+    'id', 'tattoo', 'name', 'birth_on', 'culling_on', 'farm_id', 'line_id']
+CHUNK_SIZE: int = 500
+# 差し替えで読む変更履歴の上限(これより多い場合は全て読み直す)
+REFRESH_LIMIT: int = 5000
+
+
+class Masters(NamedTuple):
+    """農場・系統・AIセンターの対応表
+
+    Attributes:
+        farm_stations (dict): 農場ID → AIセンターID
+        farm_ids (dict): 農場(略) → 農場ID
+        line_ids (dict): 系統(略) → 系統ID
+        line_codes (dict): 系統ID → 系統コード
+        station_names (dict): AIセンターID → AIセンター名
+    """
+    farm_stations: dict
+    farm_ids: dict
+    line_ids: dict
+    line_codes: dict
+    station_names: dict
+
+    @property
+    def fingerprint(self) -> str:
+        """対応表の内容から作るバージョン
+
+        Returns:
+            str: 農場・系統・AIセンターのどれかが変わると変わる文字列
+        """
+        source: str = repr([sorted(x.items(), key=repr) for x in self])
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+class Roster(NamedTuple):
+    """雄一覧のスナップショット(列ごとの配列, 雄ID順)
+
+    Attributes:
+        id (np.ndarray): 雄ID, int64
+        tattoo (np.ndarray): タトゥー, object
+        name (np.ndarray): 雄ID(名前), object
+        birth_on (np.ndarray): 生年月日, datetime64[D], 未入力はNaT
+        culling_on (np.ndarray): 淘汰日, datetime64[D], 在籍中はNaT
+        farm_id (np.ndarray): 農場ID, 未設定は-1
+        line_id (np.ndarray): 系統ID, 未設定は-1
+        updated_at (np.ndarray): 雄の更新日時, datetime64[us]
+        archived (np.ndarray): アーカイブの雄か, bool
+        status_code (np.ndarray): 最新の状態(statusesの位置), なしは-1
+        status_on (np.ndarray): 最新の状態の設定日, datetime64[D]
+        status_count (np.ndarray): 状態の件数, int64
+        status_updated_at (np.ndarray): 状態の最新の更新日時, datetime64[us]
+        statuses (tuple): 状態の文字列表
+    """
+    id: np.ndarray
+    tattoo: np.ndarray
+    name: np.ndarray
+    birth_on: np.ndarray
+    culling_on: np.ndarray
+    farm_id: np.ndarray
+    line_id: np.ndarray
+    updated_at: np.ndarray
+    archived: np.ndarray
+    status_code: np.ndarray
+    status_on: np.ndarray
+    status_count: np.ndarray
+    status_updated_at: np.ndarray
+    statuses: tuple
+
+
+_lock = threading.Lock()
+_cache: dict = {
+    'version': None, 'change_id': None, 'masters': None, 'roster': None}
+
+
+def load_masters() -> Masters:
+    """農場・系統・AIセンターの対応表を読み込む
+
+    Returns:
+        Masters: 対応表
+    """
+    farms: list = db.session.execute(select(
+        Farm.id, Farm.abbreviation, Farm.ai_station_id)).all()
+    lines: list = db.session.execute(select(
+        Line.id, Line.abbreviation, Line.code)).all()
+    stations: list = db.session.execute(select(
+        AiStation.id, AiStation.name)).all()
+    return Masters(
+        farm_stations={x.id: x.ai_station_id for x in farms},
+        farm_ids={x.abbreviation: x.id for x in farms},
+        line_ids={x.abbreviation: x.id for x in lines},
+        line_codes={x.id: x.code for x in lines},
+        station_names={x.id: x.name for x in stations},
+    )
+
+
+def read_boars(table: Table, ids: list = None) -> pd.DataFrame:
+    """雄を読み込む
+
+    Args:
+        table (Table): boars または archived_boars
+        ids (list, optional): 雄ID. Defaults to None(全て).
+
+    Returns:
+        pd.DataFrame: BOAR_COLUMNSとarchived
+    """
+    query = select(*[table.c[x] for x in BOAR_COLUMNS])
+    if ids is None:
+        frames: list = [pd.read_sql(query, con=db.engine)]
+    else:
+        frames = [
+            pd.read_sql(query.where(
+                table.c.id.in_(ids[start:start + CHUNK_SIZE])), con=db.engine)
+            for start in range(0, len(ids), CHUNK_SIZE)]
+    boars: pd.DataFrame = pd.concat(frames, ignore_index=True) \
+        if frames else pd.DataFrame(columns=BOAR_COLUMNS)
+    boars['archived'] = table is ArchivedBoar.__table__
+    return boars
+
+
+def read_status_summary(ids: list = None) -> pd.DataFrame:
+    """雄ごとの状態の件数・最新の更新日時・最新の状態を読み込む
+
+    ・最新の状態は設定日が最も新しいもの(同じ日は後に登録したもの)
+
+    Args:
+        ids (list, optional): 雄ID. Defaults to None(全て).
+
+    Returns:
+        pd.DataFrame: boar_idをインデックスとした
+            status_count, status_updated_at, status, status_on
+    """
+    source = archive.all_statuses()
+    query = select(
+        source.c.boar_id, source.c.id, source.c.status, source.c.start_on,
+        source.c.updated_at)
+    if ids is None:
+        statuses: pd.DataFrame = pd.read_sql(query, con=db.engine)
+    else:
+        statuses = pd.concat([
+            pd.read_sql(query.where(
+                source.c.boar_id.in_(ids[start:start + CHUNK_SIZE])),
+                con=db.engine)
+            for start in range(0, len(ids), CHUNK_SIZE)
+        ] or [pd.read_sql(query.where(false()), con=db.engine)],
+            ignore_index=True)
+    # 該当する状態がない場合も、雄IDを数値のインデックスにする
+    statuses['boar_id'] = pd.to_numeric(statuses.boar_id)
+    statuses['start_on'] = pd.to_datetime(statuses.start_on, errors='coerce')
+    statuses['updated_at'] = pd.to_datetime(
+        statuses.updated_at, errors='coerce')
+    grouped = statuses.groupby('boar_id')
+    summary = pd.DataFrame({
+        'status_count': grouped.size(),
+        'status_updated_at': grouped.updated_at.max(),
+    })
+    latest: pd.DataFrame = statuses[statuses.start_on.notna()] \
+        .sort_values(['boar_id', 'start_on', 'id']) \
+        .drop_duplicates('boar_id', keep='last').set_index('boar_id')
+    summary['status'] = latest.status
+    summary['status_on'] = latest.start_on
+    return summary
+
+
+def build_roster(boars: pd.DataFrame, summary: pd.DataFrame) -> Roster:
+    """雄と状態の集計から配列を作る
+
+    Args:
+        boars (pd.DataFrame): read_boarsの結果
+        summary (pd.DataFrame): read_status_summaryの結果
+
+    Returns:
+        Roster: スナップショット
+    """
+    frame: pd.DataFrame = boars.drop(
+        columns=[x for x in summary.columns if x in boars.columns]) \
+        .join(summary, on='id').sort_values('id', ignore_index=True)
+
+    def to_days(column: pd.Series) -> np.ndarray:
+        return pd.to_datetime(column, errors='coerce') \
+            .to_numpy(dtype='datetime64[D]')
+
+    def to_times(column: pd.Series) -> np.ndarray:
+        return pd.to_datetime(column, errors='coerce') \
+            .to_numpy(dtype='datetime64[us]')
+
+    def to_ids(column: pd.Series) -> np.ndarray:
+        return pd.to_numeric(column, errors='coerce') \
+            .fillna(-1).to_numpy(dtype=np.int64)
+
+    def to_strings(column: pd.Series) -> np.ndarray:
+        return np.array(
+            [sys.intern(x) if isinstance(x, str) else x for x in column],
+            dtype=object)
+
+    codes, statuses = pd.factorize(frame.status)
+    return Roster(
+        id=frame.id.to_numpy(dtype=np.int64),
+        tattoo=to_strings(frame.tattoo),
+        name=to_strings(frame.name),
+        birth_on=to_days(frame.birth_on),
+        culling_on=to_days(frame.culling_on),
+        farm_id=to_ids(frame.farm_id),
+        line_id=to_ids(frame.line_id),
+        updated_at=to_times(frame.updated_at),
+        archived=frame.archived.to_numpy(dtype=bool),
+        status_code=codes.astype(np.int32),
+        status_on=to_days(frame.status_on),
+        status_count=frame.status_count.fillna(0).to_numpy(dtype=np.int64),
+        status_updated_at=to_times(frame.status_updated_at),
+        statuses=tuple(statuses),
+    )
+
+
+def to_frame(roster: Roster) -> pd.DataFrame:
+    """スナップショットをbuild_rosterに渡せる形に戻す
+
+    Args:
+        roster (Roster): スナップショット
+
+    Returns:
+        pd.DataFrame: 雄とstatus_count, status_updated_at, status, status_on
+    """
+    statuses = np.array(roster.statuses + (None,), dtype=object)
+    return pd.DataFrame({
+        'id': roster.id,
+        'tattoo': roster.tattoo,
+        'name': roster.name,
+        'birth_on': roster.birth_on,
+        'culling_on': roster.culling_on,
+        'farm_id': roster.farm_id,
+        'line_id': roster.line_id,
+        'updated_at': roster.updated_at,
+        'archived': roster.archived,
+        'status': statuses[roster.status_code],
+        'status_on': roster.status_on,
+        'status_count': roster.status_count,
+        'status_updated_at': roster.status_updated_at,
+    })
+
+
+def load_roster() -> Roster:
+    """全ての雄を読み込む
+
+    Returns:
+        Roster: スナップショット
+    """
+    boars: pd.DataFrame = pd.concat([
+        read_boars(Boar.__table__), read_boars(ArchivedBoar.__table__)],
+        ignore_index=True)
+    return build_roster(boars, read_status_summary())
+
+
+def changed_boar_ids(since: int) -> list:
+    """カーソルより後の変更履歴から、読み直す雄IDを返す
+
+    Args:
+        since (int): 前回読み込んだときの最後の変更履歴ID
+
+    Returns:
+        list: 雄ID, 変更履歴から雄がわからない場合はNone
+    """
+    since = since or 0
+    first = db.session.execute(select(func.min(Change.id))).scalar()
+    if first is not None and first > since + 1:
+        return None
+    changes: list = db.session.execute(
+        select(Change.entity, Change.entity_id, Change.payload)
+        .where(Change.id > since).order_by(Change.id)
+        .limit(REFRESH_LIMIT + 1)).all()
+    if len(changes) > REFRESH_LIMIT:
+        return None
+
+    ids: set = set()
+    for change in changes:
+        if change.entity == 'boar':
+            ids.add(change.entity_id)
+        elif change.payload:
+            ids.add(json.loads(change.payload)['boar_id'])
+        else:
+            return None
+    return sorted(x for x in ids if x is not None)
+
+
+def refresh_roster(
+        roster: Roster, since: int, version: DataVersion) -> Roster:
+    """前回読み込んだ後に変更された雄・状態だけを読み込んで差し替える
+
+    Args:
+        roster (Roster): 前回のスナップショット
+        since (int): 前回読み込んだときの最後の変更履歴ID
+        version (DataVersion): 現在のデータのバージョン
+
+    Returns:
+        Roster: スナップショット, 差し替えられない場合は全て読み直したもの
+    """
+    ids: list = changed_boar_ids(since)
+    if ids is None:
+        return load_roster()
+
+    frame: pd.DataFrame = to_frame(roster)
+    kept: pd.DataFrame = frame[~frame.id.isin(ids)]
+    boars: pd.DataFrame = read_boars(Boar.__table__, ids)
+    # 配列から戻した列(datetime64)とdateが混ざらないように揃える
+    for column in ('birth_on', 'culling_on', 'updated_at'):
+        boars[column] = pd.to_datetime(boars[column], errors='coerce')
+    refreshed: Roster = build_roster(
+        pd.concat([kept, boars], ignore_index=True),
+        pd.concat([
+            kept.set_index('id')[
+                ['status_count', 'status_updated_at', 'status', 'status_on']],
+            read_status_summary(ids),
+        ]))
+    hot = ~refreshed.archived
+    if (int(hot.sum()), int(refreshed.status_count[hot].sum())) \
+            != tuple(version.counts):
+        return load_roster()
+    return refreshed
+
+
+def current(version: DataVersion = None, masters: Masters = None) -> tuple:
+    """現在のデータのスナップショットと対応表を返す
+
+    バージョンと対応表が前回と同じ場合はメモリ上の配列をそのまま返す
+
+    Args:
+        version (DataVersion, optional): 呼び出し側で取得した全ての雄の
+            バージョン(data_version()). Defaults to None(ここで取得する).
+        masters (Masters, optional): 呼び出し側で読み込んだ対応表.
+            Defaults to None(ここで読み込む).
+
+    Returns:
+        tuple: (Roster, Masters)
+    """
+    if version is None:
+        version = data_version()
+    if masters is None:
+        masters = load_masters()
+    with _lock:
+        if _cache['roster'] is None or _cache['masters'] != masters:
+            _cache['roster'] = load_roster()
+        elif _cache['version'] != version.token:
+            _cache['roster'] = refresh_roster(
+                _cache['roster'], _cache['change_id'], version)
+        _cache['version'] = version.token
+        _cache['change_id'] = version.change_id
+        _cache['masters'] = masters
+        return _cache['roster'], masters
+
+
+def station_mask(
+        roster: Roster, masters: Masters, ai_station_id: int) -> np.ndarray:
+    """AIセンター管轄の農場の雄を選ぶ(scope.boar_criteriaと同じ条件)
+
+    Args:
+        roster (Roster): スナップショット
+        masters (Masters): 対応表
+        ai_station_id (int): AIセンターID, Noneの場合は全ての雄
+
+    Returns:
+        np.ndarray: 対象の雄はTrue
+    """
+    if ai_station_id is None:
+        return np.ones(len(roster.id), dtype=bool)
+    farm_ids: list = [
+        farm_id for farm_id, station_id in masters.farm_stations.items()
+        if station_id == ai_station_id]
+    return np.isin(roster.farm_id, farm_ids)
+
+
+def selection_mask(
+        roster: Roster, masters: Masters, selection: Selection) -> np.ndarray:
+    """ダウンロードの抽出条件に合う雄を選ぶ
+
+    Args:
+        roster (Roster): スナップショット
+        masters (Masters): 対応表
+        selection (Selection): 抽出条件
+
+    Returns:
+        np.ndarray: 対象の雄はTrue
+    """
+    line_ids: list = [
+        masters.line_ids[x] for x in selection.lines if x in masters.line_ids]
+    farm_ids: list = [
+        masters.farm_ids[x] for x in selection.farms if x in masters.farm_ids]
+    mask: np.ndarray = np.isin(roster.line_id, line_ids) \
+        & np.isin(roster.farm_id, farm_ids)
+    if selection.enrollment_status == 'alive_only':
+        mask &= np.isnat(roster.culling_on)
+    elif selection.enrollment_status == 'culled_only':
+        mask &= ~np.isnat(roster.culling_on)
+    return mask
+
+
+def frame(roster: Roster, mask: np.ndarray) -> pd.DataFrame:
+    """選んだ雄をboarsテーブルのカラム名のデータフレームにする(雄ID順)
+
+    Args:
+        roster (Roster): スナップショット
+        mask (np.ndarray): 対象の雄はTrue
+
+    Returns:
+        pd.DataFrame: EXPORT_COLUMNSの雄一覧(日付はdate, 未設定はNone)
+    """
+    def ids(column: np.ndarray) -> pd.Series:
+        return pd.Series(column[mask]).replace(-1, None)
+
+    return pd.DataFrame({
+        'id': roster.id[mask],
+        'tattoo': roster.tattoo[mask],
+        'name': roster.name[mask],
+        'birth_on': roster.birth_on[mask].astype(object),
+        'culling_on': roster.culling_on[mask].astype(object),
+        'farm_id': ids(roster.farm_id),
+        'line_id': ids(roster.line_id),
+    }, columns=EXPORT_COLUMNS)
+
+
+def select_boars(selection: Selection) -> pd.DataFrame:
+    """ダウンロードの抽出条件に合う雄一覧を返す
+
+    Args:
+        selection (Selection): 抽出条件
+
+    Returns:
+        pd.DataFrame: boarsテーブルのカラム名の雄一覧
+    """
+    roster, masters = current()
+    return frame(roster, selection_mask(roster, masters, selection))
+
+
+def row_versions(
+        roster: Roster, masters: Masters, indices: np.ndarray) -> list:
+    """行のHTMLキャッシュ用のバージョンを返す
+
+    ・行に表示するAIセンター名・系統コードが変わった場合も変わるように、
+      対応表のfingerprintを含める
+
+    Args:
+        roster (Roster): スナップショット
+        masters (Masters): 対応表
+        indices (np.ndarray): 表示する雄の位置
+
+    Returns:
+        list: (雄ID, 行のバージョン)のリスト
+    """
+    fingerprint: str = masters.fingerprint
+    return [
+        (int(roster.id[i]),
+         f'{fingerprint}/{roster.updated_at[i]}/{roster.status_count[i]}/'
+         f'{roster.status_updated_at[i]}')
+        for i in indices]
+
+
+def row_values(roster: Roster, masters: Masters, index: int) -> dict:
+    """雄一覧の1行に表示する値を返す
+
+    Args:
+        roster (Roster): スナップショット
+        masters (Masters): 対応表
+        index (int): 雄の位置
+
+    Returns:
+        dict: id, station, name, line_code, status, status_on, culling_on
+    """
+    def day(value: np.datetime64):
+        return None if np.isnat(value) else value.item()
+
+    code: int = int(roster.status_code[index])
+    station_id = masters.farm_stations.get(int(roster.farm_id[index]))
+    return {
+        'id': int(roster.id[index]),
+        'station': masters.station_names.get(station_id),
+        'name': roster.name[index],
+        'line_code': masters.line_codes.get(int(roster.line_id[index])),
+        'status': roster.statuses[code] if code >= 0 else None,
+        'status_on': day(roster.status_on[index]),
+        'culling_on': day(roster.culling_on[index]),
+    }
@@ -1,27 +1,33 @@
 from __future__ import annotations
 from flask import (
-    Blueprint, render_template, flash, redirect, url_for, request, wrappers)
+    Blueprint, render_template, flash, redirect, url_for, request, wrappers,
+    jsonify, make_response, abort)
 from flask import current_app as app
-from flask_assets import Bundle, Environment
+from flask import send_file
 from flask_login import login_required, current_user
-import flask_sqlalchemy
 
 
+import click
+import io
 import os
-from typing import TypeVar
+import numpy as np
+from datetime import date, timedelta
+from typing import BinaryIO, TypeVar
 from werkzeug.utils import secure_filename
-from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 
 
-from mendel_japan import db, ALLOWED_EXTENSIONS, UPLOAD_FOLDER
-from mendel_japan.models import Boar, Farm, Line, Status
-from mendel_japan.boars import exporter, forms, importer
+from mendel_japan import (
+    db, changes, scope, ALLOWED_EXTENSIONS, UPLOAD_FOLDER)
+from mendel_japan.versioning import DataVersion, conditional, data_version
+from mendel_japan.models import ArchivedBoar, Boar, Status
+from mendel_japan.boars import (
+    analytics, archive, asof, bulk, exporter, forms, fragments, history,
+    importer, roster, snapshots)
+from mendel_japan.boars.selection import Selection
 
 
 boars = Blueprint('boars', __name__,)
-js = Bundle('javascript/boars.js', output='javascript/main.js')
-assets = Environment(app)
-assets.register('main_js', js)
 
 FileObject = TypeVar('FileObject')
 
@@ -31,17 +37,37 @@ FileObject = TypeVar('FileObject')
 def index() -> str:
     """登録済みの雄一覧を表示
 
-    ・ログイン中のユーザーが所属しているAIセンター管轄の農場をリストに格納
-    ・農場リストを農場IDリストに変換
-    ・管轄農場に所属している雄を全て取得
-    ・雄一覧ページを表示
+    ・ログイン中のユーザーが所属しているAIセンター管轄の農場の
+      在籍中の雄をスナップショット(roster)から絞り込む
+      (AIセンター未設定の場合は全ての雄)
+    ・雄一覧ページを表示(選択した雄を一括編集するフォームを含む)
+        ・変更のない行はキャッシュ済みのHTMLを使い、変更のあった行だけ描画
+        ・キャッシュのヒット数・ミス数をX-Row-Cacheヘッダーで返す
+    ・前回表示から雄のデータと対応表(AIセンター名・系統コード)が
+      変わっていなければ304を返す
+        ・バージョンと対応表は1回だけ読み、スナップショットの更新にも使う
+          (スナップショットは全ての雄なので、他のAIセンターの更新でも変わる)
 
     Returns:
         str: html
     """
-    boars = Boar.query.filter(Boar.culling_on.is_(None)).all()
-    return render_template(
-        './boars/index.html', user=current_user, boars=boars)
+    ai_station_id: int = scope.current_station_id()
+    version: DataVersion = data_version()
+    masters: roster.Masters = roster.load_masters()
+
+    def render() -> wrappers.Response:
+        snapshot, _ = roster.current(version, masters)
+        mask = np.isnat(snapshot.culling_on) & ~snapshot.archived \
+            & roster.station_mask(snapshot, masters, ai_station_id)
+        rows, hits, misses = fragments.render_rows(snapshot, masters, mask)
+        response: wrappers.Response = make_response(render_template(
+            './boars/index.html', user=current_user, rows=rows,
+            form=forms.BoarBulkEdit()))
+        response.headers['X-Row-Cache'] = f'hits={hits}; misses={misses}'
+        app.logger.debug('row cache: %s', fragments.rows.stats())
+        return response
+    return conditional(
+        version, render, masters.fingerprint, ai_station_id, has_form=True)
 
 
 @boars.route('/create', methods=['GET', 'POST'])
@@ -50,9 +76,9 @@ def create() -> str:
     """新規雄情報を作成
 
     ・POST
-        ・既存のタトゥーでないか確認
-        ・未登録であれば新規雄情報を登録
-        ・雄一覧ページへリダイレクト
+        ・新規雄情報をINSERT
+        ・タトゥーの重複はDBのUNIQUE制約で検知し、フォームのエラーとして表示
+        ・登録できた場合は雄一覧ページへリダイレクト
     ・GET
         ・雄情報作成ページを表示
 
@@ -61,10 +87,7 @@ def create() -> str:
     """
     form: forms.BoarForm = forms.BoarForm()
     if form.validate_on_submit():
-        if Boar.query.filter_by(tattoo=form.tattoo.data).first():
-            flash('そのタトゥーは登録済みです', category='error')
-        else:
-            commit_boar(form)
+        if commit_boar(form):
             flash('新規雄を登録しました', category='success')
             return redirect(url_for('boars.index'))
     return render_template('./boars/create.html', user=current_user, form=form)
@@ -76,10 +99,9 @@ def edit(id: int) -> str:
     """既存の雄情報を編集する
 
     ・POST
-        ・タトゥーの重複を確認
-        ・問題なければ変更を登録
-        ・雄一覧ページへリダイレクト
-        ・重複が確認された場合、フラッシュを表示して編集ページを維持
+        ・雄モデルIDを指定してUPDATE
+        ・更新できた場合は雄詳細ページへリダイレクト
+        ・タトゥーが重複した場合、フォームのエラーを表示して編集ページを維持
     ・GET
         ・雄情報編集ページを表示
 
@@ -89,47 +111,137 @@ def edit(id: int) -> str:
     Returns:
         str: html
     """
-    boar: Boar = Boar.query.get(id)
-    form: forms.BoarForm = forms.BoarForm(obj=boar)
-    if form.validate_on_submit():
-        registered_boar: Boar = \
-            Boar.query.filter_by(tattoo=form.tattoo.data).first()
-
-        # 同じタトゥーで登録されている雄が自分自身
-        # もしくは、同じタトゥーで登録されている雄がいない場合
-        if registered_boar is boar or registered_boar is None:
-            commit_boar(form, id)
+    if request.method == 'POST':
+        form: forms.BoarForm = forms.BoarForm()
+        if form.validate_on_submit() and commit_boar(form, id):
             flash('雄情報を更新しました', category='success')
-            return redirect(url_for('boars.show', id=boar.id))
-        else:
-            flash('そのタトゥーは登録済みです', category='error')
-            return render_template(
-                './boars/edit.html', user=current_user, form=form)
-    else:
-        return render_template(
-            './boars/edit.html', user=current_user, form=form, boar=boar)
+            return redirect(url_for('boars.show', id=id))
+    boar: Boar = Boar.query.get_or_404(id)
+    if request.method == 'GET':
+        form = forms.BoarForm(obj=boar)
+    return render_template(
+        './boars/edit.html', user=current_user, form=form, boar=boar)
 
 
-def commit_boar(form: forms.BoarForm, id: int = None) -> None:
+def boar_values(form: forms.BoarForm) -> dict:
+    """フォームの入力内容を雄モデルのカラム名の辞書で返す
+
+    Args:
+        form (BoarForm): ユーザーがフォームに入力した内容
+
+    Returns:
+        dict: カラム名と値
+    """
+    return {
+        'tattoo': form.tattoo.data,
+        'name': form.name.data,
+        'line_id': form.line_id.data,
+        'birth_on': form.birth_on.data,
+        'culling_on': form.culling_on.data,
+        'farm_id': form.farm_id.data,
+    }
+
+
+def is_duplicate_tattoo(error: IntegrityError) -> bool:
+    """タトゥーのUNIQUE制約違反か判定する
+
+    Args:
+        error (IntegrityError): DBのエラー
+
+    Returns:
+        bool: タトゥーの重複であるか
+    """
+    message: str = str(error.orig).lower()
+    return 'tattoo' in message and ('unique' in message
+                                    or 'duplicate' in message)
+
+
+def commit_boar(form: forms.BoarForm, id: int = None) -> bool:
     """雄モデルに登録する
 
-    ・IDが登録済みの場合は更新
-    ・IDが登録されていない場合は新規登録
+    ・IDが指定された場合はIDを条件に1回のUPDATE
+    ・IDが指定されていない場合は1回のINSERT
+    ・同じトランザクションで変更履歴を記録
+    ・タトゥーの重複(UNIQUE制約違反)はロールバックしてフォームのエラーにする
+    ・アーカイブ済みの雄のタトゥーもフォームのエラーにする
+      (タトゥーはアーカイブを含めて一意, アーカイブへの移動が失敗するため)
 
     Args:
         form (BoarForm): ユーザーがフォームに入力した内容
         id (int, optional): 雄モデルID. Defaults to None.
+
+    Returns:
+        bool: 登録できたか
     """
-    boar: Boar = Boar.query.get(id) if id else Boar()
-    boar.tattoo = form.tattoo.data
-    boar.name = form.name.data
-    boar.line_id = form.line_id.data
-    boar.birth_on = form.birth_on.data
-    boar.culling_on = form.culling_on.data
-    boar.farm_id = form.farm_id.data
-    if id is None:
-        db.session.add(boar)
+    values: dict = boar_values(form)
+    if ArchivedBoar.query.filter_by(tattoo=values['tattoo']).first():
+        form.tattoo.errors.append('そのタトゥーはアーカイブ済みの雄で登録済みです')
+        return False
+    try:
+        if id is None:
+            boar: Boar = Boar(**values)
+            db.session.add(boar)
+            db.session.flush()
+            id = boar.id
+            changes.record(db.session, 'boar', 'insert', [id])
+        elif Boar.query.filter_by(id=id).update(
+                values, synchronize_session=False):
+            changes.record(db.session, 'boar', 'update', [id])
+        else:
+            db.session.rollback()
+            abort(404)
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        if not is_duplicate_tattoo(error):
+            raise
+        form.tattoo.errors.append('そのタトゥーは登録済みです')
+        return False
+    data_changed(id)
+    return True
+
+
+def data_changed(*boar_ids: int) -> None:
+    """雄・状態の更新後に、ワーカー内のキャッシュと定期作成に知らせる
+
+    Args:
+        *boar_ids (int): 更新した雄モデルID
+    """
+    for boar_id in boar_ids:
+        fragments.rows.invalidate(boar_id)
+    snapshots.notify_changed()
+
+
+@boars.route('/bulk-edit', methods=['POST'])
+# @login_required
+def bulk_edit() -> wrappers.Response:
+    """選択した雄、または条件に合う雄の淘汰日・農場・系統を一括で変更する
+
+    ・雄IDを確定してから変更し、変更履歴を同じトランザクションで記録
+    ・フォームから送信した場合は件数をフラッシュで表示して雄一覧ページへ
+    ・JSONで送信した場合は件数(updated)をJSONで返す
+
+    Returns:
+        flask.wrappers.Response: レスポンス
+    """
+    form: forms.BoarBulkEdit = forms.BoarBulkEdit()
+    if not form.validate_on_submit():
+        if request.is_json:
+            return jsonify(errors=form.errors), 400
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, category='error')
+        return redirect(url_for('boars.index'))
+
+    updated, ids = bulk.update_boars(
+        bulk.form_criteria(form, scope.current_station_id()),
+        bulk.form_values(form))
     db.session.commit()
+    data_changed(*ids)
+    if request.is_json:
+        return jsonify(updated=updated)
+    flash(f'{updated}頭の雄情報を更新しました', category='success')
+    return redirect(url_for('boars.index'))
 
 
 @boars.route('/upload', methods=['GET', 'POST'])
@@ -139,9 +251,10 @@ def upload() -> str:
 
     ・POST
         ・ファイルの拡張子を確認
-        ・問題なければ一時保存し雄モデルに登録
+        ・問題なければ一時保存し、全ての行を検証してから雄モデルに登録
         ・雄一覧ページへリダイレクト
-        ・対象外の拡張子の場合、フラッシュを表示
+        ・対象外の拡張子・レイアウトの場合、フラッシュを表示
+        ・検証でエラーがあった場合、何も登録せずエラーレポートを返す
     ・GET
         ・ファイルアップロードページを表示
 
@@ -153,8 +266,18 @@ def upload() -> str:
         file: request = request.files['file']
 
         if allowed_file(file.filename):
-            save_and_import(file, form.farm_id.data)
-            return redirect(url_for('boars.index'))
+            try:
+                report = save_and_import(file, form.farm_id.data)
+            except importer.ImportFormatError as error:
+                flash(f'{file.filename}: {error}', 'error')
+            else:
+                if report is not None:
+                    stem: str = secure_filename(file.filename).rsplit('.')[0]
+                    return send_file(
+                        report, as_attachment=True,
+                        download_name=f'errors_{stem}.xlsx')
+                snapshots.notify_changed()
+                return redirect(url_for('boars.index'))
         else:
             flash(
                 f'アップロードできるファイル形式は{ALLOWED_EXTENSIONS}です',
@@ -178,7 +301,7 @@ def allowed_file(filename: str) -> bool:
     return '.' in filename and extension in ALLOWED_EXTENSIONS
 
 
-def save_and_import(file: FileObject, farm_id: int) -> None:
+def save_and_import(file: FileObject, farm_id: int) -> io.BytesIO:
     """アップロードファイルの内容を
 
     ・アップロードしたファイルをtmpディレクトリに一時保管
@@ -187,19 +310,38 @@ def save_and_import(file: FileObject, farm_id: int) -> None:
     Args:
         file (FileObject): アップロードファイル
         farm_id (int): 雄モデルを登録する農場のID
+
+    Returns:
+        io.BytesIO: エラーレポート, エラーがない場合はNone
     """
     filename: str = secure_filename(file.filename)
     file_path: str = os.path.join(UPLOAD_FOLDER, filename)
     file.save(file_path)
-    importer.import_boar_list(file_path, filename, farm_id)
+    return importer.import_boar_list(file_path, filename, farm_id)
 
 
 @boars.route('/<int:id>/delete', methods=['POST'])
 # @login_required
 def delete(id: int):
-    boar = Boar.query.get(id)
-    db.session.delete(boar)
+    """雄を削除する
+
+    ・雄モデルIDを指定して1回のDELETE
+    ・状態はDBのON DELETE CASCADEで同じ文の中で削除される
+    ・削除する前に、雄と状態の削除を変更履歴に記録
+
+    Args:
+        id (int): 対象の雄モデルID
+    """
+    changes.record(db.session, 'status', 'delete', [
+        x for x, in Status.query.with_entities(Status.id)
+        .filter_by(boar_id=id)])
+    changes.record(db.session, 'boar', 'delete', [id])
+    deleted: int = Boar.query.filter_by(id=id).delete(
+        synchronize_session=False)
     db.session.commit()
+    if not deleted:
+        abort(404)
+    data_changed(id)
     flash('雄情報を削除しました', category='error')
     return redirect(url_for('boars.index'))
 
@@ -210,9 +352,11 @@ def download() -> str | wrappers.Response:
     """雄一覧のExcelファイルをダウンロード
 
     ・POST
-        ・選択した在籍状況の雄を抽出
-        ・選択した系統で絞り込み
-        ・さらに選択した農場で絞り込み
+        ・選択した在籍状況・系統・農場の条件を作成
+        ・農場はログイン中のユーザーのAIセンター管轄の農場に限る
+        ・状態の履歴を選んだ場合は雄一覧と全ての状態をExcelファイルにする
+        ・条件に合うスナップショットが作成済みであればそのファイルを返す
+        ・なければ条件に合う雄をスナップショット(roster)から抽出
         ・雄一覧をExcelファイルにエクスポート
         ・Excelファイルをダウンロード
     ・GET
@@ -223,88 +367,197 @@ def download() -> str | wrappers.Response:
     """
     form: forms.BoarDownload = forms.BoarDownload()
     if form.validate_on_submit():
-        # 在籍状況
-        boar_enrollment_status_ids: list = \
-            download_check_enrollment_status(form)
-        # 系統
-        boar_line_ids: list = \
-            download_check_line(boar_enrollment_status_ids, form)
-        # 農場
-        boars_query: flask_sqlalchemy.BaseQuery = \
-            download_check_farm(boar_line_ids, form)
-        return exporter.downloadExcel(boars_query)
-    return render_template(
-        './boars/download.html', user=current_user, form=form)
+        download_selection: Selection = Selection.from_form(form)
+        ai_station_id: int = scope.current_station_id()
+        if ai_station_id is not None:
+            download_selection = download_selection.within_farms(
+                scope.farm_abbreviations(ai_station_id))
+        if form.history.data in history.MODES:
+            return exporter.add_response(
+                history.build_workbook(
+                    roster.select_boars(download_selection),
+                    download_selection, form.history.data,
+                    exporter.temporary_name()),
+                exporter.download_name())
+        snapshot: BinaryIO = snapshots.find_snapshot(download_selection)
+        if snapshot:
+            return send_file(
+                snapshot, as_attachment=True,
+                download_name=exporter.download_name())
+        return exporter.downloadExcel(roster.select_boars(download_selection))
+    return conditional(
+        DataVersion(token='', last_modified=None),
+        lambda: render_template(
+            './boars/download.html', user=current_user, form=form),
+        has_form=True)
+
+
+@boars.cli.command('build-snapshots')
+@click.option('--force', is_flag=True, help='作成済みのファイルも作り直す')
+def build_snapshots(force: bool) -> None:
+    """よく使われる抽出条件のダウンロードファイルを作成する"""
+    for path in snapshots.build_snapshots(force=force):
+        click.echo(path)
+
+
+@boars.cli.command('prune-changes')
+def prune_changes() -> None:
+    """変更履歴のうち、同じ行の古い変更と保持期間を過ぎた変更を削除する
+
+    CHANGE_COMPACT_DAYS日より古い変更は同じ行の最新だけを残し、
+    CHANGE_RETENTION_DAYS日より古い変更は削除する(cronなどで定期実行する)
+    """
+    compacted: int = changes.compact(
+        db.session, timedelta(days=app.config['CHANGE_COMPACT_DAYS']))
+    pruned: int = changes.prune(
+        db.session, timedelta(days=app.config['CHANGE_RETENTION_DAYS']))
+    db.session.commit()
+    click.echo(f'compacted: {compacted}, pruned: {pruned}')
 
 
-def download_check_enrollment_status(form: forms.BoarDownload) -> list:
-    """選択した在籍状況の雄モデルIDをリストで返す
+@boars.cli.command('archive')
+@click.option('--days', type=int, default=None,
+              help='淘汰からの日数(省略時はARCHIVE_AFTER_DAYS)')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='1回のトランザクションで移動する頭数')
+def archive_culled(days: int, batch_size: int) -> None:
+    """淘汰から一定期間が過ぎた雄を状態と一緒にアーカイブへ移動する"""
+    days = app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    before: date = date.today() - timedelta(days=days)
+    moved: int = archive.archive_culled(before, batch_size)
+    click.echo(f'{before}より前に淘汰された{moved}頭をアーカイブしました')
 
-    Args:
-        form (BoarDownload): フォーム入力内容
 
-    Returns:
-        list: 雄モデルID
-    """
-    enrollment_status: str = form.enrollment_status.data
-    if enrollment_status == 'alive_only':
-        boar_list: list = Boar.query.filter(Boar.culling_on.is_(None)).all()
-    elif enrollment_status == 'culled_only':
-        boar_list: list = Boar.query.filter(
-            Boar.culling_on == Boar.culling_on).all()
-    else:
-        boar_list: list = Boar.query.all()
-    return [x.id for x in boar_list]
+@boars.cli.command('benchmark-import')
+@click.option('--rows', default=10000, show_default=True, help='行数')
+def benchmark_import(rows: int) -> None:
+    """同じ内容のxlsx, csv, parquetの取り込み時間を比較する"""
+    for extension, parse, check in importer.benchmark(rows):
+        click.echo(f'{extension:<10}読込 {parse:8.3f} s   検証 {check:8.3f} s')
 
 
-def download_check_line(boar_ids: list, form: forms.BoarDownload) -> list:
-    """選択した系統の雄モデルIDをリストで返す
+@boars.route('/analytics')
+# @login_required
+def analytics_summary() -> wrappers.Response:
+    """雄の年齢分布・生存曲線・月別淘汰頭数をJSONで返す
 
-    Args:
-        boar_ids (list): 雄モデルID
-        form (BoarDownload): フォーム入力内容
+    ・クエリパラメータ bin_months で年齢分布の階級幅(月)を指定できる
 
     Returns:
-        list: 雄モデルID
+        flask.wrappers.Response: JSON
     """
-    lines: list = []
-    for line in form:
-        if 'line' in line.id and line.data:
-            lines.append(Line.query.filter(
-                Line.abbreviation == line.label.text).first().id)
+    bin_months: int = max(request.args.get('bin_months', 3, type=int), 1)
+    return conditional(
+        data_version(),
+        lambda: jsonify(analytics.summary(bin_months=bin_months)),
+        date.today())
 
-    boar_list = Boar.query.filter(and_(
-        Boar.id.in_(boar_ids), Boar.line_id.in_(lines),))
-    return [x.id for x in boar_list]
 
+def group_by_args() -> list:
+    """クエリパラメータ group (例: line,farm) を集計単位のリストで返す
 
-def download_check_farm(
-    boar_ids: list, form: forms.BoarDownload
-) -> flask_sqlalchemy.BaseQuery:
-    """選択した農場の雄モデルIDをリストで返す
+    Returns:
+        list: 'line', 'farm'の組み合わせ
+    """
+    group: str = request.args.get('group', '')
+    return [x for x in group.split(',') if x in asof.GROUP_COLUMNS]
 
-    Args:
-        boar_ids (list): 雄モデルID
-        form (BoarDownload): フォーム入力内容
+
+@boars.route('/status/as-of')
+# @login_required
+def status_as_of() -> wrappers.Response:
+    """指定日時点の雄ごとの状態、またはグループごとの状態別頭数をJSONで返す
+
+    ・on: 基準日(YYYY-MM-DD), 未指定は本日
+    ・group: line, farm, line,farm のいずれかを指定すると頭数を返す
 
     Returns:
-        flask_sqlalchemy.BaseQuery: 雄一覧
+        flask.wrappers.Response: JSON
     """
-    farms: list = []
-    for farm in form:
-        if 'farm' in farm.id and farm.data:
-            farms.append(Farm.query.filter(
-                Farm.abbreviation == farm.label.text).first().id)
+    on: date = request.args.get(
+        'on', default=date.today(), type=date.fromisoformat)
+    group_by: list = group_by_args()
+
+    def render() -> wrappers.Response:
+        if group_by:
+            counts = asof.counts_as_of(on, group_by)
+            return jsonify(
+                on=on.isoformat(), counts=asof.frame_to_records(counts))
+        snapshot = asof.statuses_as_of(on)
+        return jsonify(on=on.isoformat(), boars=asof.frame_to_records(
+            snapshot, date_columns=('start_on',)))
+    return conditional(data_version(), render, on)
+
+
+@boars.route('/status/availability')
+# @login_required
+def status_availability() -> wrappers.Response:
+    """期間中の日ごとの指定状態の頭数をJSONで返す
 
-    return Boar.query.filter(and_(
-        Boar.id.in_(boar_ids), Boar.farm_id.in_(farms),))
+    ・start, end: 期間(YYYY-MM-DD), 未指定は本日までの30日間
+    ・status: 数える状態, 未指定は生産可
+    ・group: line, farm, line,farm のいずれかを指定するとグループごとに返す
+    ・始めが終わりより後、期間が長すぎる(asof.MAX_PERIOD_DAYS)場合は400
+
+    Returns:
+        flask.wrappers.Response: JSON
+    """
+    default_start, default_end = asof.default_period(
+        request.args.get('end', type=date.fromisoformat))
+    start: date = request.args.get(
+        'start', default=default_start, type=date.fromisoformat)
+    end: date = request.args.get(
+        'end', default=default_end, type=date.fromisoformat)
+    status: str = request.args.get('status', '生産可')
+    error: str = asof.period_error(start, end)
+    if error:
+        return jsonify(errors={'period': [error]}), 400
+
+    def render() -> wrappers.Response:
+        series = asof.availability_series(start, end, status, group_by_args())
+        series.index = series.index.strftime('%Y-%m-%d')
+        return jsonify(
+            start=start.isoformat(), end=end.isoformat(), status=status,
+            series=asof.frame_to_records(series.reset_index()))
+    return conditional(data_version(), render, start, end)
 
 
 @boars.route('/<int:id>', methods=['GET', 'POST'])
 # @login_required
 def show(id: int) -> str:
-    boar: Boar = Boar.query.get(id)
+    """雄の詳細と状態を表示し、状態を登録する
+
+    ・POST
+        ・状態を登録して雄詳細ページへリダイレクト
+    ・GET
+        ・雄と雄の状態が前回表示から変わっていなければ304を返す
+        ・変わっていれば雄詳細ページを表示
+        ・アーカイブした雄は読み取り専用で表示
+
+    Args:
+        id (int): 対象の雄モデルID
+
+    Returns:
+        str: html
+    """
     form: forms.StatusForm = forms.StatusForm()
+    boar: Boar = Boar.query.get(id)
+    if boar is None:
+        if request.method == 'POST':
+            abort(404)
+        archived: ArchivedBoar = ArchivedBoar.query.get_or_404(id)
+        return render_template(
+            './boars/show.html', user=current_user, boar=archived,
+            form=form, archived=True)
+
+    if request.method == 'GET':
+        return conditional(
+            data_version(boar_id=id),
+            lambda: render_template(
+                './boars/show.html', user=current_user, boar=boar,
+                form=form),
+            has_form=True)
+
     if form.validate_on_submit():
         status = Status()
         status.boar_id = boar.id
@@ -312,7 +565,10 @@ def show(id: int) -> str:
         status.reason = form.reason.data
         status.start_on = form.start_on.data
         db.session.add(status)
+        db.session.flush()
+        changes.record(db.session, 'status', 'insert', [status.id])
         db.session.commit()
+        data_changed(boar.id)
         flash('状態を登録しました', category='success')
         return redirect(url_for('boars.show', id=boar.id))
     else:
@@ -330,7 +586,9 @@ def status_edit(id: int) -> str:
         status.status = form.status.data
         status.reason = form.reason.data
         status.start_on = form.start_on.data
+        changes.record(db.session, 'status', 'update', [id])
         db.session.commit()
+        data_changed(status.boar_id)
         flash('状態を更新しました', category='success')
         return redirect(url_for('boars.show', id=status.boar_id))
     else:
@@ -343,7 +601,9 @@ def status_edit(id: int) -> str:
 # @login_required
 def status_delete(id: int):
     status = Status.query.get(id)
+    changes.record(db.session, 'status', 'delete', [id])
     db.session.delete(status)
     db.session.commit()
+    data_changed(status.boar_id)
     flash('状態を削除しました', category='error')
     return redirect(url_for('boars.show', id=status.boar_id))
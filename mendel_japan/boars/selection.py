@@ -0,0 +1,84 @@
+"""雄リストダウンロードの抽出条件
+
+・ダウンロードフォームで選択した在籍状況・系統・農場をまとめて扱う
+・抽出条件に合う雄は雄一覧のスナップショット(roster)から絞り込む
+  (淘汰済みはアーカイブも含む)
+・定期作成するダウンロードファイル(snapshots)も同じ抽出条件で作る
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import NamedTuple
+
+from mendel_japan.boars import forms
+
+
+class Selection(NamedTuple):
+    """抽出条件
+
+    Attributes:
+        enrollment_status (str): 在籍状況(all, alive_only, culled_only)
+        lines (tuple): 系統(略)
+        farms (tuple): 農場(略)
+    """
+    enrollment_status: str
+    lines: tuple
+    farms: tuple
+
+    @classmethod
+    def from_form(cls, form: forms.BoarDownload) -> Selection:
+        """フォーム入力内容から抽出条件を作る
+
+        Args:
+            form (BoarDownload): フォーム入力内容
+
+        Returns:
+            Selection: 抽出条件
+        """
+        return cls(
+            enrollment_status=form.enrollment_status.data,
+            lines=tuple(sorted(
+                field.label.text for field in form
+                if 'line' in field.id and field.data)),
+            farms=tuple(sorted(
+                field.label.text for field in form
+                if 'farm' in field.id and field.data)),
+        )
+
+    def within_farms(self, farms: set) -> Selection:
+        """選択した農場のうち、指定した農場だけに絞った抽出条件を返す
+
+        Args:
+            farms (set): 対象にできる農場(略)
+
+        Returns:
+            Selection: 抽出条件
+        """
+        return self._replace(
+            farms=tuple(x for x in self.farms if x in farms))
+
+    def key(self) -> str:
+        """抽出条件ごとに一意な文字列を返す(ファイル名に使う)
+
+        Returns:
+            str: キー
+        """
+        source: str = '|'.join(
+            [self.enrollment_status, ','.join(self.lines),
+             ','.join(self.farms)])
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+
+def form_labels(kind: str) -> tuple:
+    """ダウンロードフォームの系統(line)・農場(farm)の選択肢を返す
+
+    Args:
+        kind (str): 'line' または 'farm'
+
+    Returns:
+        tuple: 選択肢のラベル(略)
+    """
+    form_class = forms.BoarDownload
+    return tuple(sorted(
+        getattr(form_class, name).args[0] for name in dir(form_class)
+        if name.endswith(f'_{kind}')))
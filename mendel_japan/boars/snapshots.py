@@ -0,0 +1,193 @@
+"""定期作成するダウンロードファイル(スナップショット)
+
+・よく使われる抽出条件のExcelファイルを前もって作成しておく
+    ・在籍中の全ての雄
+    ・AIセンターごとの在籍中の雄
+・ファイル名に抽出条件のキーとデータのバージョン(作成日を含む)を含め、
+  ダウンロード時は現在のバージョンのファイルがあればそれを開いて返す
+・作成のタイミング
+    ・CLI: flask boars build-snapshots
+    ・バックグラウンドスレッド(EXPORT_SNAPSHOT_INTERVAL秒ごと、
+      またはデータ更新の通知を受けたとき)
+・複数ワーカーから同時に作成しないようファイルロックを取る
+"""
+from __future__ import annotations
+
+import fcntl
+import glob
+import hashlib
+import os
+import threading
+from datetime import date
+from typing import BinaryIO
+
+from flask import Flask, current_app
+from sqlalchemy import select
+
+from mendel_japan import db
+from mendel_japan.models import Farm, Line
+from mendel_japan.versioning import data_version
+from mendel_japan.boars import exporter, roster
+from mendel_japan.boars.selection import Selection, form_labels
+
+
+_changed = threading.Event()
+
+
+def snapshot_folder() -> str:
+    """スナップショットの保存先を返す(なければ作成)
+
+    Returns:
+        str: ディレクトリのパス
+    """
+    folder: str = current_app.config['EXPORT_SNAPSHOT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def snapshot_version() -> str:
+    """スナップショットの内容が変わったかを判定するための値を返す
+
+    雄・状態のバージョンに、農場・系統の名前とAIセンターの対応と今日の日付
+    (集計シートの日齢が日付で変わるため)を加える
+
+    Returns:
+        str: バージョン
+    """
+    masters: list = db.session.execute(select(
+        Farm.id, Farm.name, Farm.abbreviation, Farm.ai_station_id,
+    ).order_by(Farm.id)).all() + db.session.execute(select(
+        Line.id, Line.abbreviation,
+    ).order_by(Line.id)).all()
+    source: str = data_version().token + repr(masters) \
+        + date.today().isoformat()
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:16]
+
+
+def standard_selections() -> list:
+    """前もって作成する抽出条件を返す
+
+    Returns:
+        list: 抽出条件(Selection)のリスト
+    """
+    lines: tuple = form_labels('line')
+    farms: tuple = form_labels('farm')
+    selections: list = [Selection('alive_only', lines, farms)]
+
+    station_farms: dict = {}
+    for abbreviation, ai_station_id in db.session.execute(select(
+            Farm.abbreviation, Farm.ai_station_id)):
+        if abbreviation in farms and ai_station_id is not None:
+            station_farms.setdefault(ai_station_id, []).append(abbreviation)
+    for ai_station_id in sorted(station_farms):
+        selections.append(Selection(
+            'alive_only', lines, tuple(sorted(station_farms[ai_station_id]))))
+    return list(dict.fromkeys(selections))
+
+
+def snapshot_path(selection: Selection, version: str) -> str:
+    """抽出条件とバージョンに対応するファイルのパスを返す
+
+    Args:
+        selection (Selection): 抽出条件
+        version (str): snapshot_versionの値
+
+    Returns:
+        str: ファイルのパス
+    """
+    return os.path.join(
+        snapshot_folder(), f'{selection.key()}-{version}.xlsx')
+
+
+def find_snapshot(selection: Selection) -> BinaryIO:
+    """現在のデータで作成済みのスナップショットを開く
+
+    開いてから返すので、送信中に他のプロセスがbuild_snapshotsで
+    古いファイルとして削除しても最後まで読める
+
+    Args:
+        selection (Selection): ダウンロードフォームの抽出条件
+
+    Returns:
+        BinaryIO: 開いたファイル, ない場合はNone
+    """
+    try:
+        return open(snapshot_path(selection, snapshot_version()), 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def build_snapshots(force: bool = False) -> list:
+    """標準の抽出条件のスナップショットを作成し、古いファイルを削除する
+
+    ・他のプロセスが作成中の場合は何もしない
+    ・一時ファイルに書き出してから置き換える(作成途中のファイルは返さない)
+    ・古いファイルはすぐに削除する(送信中のファイルはfind_snapshotで
+      開いてあるので、削除しても最後まで送れる)
+
+    Args:
+        force (bool, optional): 作成済みでも作り直す. Defaults to False.
+
+    Returns:
+        list: 作成したファイルのパス
+    """
+    folder: str = snapshot_folder()
+    with open(os.path.join(folder, '.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return []
+
+        version: str = snapshot_version()
+        built: list = []
+        keep: set = set()
+        for selection in standard_selections():
+            path: str = snapshot_path(selection, version)
+            keep.add(path)
+            if os.path.exists(path) and not force:
+                continue
+            tmp_path: str = f'{path}.tmp'
+            exporter.build_workbook(roster.select_boars(selection), tmp_path)
+            os.replace(tmp_path, path)
+            built.append(path)
+
+        for path in glob.glob(os.path.join(folder, '*.xlsx')):
+            if path not in keep:
+                os.remove(path)
+        return built
+
+
+def notify_changed() -> None:
+    """データが更新されたことをバックグラウンドスレッドに知らせる"""
+    _changed.set()
+
+
+def start_scheduler(app: Flask, interval: int) -> threading.Thread:
+    """スナップショットを定期的に作成するスレッドを開始する
+
+    interval秒ごと、またはnotify_changedが呼ばれたときに
+    データのバージョンを確認し、変わっていれば作成する
+
+    Args:
+        app (Flask): アプリ
+        interval (int): 確認する間隔(秒)
+
+    Returns:
+        threading.Thread: 開始したスレッド
+    """
+    def run() -> None:
+        while True:
+            with app.app_context():
+                try:
+                    build_snapshots()
+                except Exception:
+                    app.logger.exception('failed to build export snapshots')
+                finally:
+                    db.session.remove()
+            _changed.wait(interval)
+            _changed.clear()
+
+    thread = threading.Thread(
+        target=run, name='export-snapshots', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,155 @@
+"""雄・状態の変更履歴(アウトボックス)
+
+・雄・状態を登録・更新・削除する処理は、同じトランザクションの中で
+  recordを呼び、changesテーブルに変更後の行を追加する
+・changes.idは増え続けるので、下流のシステムは最後に受け取ったidを
+  カーソルにして差分だけを取得する(/api/changes?since=<id>)
+・idはcommitの順に振る(先に振ったidが後からcommitされると、カーソルが
+  先に進んでその変更を取りこぼすため)
+    ・PostgreSQL: 記録する前にトランザクション単位のアドバイザリロックを取り、
+      commitまで次のトランザクションの記録を待たせる
+    ・SQLite: 書き込みがデータベース単位で直列なので、そのままcommitの順
+・削除は行がなくなる前に記録する(dataはnull)
+・古い履歴はcompactで同じ行の最新以外を削除し、pruneで保持期間を
+  過ぎたものを削除する(保持期間より前のカーソルは全件ダウンロードからやり直す)
+"""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, scoped_session
+
+from .models import Boar, Change, Status
+
+
+CHUNK_SIZE: int = 500
+# 変更の記録をcommitの順にするアドバイザリロックのキー(PostgreSQL)
+LOCK_KEY: int = 0x6368616e
+
+
+def entity_rows(con: Connection | Session, entity: str, ids: list) -> list:
+    """記録する行と、行が所属する農場IDを返す
+
+    Args:
+        con (Connection | Session): 書き込み中の接続またはセッション
+        entity (str): 'boar' または 'status'
+        ids (list): 行のID
+
+    Returns:
+        list: (行の辞書, 農場ID)のリスト
+    """
+    if entity == 'boar':
+        query = select(Boar.__table__, Boar.farm_id.label('_farm_id'))
+        table = Boar.__table__
+    else:
+        query = select(Status.__table__, Boar.farm_id.label('_farm_id')) \
+            .outerjoin(Boar, Boar.id == Status.boar_id)
+        table = Status.__table__
+    rows: list = []
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk: list = ids[start:start + CHUNK_SIZE]
+        for row in con.execute(query.where(table.c.id.in_(chunk))).mappings():
+            values: dict = dict(row)
+            farm_id: int = values.pop('_farm_id')
+            rows.append((values, farm_id))
+    return rows
+
+
+def record(
+        con: Connection | Session, entity: str, op: str, ids: list) -> int:
+    """変更を記録する
+
+    ・insert, updateは書き込んだ後、deleteは削除する前に呼ぶ
+    ・呼び出し側のトランザクションでcommitされる
+    ・PostgreSQLではcommitまで他のトランザクションの記録を待たせるので、
+      記録した後は速やかにcommitする
+
+    Args:
+        con (Connection | Session): 書き込み中の接続またはセッション
+        entity (str): 'boar' または 'status'
+        op (str): 'insert', 'update', 'delete'
+        ids (list): 変更した行のID
+
+    Returns:
+        int: 記録した件数
+    """
+    connection: Connection = con
+    if isinstance(con, (Session, scoped_session)):
+        con.flush()
+        connection = con.connection()
+    if connection.dialect.name == 'postgresql':
+        con.execute(select(func.pg_advisory_xact_lock(LOCK_KEY)))
+    now: datetime = datetime.utcnow()
+    changes: list = [
+        {
+            'entity': entity,
+            'entity_id': values['id'],
+            'op': op,
+            'farm_id': farm_id,
+            'payload': None if op == 'delete'
+            else json.dumps(values, default=lambda x: x.isoformat(),
+                            ensure_ascii=False),
+            'created_at': now,
+        }
+        for values, farm_id in entity_rows(con, entity, list(ids))
+    ]
+    if changes:
+        con.execute(Change.__table__.insert(), changes)
+    return len(changes)
+
+
+def to_record(change: dict) -> dict:
+    """changesテーブルの行を配信する形にする
+
+    Args:
+        change (dict): changesテーブルの行
+
+    Returns:
+        dict: id, entity, entity_id, op, data, created_at
+    """
+    return {
+        'id': change['id'],
+        'entity': change['entity'],
+        'entity_id': change['entity_id'],
+        'op': change['op'],
+        'data': json.loads(change['payload']) if change['payload'] else None,
+        'created_at': change['created_at'].isoformat(),
+    }
+
+
+def compact(con: Connection | Session, older_than: timedelta) -> int:
+    """同じ行の変更が後にある古い変更を削除する
+
+    下流のシステムは最新の変更だけ受け取れば同じ状態になる
+
+    Args:
+        con (Connection | Session): 接続またはセッション
+        older_than (timedelta): これより古い変更を対象にする
+
+    Returns:
+        int: 削除した件数
+    """
+    latest = select(func.max(Change.id)) \
+        .group_by(Change.entity, Change.entity_id)
+    return con.execute(delete(Change).where(
+        Change.created_at < datetime.utcnow() - older_than,
+        Change.id.not_in(latest),
+    ).execution_options(synchronize_session=False)).rowcount
+
+
+def prune(con: Connection | Session, retention: timedelta) -> int:
+    """保持期間を過ぎた変更を削除する
+
+    Args:
+        con (Connection | Session): 接続またはセッション
+        retention (timedelta): 保持期間
+
+    Returns:
+        int: 削除した件数
+    """
+    return con.execute(delete(Change).where(
+        Change.created_at < datetime.utcnow() - retention,
+    ).execution_options(synchronize_session=False)).rowcount
@@ -0,0 +1,336 @@
+"""レスポンスの圧縮(WSGIミドルウェアとASGIミドルウェア)
+
+・Accept-Encodingに応じてbrotli(br)またはgzipで圧縮する(br > gzip)
+・圧縮するのはHTML, JSON, NDJSON, JS, CSSなどのテキストだけ
+  (xlsx, parquetなど圧縮済みの形式や、Content-Encoding付きは圧縮しない)
+・206(Range指定の一部分)とContent-Range付き、SSE(text/event-stream)は圧縮しない
+  (SSEは最小サイズまでためると、イベントとkeepaliveが届かなくなるため)
+・COMPRESS_MIN_SIZEバイト未満の本文は圧縮しない
+    ・Content-Lengthがないストリーミングのレスポンスは、
+      COMPRESS_MIN_SIZEバイトになるまでためてから判定する
+・ストリーミングのレスポンスはチャンクごとにflushして、届く順番を保つ
+・圧縮前後のバイト数と削減したバイト数をmetricsに記録する
+・ETagは弱いETag(W/)にする(versioning.conditionalは弱い比較で304を返す)
+・Flaskはapp.wsgi_appをCompressionMiddlewareで、API(/api)はasgi.pyで
+  ASGICompressionMiddlewareで包む(StarletteのGZipMiddlewareはチャンクごとに
+  flushしないため、ロングポーリング・一括取り込みの結果が届く順番を保てない)
+"""
+from __future__ import annotations
+
+import zlib
+
+import brotli
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+
+from mendel_japan import metrics
+
+
+COMPRESSIBLE_TYPES: tuple = (
+    'text/',
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+UNCOMPRESSED_TYPES: tuple = (
+    'text/event-stream',
+)
+
+
+class Compressor:
+    """1つのレスポンスを順に圧縮する
+
+    Args:
+        encoding (str): br または gzip
+        level (int): 圧縮レベル(brは0-11, gzipは1-9)
+    """
+
+    def __init__(self, encoding: str, level: int) -> None:
+        self.encoding = encoding
+        self.size_in: int = 0
+        self.size_out: int = 0
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=level)
+        else:
+            self._zlib = zlib.compressobj(
+                level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk: bytes) -> bytes:
+        """チャンクを圧縮し、ここまでの分を出力する
+
+        Args:
+            chunk (bytes): 本文の一部
+
+        Returns:
+            bytes: 圧縮したデータ
+        """
+        self.size_in += len(chunk)
+        if self.encoding == 'br':
+            data: bytes = self._brotli.process(chunk) + self._brotli.flush()
+        else:
+            data = self._zlib.compress(chunk) \
+                + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        self.size_out += len(data)
+        return data
+
+    def finish(self) -> bytes:
+        """圧縮を終える
+
+        Returns:
+            bytes: 残りのデータ
+        """
+        if self.encoding == 'br':
+            data: bytes = self._brotli.finish()
+        else:
+            data = self._zlib.flush()
+        self.size_out += len(data)
+        return data
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Accept-Encodingから圧縮方式を選ぶ
+
+    Args:
+        accept_encoding (str | None): Accept-Encodingヘッダー
+
+    Returns:
+        str | None: br, gzip, 圧縮しない場合はNone
+    """
+    accepted = parse_accept_header(accept_encoding)
+    for encoding in ('br', 'gzip'):
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def compressible(status: str, headers: Headers, min_size: int) -> bool:
+    """レスポンスを圧縮するかを判定する(Content-Lengthがない場合は後で判定)
+
+    Args:
+        status (str): ステータス 例 200 OK
+        headers (Headers): レスポンスヘッダー
+        min_size (int): 圧縮する最小のバイト数
+
+    Returns:
+        bool: 圧縮する場合はTrue
+    """
+    if status[:3] in ('204', '206', '304') or 'Content-Encoding' in headers \
+            or 'Content-Range' in headers:
+        return False
+    if 'no-transform' in headers.get('Cache-Control', ''):
+        return False
+    content_type: str = headers.get('Content-Type', '').split(';')[0]
+    if not content_type.startswith(COMPRESSIBLE_TYPES) \
+            or content_type.startswith(UNCOMPRESSED_TYPES):
+        return False
+    length: str | None = headers.get('Content-Length')
+    return length is None or int(length) >= min_size
+
+
+def mark_compressed(headers: Headers, encoding: str) -> None:
+    """圧縮した本文に合わせてヘッダーを変える
+
+    ・Content-Lengthを外し、Content-EncodingとVary: Accept-Encodingを付ける
+    ・ETagは弱いETagにする
+
+    Args:
+        headers (Headers): レスポンスヘッダー(そのまま変更する)
+        encoding (str): br または gzip
+    """
+    headers.remove('Content-Length')
+    headers['Content-Encoding'] = encoding
+    vary: list = [
+        x.strip() for x in headers.get('Vary', '').split(',') if x.strip()]
+    if 'Accept-Encoding' not in vary:
+        headers['Vary'] = ', '.join([*vary, 'Accept-Encoding'])
+    etag: str | None = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        headers['ETag'] = 'W/' + etag
+
+
+class CompressionMiddleware:
+    """Flaskアプリ(app.wsgi_app)のレスポンスを圧縮するWSGIミドルウェア
+
+    Args:
+        app (Callable): WSGIアプリ
+        min_size (int): 圧縮する最小のバイト数
+        gzip_level (int): gzipの圧縮レベル(1-9)
+        brotli_level (int): brotliの圧縮レベル(0-11)
+    """
+
+    def __init__(
+            self, app, min_size: int = 500, gzip_level: int = 6,
+            brotli_level: int = 4) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.levels: dict = {'gzip': gzip_level, 'br': brotli_level}
+
+    def __call__(self, environ: dict, start_response):
+        encoding: str | None = choose_encoding(
+            environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.app(environ, start_response)
+
+        response: dict = {}
+
+        def capture(status: str, headers: list, exc_info=None):
+            response['status'] = status
+            response['headers'] = Headers(headers)
+            response['exc_info'] = exc_info
+            if not compressible(status, response['headers'], self.min_size):
+                response['passthrough'] = True
+                return start_response(status, headers, exc_info)
+            response['pending'] = []
+            return response['pending'].append
+
+        app_iter = self.app(environ, capture)
+        if response.get('passthrough'):
+            return app_iter
+        return self.compressed(app_iter, response, encoding, start_response)
+
+    def compressed(
+            self, app_iter, response: dict, encoding: str, start_response):
+        """本文を圧縮しながら返す
+
+        Args:
+            app_iter (Iterable): アプリの本文
+            response (dict): status, headers, 書き込み済みのデータ(pending)
+            encoding (str): br または gzip
+            start_response (Callable): WSGIのstart_response
+
+        Yields:
+            bytes: 圧縮した本文(最小サイズ未満の場合はそのまま)
+        """
+        headers: Headers = response['headers']
+        chunks: list = response['pending']
+        buffered: int = sum(len(x) for x in chunks)
+        iterator = iter(app_iter)
+        try:
+            for chunk in iterator:
+                chunks.append(chunk)
+                buffered += len(chunk)
+                if buffered >= self.min_size:
+                    break
+            else:
+                start_response(
+                    response['status'], headers.to_wsgi_list(),
+                    response['exc_info'])
+                yield from chunks
+                return
+
+            mark_compressed(headers, encoding)
+            start_response(
+                response['status'], headers.to_wsgi_list(),
+                response['exc_info'])
+
+            compressor = Compressor(encoding, self.levels[encoding])
+            yield compressor.compress(b''.join(chunks))
+            for chunk in iterator:
+                if chunk:
+                    yield compressor.compress(chunk)
+            yield compressor.finish()
+            metrics.observe_compression(
+                encoding, compressor.size_in, compressor.size_out)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+class ASGICompressionMiddleware:
+    """API(Starlette)のレスポンスを圧縮するASGIミドルウェア
+
+    ・判定と圧縮はCompressionMiddlewareと同じ(本文のチャンクごとにflushする)
+
+    Args:
+        app (Callable): ASGIアプリ
+        min_size (int): 圧縮する最小のバイト数
+        gzip_level (int): gzipの圧縮レベル(1-9)
+        brotli_level (int): brotliの圧縮レベル(0-11)
+    """
+
+    def __init__(
+            self, app, min_size: int = 500, gzip_level: int = 6,
+            brotli_level: int = 4) -> None:
+        self.app = app
+        self.min_size = min_size
+        self.levels: dict = {'gzip': gzip_level, 'br': brotli_level}
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope['type'] != 'http' or scope['method'] == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        accept_encoding: str | None = next((
+            value.decode('latin-1') for name, value in scope['headers']
+            if name == b'accept-encoding'), None)
+        encoding: str | None = choose_encoding(accept_encoding)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: dict = {}
+        chunks: list = []
+        compressor: Compressor = None
+
+        async def send_compressed(message: dict) -> None:
+            nonlocal compressor
+            if message['type'] == 'http.response.start':
+                headers = Headers([
+                    (name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in message['headers']])
+                start.update(message, headers=headers, passthrough=(
+                    not compressible(
+                        str(message['status']), headers, self.min_size)))
+                if start['passthrough']:
+                    await send(message)
+                return
+            if message['type'] != 'http.response.body' \
+                    or start.get('passthrough'):
+                await send(message)
+                return
+
+            body: bytes = message.get('body', b'')
+            more_body: bool = message.get('more_body', False)
+            if compressor is None:
+                chunks.append(body)
+                buffered: int = sum(len(x) for x in chunks)
+                if buffered < self.min_size and more_body:
+                    return
+                if buffered < self.min_size:
+                    await send(self.start_message(start))
+                    await send({'type': 'http.response.body',
+                                'body': b''.join(chunks)})
+                    return
+                mark_compressed(start['headers'], encoding)
+                await send(self.start_message(start))
+                compressor = Compressor(encoding, self.levels[encoding])
+                body = b''.join(chunks)
+            data: bytes = compressor.compress(body) if body else b''
+            if not more_body:
+                data += compressor.finish()
+                metrics.observe_compression(
+                    encoding, compressor.size_in, compressor.size_out)
+            if data or not more_body:
+                await send({'type': 'http.response.body', 'body': data,
+                            'more_body': more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def start_message(start: dict) -> dict:
+        """保留していたhttp.response.startを、変更したヘッダーで作り直す
+
+        Args:
+            start (dict): 受け取ったメッセージ(headersはHeadersに変換済み)
+
+        Returns:
+            dict: 送るメッセージ
+        """
+        return {
+            'type': 'http.response.start',
+            'status': start['status'],
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in start['headers'].items()],
+        }
@@ -0,0 +1,132 @@
+"""同時実行の確認(flask check-concurrency)
+
+gthread / geventワーカーや、ASGI(WSGIMiddlewareのスレッド)で同じプロセスの
+複数スレッドからリクエストを処理しても、セッションと接続が混ざらず、
+リクエスト終了時に片付けられることを確認する
+
+・雄一覧・雄詳細へのリクエストを複数スレッドから同時に送る
+・確認すること
+    ・全てのリクエストが200(エラー・例外がない)
+    ・リクエストの処理中に使ったセッションがスレッドごとに別
+    ・終了後にスレッドのセッションが残っていない(teardownでremoveされる)
+    ・終了後に貸し出し中の接続がない
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import numpy as np
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from mendel_japan import db
+from mendel_japan.models import Boar
+
+
+def checked_out() -> int | None:
+    """接続プールから貸し出し中の接続数を返す
+
+    Returns:
+        int | None: 接続数, プールが数えられない場合(SQLiteのファイル)はNone
+    """
+    pool = db.engine.pool
+    return pool.checkedout() if hasattr(pool, 'checkedout') else None
+
+
+def run_requests(app: Flask, urls: list, threads: int) -> dict:
+    """URLを複数スレッドから同時にリクエストする
+
+    Args:
+        app (Flask): アプリ
+        urls (list): リクエストするURL
+        threads (int): スレッド数
+
+    Returns:
+        dict: statuses(ステータスごとの件数), errors(例外), seconds(処理時間),
+            shared(複数スレッドで使われたセッション数),
+            leaked(終了後に残ったセッション数)
+    """
+    lock = threading.Lock()
+    owners: dict = {}
+    statuses: dict = {}
+    errors: list = []
+    seconds: list = []
+
+    def get(url: str) -> None:
+        started: float = time.perf_counter()
+        try:
+            with app.test_request_context(url):
+                status: int = app.full_dispatch_request().status_code
+                session = db.session()
+                with lock:
+                    owners.setdefault(id(session), (session, set()))[1] \
+                        .add(threading.get_ident())
+        except Exception as e:
+            with lock:
+                errors.append(f'{url}: {e!r}')
+            return
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            seconds.append(time.perf_counter() - started)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(get, urls))
+    registry: dict = getattr(db.session.registry, 'registry', {})
+    return {
+        'statuses': statuses,
+        'errors': errors,
+        'seconds': seconds,
+        'shared': sum(1 for _, idents in owners.values() if len(idents) > 1),
+        'leaked': len(registry),
+    }
+
+
+@click.command('check-concurrency')
+@click.option('--threads', default=8, show_default=True, help='スレッド数')
+@click.option('--requests', 'count', default=200, show_default=True,
+              help='リクエスト数')
+@with_appcontext
+def check_concurrency_command(threads: int, count: int) -> None:
+    """複数スレッドからの同時リクエストでセッションが混ざらないか確認する"""
+    app: Flask = current_app._get_current_object()
+    ids: list = db.session.execute(
+        select(Boar.id).order_by(Boar.id).limit(20)).scalars().all()
+    db.session.remove()
+    if not ids:
+        raise click.ClickException('雄が登録されていません')
+    urls: list = [
+        '/boars/' if number % 10 == 0 else f'/boars/{ids[number % len(ids)]}'
+        for number in range(count)]
+
+    started: float = time.perf_counter()
+    result: dict = run_requests(app, urls, threads)
+    elapsed: float = time.perf_counter() - started
+    seconds = np.array(result['seconds'] or [0])
+    shared: int = result['shared']
+    click.echo(f'{count} requests, {threads} threads: '
+               f'{count / elapsed:.1f} req/s, '
+               f'p50 {np.percentile(seconds, 50) * 1000:.1f} ms, '
+               f'p95 {np.percentile(seconds, 95) * 1000:.1f} ms')
+    click.echo(f'status: {result["statuses"]}')
+    click.echo(f'sessions shared between threads: {shared}')
+    click.echo(f'sessions left after requests: {result["leaked"]}')
+    click.echo(f'connections checked out: {checked_out()}')
+    for error in result['errors'][:10]:
+        click.echo(error, err=True)
+    if result['errors'] or shared or result['leaked'] \
+            or set(result['statuses']) != {200} or checked_out():
+        raise click.ClickException('同時実行の確認に失敗しました')
+    click.echo('OK')
+
+
+def init_app(app: Flask) -> None:
+    """check-concurrencyコマンドを登録する
+
+    Args:
+        app (Flask): アプリ
+    """
+    app.cli.add_command(check_concurrency_command)
@@ -0,0 +1,244 @@
+"""Prometheus形式のメトリクス
+
+・ルートごとの処理時間(ヒストグラム)と処理中のリクエスト数
+・SQLの件数と処理時間(Engineクラスのイベントで全てのエンジンを対象にする)
+・取り込み(行数, 段階ごとの処理時間, 一括取り込みAPIのレコード数)とダウンロード(行数, バイト数, 作成時間)
+・雄一覧の行キャッシュのヒット数・ミス数
+・レスポンスの圧縮前後・削減したバイト数
+・重い処理の実行中・待機中の件数、待ち時間、断った件数
+・/metrics で返す
+
+gunicornで複数ワーカーを起動する場合は、PROMETHEUS_MULTIPROC_DIRを設定すると
+ワーカーごとの値をファイルに書き出し、/metricsで全ワーカーの合計を返す
+(gunicorn.conf.pyで設定・終了したワーカーの後片付けをする)
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Flask, Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+    Histogram, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.applications import Starlette
+from starlette.routing import Match
+
+
+REQUEST_SECONDS = Histogram(
+    'mendel_request_seconds', 'リクエストの処理時間',
+    ['method', 'route', 'status'])
+REQUESTS_IN_FLIGHT = Gauge(
+    'mendel_requests_in_flight', '処理中のリクエスト数',
+    ['route'], multiprocess_mode='livesum')
+DB_QUERY_SECONDS = Histogram(
+    'mendel_db_query_seconds', 'SQLの処理時間(件数は_count)',
+    ['operation'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5))
+IMPORT_ROWS = Counter(
+    'mendel_import_rows', '取り込んだ行数(parsed: 読込, inserted: 登録)',
+    ['stage'])
+IMPORT_STAGE_SECONDS = Histogram(
+    'mendel_import_stage_seconds', '取り込みの段階ごとの処理時間', ['stage'])
+INGEST_RECORDS = Counter(
+    'mendel_ingest_records', '一括取り込みAPIのレコード数',
+    ['entity', 'result'])
+EXPORT_ROWS = Counter('mendel_export_rows', 'ダウンロードファイルの雄の頭数')
+EXPORT_BYTES = Counter('mendel_export_bytes', 'ダウンロードファイルのバイト数')
+EXPORT_SECONDS = Histogram(
+    'mendel_export_build_seconds', 'ダウンロードファイルの作成時間',
+    buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+ROW_CACHE = Counter(
+    'mendel_row_cache', '雄一覧の行キャッシュ(hit, miss)', ['result'])
+COMPRESSION_BYTES = Counter(
+    'mendel_compression_bytes', '圧縮したレスポンスのバイト数(in: 圧縮前, out: 圧縮後)',
+    ['encoding', 'stage'])
+COMPRESSION_SAVED_BYTES = Counter(
+    'mendel_compression_saved_bytes', '圧縮で削減したバイト数', ['encoding'])
+ADMISSION_ACTIVE = Gauge(
+    'mendel_admission_active', '実行中の重い処理の数',
+    multiprocess_mode='livesum')
+ADMISSION_QUEUE = Gauge(
+    'mendel_admission_queue', '実行を待っている重い処理の数',
+    multiprocess_mode='livesum')
+ADMISSION_WAIT_SECONDS = Histogram(
+    'mendel_admission_wait_seconds', '重い処理が実行を待った時間',
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+ADMISSION_REJECTED = Counter(
+    'mendel_admission_rejected', '断った重い処理(per_user, queue_full, timeout)',
+    ['reason'])
+
+
+@contextmanager
+def import_stage(stage: str):
+    """取り込みの段階の処理時間を記録する
+
+    Args:
+        stage (str): 段階(関数名)
+    """
+    with IMPORT_STAGE_SECONDS.labels(stage).time():
+        yield
+
+
+def observe_export(rows: int, file_name: str, seconds: float) -> None:
+    """ダウンロードファイルの作成を記録する
+
+    Args:
+        rows (int): 雄の頭数
+        file_name (str): 作成したファイル
+        seconds (float): 作成時間
+    """
+    EXPORT_ROWS.inc(rows)
+    EXPORT_BYTES.inc(os.path.getsize(file_name))
+    EXPORT_SECONDS.observe(seconds)
+
+
+def observe_compression(encoding: str, size_in: int, size_out: int) -> None:
+    """レスポンスの圧縮を記録する
+
+    Args:
+        encoding (str): br または gzip
+        size_in (int): 圧縮前のバイト数
+        size_out (int): 圧縮後のバイト数
+    """
+    COMPRESSION_BYTES.labels(encoding, 'in').inc(size_in)
+    COMPRESSION_BYTES.labels(encoding, 'out').inc(size_out)
+    COMPRESSION_SAVED_BYTES.labels(encoding).inc(max(size_in - size_out, 0))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany) -> None:
+    """SQLの開始時刻を記録する"""
+    conn.info['query_started'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany) -> None:
+    """SQLの処理時間を記録する"""
+    started: float = conn.info.pop('query_started', None)
+    if started is None:
+        return
+    operation: str = statement.lstrip().split(' ', 1)[0].lower()
+    if operation not in ('select', 'insert', 'update', 'delete'):
+        operation = 'other'
+    DB_QUERY_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+def route_of() -> str:
+    """メトリクスのラベルにするルート(URLの変数部分はそのまま)を返す
+
+    Returns:
+        str: ルート, 一致しない場合はunmatched
+    """
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def start_request() -> None:
+    """リクエストの開始時刻を記録し、処理中の数を増やす"""
+    g.metrics_started = time.perf_counter()
+    g.metrics_route = route_of()
+    REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+
+def end_request(response: Response) -> Response:
+    """リクエストの処理時間を記録する"""
+    if 'metrics_started' in g:
+        REQUEST_SECONDS.labels(
+            request.method, g.metrics_route, response.status_code,
+        ).observe(time.perf_counter() - g.metrics_started)
+    return response
+
+
+def teardown_request(error: BaseException = None) -> None:
+    """処理中の数を減らす(例外で終わった場合も)"""
+    if 'metrics_started' in g:
+        REQUESTS_IN_FLIGHT.labels(g.metrics_route).dec()
+        g.pop('metrics_started')
+
+
+def registry() -> CollectorRegistry:
+    """出力するレジストリを返す(マルチプロセスの場合は全ワーカーの合計)
+
+    Returns:
+        CollectorRegistry: レジストリ
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector)
+    return collector
+
+
+def metrics() -> Response:
+    """メトリクスをPrometheusのテキスト形式で返す
+
+    Returns:
+        flask.wrappers.Response: レスポンス
+    """
+    return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+class ASGIMetrics:
+    """Starlette(API)のリクエストを計測するASGIミドルウェア
+
+    Args:
+        app (Starlette): 計測するアプリ
+        prefix (str): マウント先(ルートのラベルの頭につける)
+    """
+
+    def __init__(self, app: Starlette, prefix: str = '') -> None:
+        self.app = app
+        self.prefix = prefix
+
+    def route_of(self, scope: dict) -> str:
+        """リクエストに一致するルートを返す
+
+        Args:
+            scope (dict): ASGIのscope
+
+        Returns:
+            str: ルート, 一致しない場合はunmatched
+        """
+        for route in self.app.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return self.prefix + route.path
+        return 'unmatched'
+
+    async def __call__(self, scope: dict, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        route: str = self.route_of(scope)
+        status: list = [500]
+
+        async def send_with_status(message: dict) -> None:
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        started: float = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(route).inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUESTS_IN_FLIGHT.labels(route).dec()
+            REQUEST_SECONDS.labels(scope['method'], route, status[0]) \
+                .observe(time.perf_counter() - started)
+
+
+def init_app(app: Flask) -> None:
+    """リクエストの計測と/metricsをアプリに登録する
+
+    Args:
+        app (Flask): アプリ
+    """
+    app.before_request(start_request)
+    app.after_request(end_request)
+    app.teardown_request(teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
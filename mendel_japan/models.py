@@ -1,4 +1,5 @@
-from . import db, session
+from . import db
+from datetime import datetime
 from flask_login import UserMixin
 from sqlalchemy import and_, func, desc
 
@@ -17,38 +18,56 @@ class User(db.Model, UserMixin):
     ai_station_id = db.Column(db.Integer, db.ForeignKey('ai_stations.id'))
 
 
-class Boar(db.Model):
+class TimestampMixin:
+    """作成日時・更新日時
+
+    ・ORM/Coreの更新ではupdated_atを自動で更新
+    ・pandasのto_sqlなどモデルを通さない登録はDB側の既定値で補う
+    """
+    created_at = db.Column(
+        db.DateTime, nullable=False,
+        default=datetime.utcnow, server_default=func.now())
+    updated_at = db.Column(
+        db.DateTime, nullable=False, index=True,
+        default=datetime.utcnow, onupdate=datetime.utcnow,
+        server_default=func.now())
+
+
+class Boar(TimestampMixin, db.Model):
     """雄モデル
 
     ・雄 多 : 農場 1
     ・雄 多 : 系統 1
     ・雄 1 : 状態 多
+    ・アーカイブで移した最大のIDを再利用しないよう、SQLiteでもAUTOINCREMENTにする
     """
     __tablename__ = 'boars'
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = db.Column(db.Integer, primary_key=True)
     tattoo = db.Column(db.String(50), unique=True, nullable=False)
     name = db.Column(db.String(50), nullable=False)
     birth_on = db.Column(db.Date)
     culling_on = db.Column(db.Date)
-    farm_id = db.Column(db.Integer, db.ForeignKey('farms.id'))
+    farm_id = db.Column(db.Integer, db.ForeignKey('farms.id'), index=True)
     line_id = db.Column(db.Integer, db.ForeignKey('lines.id'))
     status_ids = db.relationship(
-        'Status', backref='boars', lazy=True, cascade='delete')
+        'Status', backref='boars', lazy=True, cascade='delete',
+        passive_deletes=True)
 
     def status_ids_list(self):
         return [x.id for x in self.status_ids]
 
     def all_statuses(self):
-        return session.query(Status) \
+        return db.session.query(Status) \
             .filter(Status.id.in_(self.status_ids_list())) \
             .order_by(desc(Status.start_on)).limit(5).all()
 
     def latest_status(self):
-        latest_status_date = session.query(func.max(Status.start_on)) \
+        latest_status_date = db.session.query(func.max(Status.start_on)) \
             .filter(Status.id.in_(self.status_ids_list())).first()[0]
 
-        return session.query(Status) \
+        return db.session.query(Status) \
             .filter(and_(
                 Status.id.in_(self.status_ids_list()),
                 Status.start_on == latest_status_date
@@ -77,7 +96,8 @@ class Farm(db.Model):
     name = db.Column(db.String(50), unique=True, nullable=False)
     abbreviation = db.Column(db.String(50), unique=True)
     boar_ids = db.relationship('Boar', backref='farms', lazy=True)
-    ai_station_id = db.Column(db.Integer, db.ForeignKey('ai_stations.id'))
+    ai_station_id = db.Column(
+        db.Integer, db.ForeignKey('ai_stations.id'), index=True)
 
 
 class AiStation(db.Model):
@@ -110,15 +130,94 @@ class Line(db.Model):
     boar_ids = db.relationship('Boar', backref='lines', lazy=True)
 
 
-class Status(db.Model):
+class Status(TimestampMixin, db.Model):
     """状態モデル
 
     ・状態 多 : 雄 1
+    ・雄と同じく、SQLiteでもIDを再利用しない
     """
     __tablename__ = 'statuses'
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = db.Column(db.Integer, primary_key=True)
     status = db.Column(db.String(50), nullable=False)
     reason = db.Column(db.String(50))
     start_on = db.Column(db.Date)
-    boar_id = db.Column(db.Integer, db.ForeignKey('boars.id'))
+    boar_id = db.Column(
+        db.Integer, db.ForeignKey('boars.id', ondelete='CASCADE'))
+
+
+class Change(db.Model):
+    """変更履歴モデル(アウトボックス)
+
+    ・雄・状態の登録・更新・削除を、同じトランザクションで1件ずつ記録する
+    ・削除された行も記録するので、entity_idは外部キーにしない
+    ・farm_idはAIセンターごとの絞り込みに使う(記録時の農場)
+    """
+    __tablename__ = 'changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    farm_id = db.Column(db.Integer, index=True)
+    payload = db.Column(db.Text)
+    created_at = db.Column(
+        db.DateTime, nullable=False, index=True,
+        default=datetime.utcnow, server_default=func.now())
+
+
+class ArchivedBoar(db.Model):
+    """アーカイブした雄モデル
+
+    ・淘汰から一定期間が過ぎた雄をboarsから移動する(flask boars archive)
+    ・boarsと同じ列(IDもそのまま)に、アーカイブした日時を加える
+    ・雄 1 : アーカイブした状態 多
+    """
+    __tablename__ = 'archived_boars'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    tattoo = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    birth_on = db.Column(db.Date)
+    culling_on = db.Column(db.Date)
+    farm_id = db.Column(db.Integer, db.ForeignKey('farms.id'), index=True)
+    line_id = db.Column(db.Integer, db.ForeignKey('lines.id'))
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(
+        db.DateTime, nullable=False,
+        default=datetime.utcnow, server_default=func.now())
+
+    def all_statuses(self):
+        return ArchivedStatus.query.filter_by(boar_id=self.id) \
+            .order_by(desc(ArchivedStatus.start_on)).limit(5).all()
+
+    def ai_station(self):
+        return AiStation.query.get(
+            Farm.query.get(self.farm_id).ai_station_id)
+
+    def line(self):
+        return Line.query.get(self.line_id)
+
+    def farm(self):
+        return Farm.query.get(self.farm_id)
+
+
+class ArchivedStatus(db.Model):
+    """アーカイブした状態モデル
+
+    ・雄と一緒にstatusesから移動する
+    ・アーカイブした状態 多 : アーカイブした雄 1
+    """
+    __tablename__ = 'archived_statuses'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    status = db.Column(db.String(50), nullable=False)
+    reason = db.Column(db.String(50))
+    start_on = db.Column(db.Date)
+    boar_id = db.Column(
+        db.Integer, db.ForeignKey('archived_boars.id', ondelete='CASCADE'),
+        index=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
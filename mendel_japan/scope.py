@@ -0,0 +1,79 @@
+"""AIセンターごとの絞り込み
+
+・ログイン中のユーザーのAIセンター(User.ai_station_id)管轄の農場
+  (Farm.ai_station_id)の雄だけを対象にする
+・未ログイン、またはAIセンターが未設定のユーザーは全ての雄を対象にする
+・雄一覧・ダウンロード・データのバージョン(ETag)・APIで同じ条件を使う
+"""
+from __future__ import annotations
+
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+
+from .models import Boar, Farm, Status
+
+
+def current_station_id() -> int:
+    """ログイン中のユーザーのAIセンターIDを返す
+
+    Returns:
+        int: AIセンターID, 絞り込まない場合はNone
+    """
+    if current_user and current_user.is_authenticated:
+        return current_user.ai_station_id
+    return None
+
+
+def station_farm_ids(ai_station_id: int) -> Select:
+    """AIセンター管轄の農場IDのサブクエリを返す
+
+    Args:
+        ai_station_id (int): AIセンターID
+
+    Returns:
+        Select: 農場ID
+    """
+    return select(Farm.id).where(Farm.ai_station_id == ai_station_id)
+
+
+def boar_criteria(ai_station_id: int) -> list:
+    """AIセンター管轄の雄に絞り込む条件を返す
+
+    Args:
+        ai_station_id (int): AIセンターID, Noneの場合は絞り込まない
+
+    Returns:
+        list: 雄の絞り込み条件
+    """
+    if ai_station_id is None:
+        return []
+    return [Boar.farm_id.in_(station_farm_ids(ai_station_id))]
+
+
+def status_criteria(ai_station_id: int) -> list:
+    """AIセンター管轄の雄の状態に絞り込む条件を返す
+
+    Args:
+        ai_station_id (int): AIセンターID, Noneの場合は絞り込まない
+
+    Returns:
+        list: 状態の絞り込み条件
+    """
+    if ai_station_id is None:
+        return []
+    return [Status.boar_id.in_(
+        select(Boar.id).where(*boar_criteria(ai_station_id)))]
+
+
+def farm_abbreviations(ai_station_id: int) -> set:
+    """AIセンター管轄の農場の略称を返す
+
+    Args:
+        ai_station_id (int): AIセンターID
+
+    Returns:
+        set: 農場の略称
+    """
+    return {abbreviation for abbreviation, in Farm.query.with_entities(
+        Farm.abbreviation).filter(Farm.ai_station_id == ai_station_id)}
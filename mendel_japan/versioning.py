@@ -0,0 +1,149 @@
+"""データのバージョン確認と条件付きGET
+
+・boars/statusesの件数と最新の更新日時、最後の変更履歴(changes.id)を
+  1回のクエリで取得してバージョンとする
+    ・changes.idはcommitの順に振るので、古いupdated_atの行が後から
+      commitされても変わる(updated_atの最大値は変わらないことがある)
+・バージョンからETag/Last-Modifiedを作り、If-None-Matchが一致すれば
+  クエリもテンプレートの描画もせずに304を返す
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from flask import current_app, make_response, request, session, wrappers
+from flask_login import current_user
+from sqlalchemy import and_, func, or_, select
+
+from . import db, scope
+from .models import Boar, Change, Status
+
+
+class DataVersion(NamedTuple):
+    """データのバージョン
+
+    Attributes:
+        token (str): 件数と最新の更新日時、最後の変更履歴IDをつなげた文字列
+        last_modified (datetime): 最新の更新日時, データがない場合はNone
+        counts (tuple): (雄の頭数, 状態の件数)
+        change_id (int): 最後の変更履歴ID, 履歴がない場合はNone
+    """
+    token: str
+    last_modified: datetime
+    counts: tuple = ()
+    change_id: int = None
+
+
+def data_version(
+        boar_id: int = None, ai_station_id: int = None) -> DataVersion:
+    """雄と状態のバージョンを返す
+
+    Args:
+        boar_id (int, optional): 指定した場合はその雄と雄の状態だけを対象にする.
+            Defaults to None.
+        ai_station_id (int, optional): 指定した場合はAIセンター管轄の雄と
+            雄の状態だけを対象にする(他のAIセンターの更新では変わらない).
+            Defaults to None.
+
+    Returns:
+        DataVersion: データのバージョン
+    """
+    boar_filter: list = scope.boar_criteria(ai_station_id)
+    status_filter: list = scope.status_criteria(ai_station_id)
+    change_filter: list = []
+    if ai_station_id is not None:
+        change_filter.append(
+            Change.farm_id.in_(scope.station_farm_ids(ai_station_id)))
+    if boar_id is not None:
+        boar_filter.append(Boar.id == boar_id)
+        status_filter.append(Status.boar_id == boar_id)
+        change_filter.append(or_(
+            and_(Change.entity == 'boar', Change.entity_id == boar_id),
+            and_(Change.entity == 'status', Change.entity_id.in_(
+                select(Status.id).where(Status.boar_id == boar_id)))))
+
+    def scalar(column, where: list):
+        return select(column).where(*where).scalar_subquery()
+
+    row = db.session.execute(select(
+        scalar(func.count(Boar.id), boar_filter),
+        scalar(func.max(Boar.updated_at), boar_filter),
+        scalar(func.count(Status.id), status_filter),
+        scalar(func.max(Status.updated_at), status_filter),
+        scalar(func.max(Change.id), change_filter),
+    )).first()
+    updated: list = [x for x in (row[1], row[3]) if x is not None]
+    return DataVersion(
+        token='/'.join(str(x) for x in row),
+        last_modified=max(updated) if updated else None,
+        counts=(row[0], row[2]),
+        change_id=row[4])
+
+
+def make_etag(*parts) -> str:
+    """ETagを作る
+
+    ・データのバージョンに加えてログインユーザー(ナビバーの表示が変わる)と
+      リリース番号(テンプレートが変わる)を含める
+
+    Returns:
+        str: ETag
+    """
+    user_id = current_user.get_id() if current_user else None
+    release: str = os.environ.get('RELEASE_VERSION', '')
+    source: str = '|'.join(str(x) for x in (*parts, user_id, release))
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def csrf_period() -> int:
+    """CSRFトークンの有効期限の半分ごとに変わる値を返す
+
+    フォームを含むページは期限切れのトークンを304で使い回さないようにする
+
+    Returns:
+        int: 期間の通し番号
+    """
+    time_limit = current_app.config.get('WTF_CSRF_TIME_LIMIT', 3600) or 3600
+    return int(time.time() // max(time_limit // 2, 1))
+
+
+def conditional(
+        version: DataVersion, render: Callable, *parts,
+        has_form: bool = False) -> wrappers.Response:
+    """データのバージョンが変わっていなければ304、変わっていれば描画結果を返す
+
+    ・フラッシュメッセージが残っている場合は必ず描画する
+    ・クエリ文字列もETagに含める
+    ・圧縮したレスポンスのETagは弱いETagになるので、弱い比較で判定する
+    ・If-Modified-Sinceでは判定しない(削除や、古い更新日時の行が後から
+      commitされた場合は最新の更新日時が変わらないため)
+
+    Args:
+        version (DataVersion): 表示するデータのバージョン
+        render (Callable): レスポンスを作る関数(304の場合は呼ばない)
+        *parts: ETagに含めるその他の値
+        has_form (bool, optional): CSRFトークンを含むページか. Defaults to False.
+
+    Returns:
+        flask.wrappers.Response: レスポンス
+    """
+    if session.get('_flashes'):
+        return make_response(render())
+
+    etag: str = make_etag(
+        request.path, request.query_string, version.token,
+        csrf_period() if has_form else None, *parts)
+    if request.if_none_match.contains_weak(etag):
+        response: wrappers.Response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if version.last_modified is not None:
+        response.last_modified = version.last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
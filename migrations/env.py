@@ -74,6 +74,13 @@ def run_migrations_online():
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
+        # SQLiteのbatchで親テーブル(boarsなど)を作り直すと、DROP TABLEで
+        # ON DELETE CASCADEが走るため、マイグレーションの間は外部キー制約を止める
+        # (PRAGMAはトランザクションの外でしか効かない)
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
@@ -81,8 +88,12 @@ def run_migrations_online():
             **current_app.extensions['migrate'].configure_args
         )
 
-        with context.begin_transaction():
-            context.run_migrations()
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.exec_driver_sql('PRAGMA foreign_keys=ON')
 
 
 if context.is_offline_mode():
@@ -0,0 +1,36 @@
+"""cascade status deletion in the database
+
+Revision ID: 3b6e0d7a5c12
+Revises: 8f3a2c1d9b47
+Create Date: 2026-10-19 11:02:17.402911
+
+"""
+from alembic import op
+
+# SQLiteは制約を変更できないため、batchでテーブルを作り直す
+# (create_allで作った名前のない外部キーにも同じ名前を付けて削除できるようにする)
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+# revision identifiers, used by Alembic.
+revision = '3b6e0d7a5c12'
+down_revision = '8f3a2c1d9b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table(
+            'statuses', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint('statuses_boar_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key(
+            'statuses_boar_id_fkey', 'boars', ['boar_id'], ['id'],
+            ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table(
+            'statuses', naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_constraint('statuses_boar_id_fkey', type_='foreignkey')
+        batch_op.create_foreign_key(
+            'statuses_boar_id_fkey', 'boars', ['boar_id'], ['id'])
@@ -0,0 +1,28 @@
+"""index farms by AI station and boars by farm
+
+Revision ID: 5e1c9a7f2d30
+Revises: 3b6e0d7a5c12
+Create Date: 2026-10-19 11:48:05.227390
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e1c9a7f2d30'
+down_revision = '3b6e0d7a5c12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        op.f('ix_farms_ai_station_id'), 'farms', ['ai_station_id'],
+        unique=False)
+    op.create_index(
+        op.f('ix_boars_farm_id'), 'boars', ['farm_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_boars_farm_id'), table_name='boars')
+    op.drop_index(op.f('ix_farms_ai_station_id'), table_name='farms')
@@ -0,0 +1,36 @@
+"""add created_at / updated_at to boars and statuses
+
+Revision ID: 8f3a2c1d9b47
+Revises: edefcec14e23
+Create Date: 2026-10-19 09:12:40.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a2c1d9b47'
+down_revision = 'edefcec14e23'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ['boars', 'statuses']:
+        op.add_column(table, sa.Column(
+            'created_at', sa.DateTime(), nullable=False,
+            server_default=sa.func.now()))
+        op.add_column(table, sa.Column(
+            'updated_at', sa.DateTime(), nullable=False,
+            server_default=sa.func.now()))
+        op.create_index(
+            op.f(f'ix_{table}_updated_at'), table, ['updated_at'],
+            unique=False)
+
+
+def downgrade():
+    for table in ['boars', 'statuses']:
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'created_at')
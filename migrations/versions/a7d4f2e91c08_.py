@@ -0,0 +1,42 @@
+"""add changes outbox table
+
+Revision ID: a7d4f2e91c08
+Revises: 5e1c9a7f2d30
+Create Date: 2026-10-19 12:20:44.581734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4f2e91c08'
+down_revision = '5e1c9a7f2d30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(length=10), nullable=False),
+        sa.Column('farm_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False,
+                  server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_changes_created_at'), 'changes', ['created_at'],
+        unique=False)
+    op.create_index(
+        op.f('ix_changes_farm_id'), 'changes', ['farm_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_changes_farm_id'), table_name='changes')
+    op.drop_index(op.f('ix_changes_created_at'), table_name='changes')
+    op.drop_table('changes')
@@ -0,0 +1,65 @@
+"""add archive tables for culled boars and their statuses
+
+Revision ID: c93e1b5a7f46
+Revises: a7d4f2e91c08
+Create Date: 2026-10-19 13:05:12.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c93e1b5a7f46'
+down_revision = 'a7d4f2e91c08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'archived_boars',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('tattoo', sa.String(length=50), nullable=False),
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('birth_on', sa.Date(), nullable=True),
+        sa.Column('culling_on', sa.Date(), nullable=True),
+        sa.Column('farm_id', sa.Integer(), nullable=True),
+        sa.Column('line_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False,
+                  server_default=sa.func.now()),
+        sa.ForeignKeyConstraint(['farm_id'], ['farms.id'], ),
+        sa.ForeignKeyConstraint(['line_id'], ['lines.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tattoo'),
+    )
+    op.create_index(
+        op.f('ix_archived_boars_farm_id'), 'archived_boars', ['farm_id'],
+        unique=False)
+    op.create_table(
+        'archived_statuses',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=False),
+        sa.Column('reason', sa.String(length=50), nullable=True),
+        sa.Column('start_on', sa.Date(), nullable=True),
+        sa.Column('boar_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['boar_id'], ['archived_boars.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_archived_statuses_boar_id'), 'archived_statuses',
+        ['boar_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_archived_statuses_boar_id'), table_name='archived_statuses')
+    op.drop_table('archived_statuses')
+    op.drop_index(
+        op.f('ix_archived_boars_farm_id'), table_name='archived_boars')
+    op.drop_table('archived_boars')
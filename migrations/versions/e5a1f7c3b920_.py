@@ -0,0 +1,61 @@
+"""never reuse boar and status ids on SQLite
+
+Revision ID: e5a1f7c3b920
+Revises: c93e1b5a7f46
+Create Date: 2026-10-19 16:41:38.215067
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# SQLiteはAUTOINCREMENTを後から付けられないため、batchでテーブルを作り直す
+# (PostgreSQLのシーケンスはもともとIDを再利用しないので何もしない)
+TABLES = (('boars', 'archived_boars'), ('statuses', 'archived_statuses'))
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a1f7c3b920'
+down_revision = 'c93e1b5a7f46'
+branch_labels = None
+depends_on = None
+
+
+def recreate(autoincrement):
+    for table, _ in TABLES:
+        with op.batch_alter_table(
+                table, recreate='always',
+                table_kwargs={'sqlite_autoincrement': autoincrement}):
+            pass
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    recreate(True)
+
+    # アーカイブ済みのIDより後から採番する
+    for table, archived in TABLES:
+        last = bind.execute(sa.text(
+            f'SELECT max(id) FROM {archived}')).scalar()
+        if last is None:
+            continue
+        seq = bind.execute(sa.text(
+            'SELECT seq FROM sqlite_sequence WHERE name = :name'),
+            {'name': table}).scalar()
+        if seq is None:
+            bind.execute(sa.text(
+                'INSERT INTO sqlite_sequence (name, seq) '
+                'VALUES (:name, :seq)'), {'name': table, 'seq': last})
+        elif seq < last:
+            bind.execute(sa.text(
+                'UPDATE sqlite_sequence SET seq = :seq WHERE name = :name'),
+                {'name': table, 'seq': last})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    recreate(False)
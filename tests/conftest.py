@@ -0,0 +1,79 @@
+"""テスト共通のフィクスチャ
+
+・一時ディレクトリのSQLiteにテーブルを作り、マスタと雄・状態を登録する
+・configは読み込み時に環境変数を読むので、アプリより先にDATABASE_URLを設定する
+"""
+from __future__ import annotations
+
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+_folder = tempfile.mkdtemp(prefix='mendel_japan_test_')
+os.environ['DATABASE_URL'] = f'sqlite:///{_folder}/test.db'
+os.environ.setdefault('EXPORT_SNAPSHOT_INTERVAL', '0')
+os.environ.setdefault('SLOW_QUERY_MS', '0')
+
+from mendel_japan import create_app, db  # noqa: E402
+from mendel_japan.models import (  # noqa: E402
+    AiStation, Boar, Farm, Line, Status)
+
+BOARS: int = 50
+
+
+def seed() -> None:
+    """AIセンター・農場・系統と雄・状態を登録する"""
+    stations: list = [
+        AiStation(name=f'センター{i}', abbreviation=f'C{i}') for i in range(2)]
+    db.session.add_all(stations)
+    db.session.flush()
+    farms: list = [
+        Farm(name='GGP農場', abbreviation='GGP',
+             ai_station_id=stations[0].id),
+        Farm(name='東日本農場', abbreviation='東日本',
+             ai_station_id=stations[1].id)]
+    lines: list = [
+        Line(line='MMMM', name='Duroc', abbreviation='D', code='M'),
+        Line(line='NNNN', name='TL', abbreviation='TL', code='N')]
+    db.session.add_all(farms + lines)
+    db.session.flush()
+    rnd = random.Random(1)
+    for number in range(BOARS):
+        birth_on: date = date(2020, 1, 1) + timedelta(days=rnd.randint(0, 900))
+        boar = Boar(
+            tattoo=f'T{number:05d}', name=f'B{number}', birth_on=birth_on,
+            farm_id=rnd.choice(farms).id, line_id=rnd.choice(lines).id)
+        db.session.add(boar)
+        db.session.flush()
+        for k in range(rnd.randint(0, 3)):
+            db.session.add(Status(
+                status=rnd.choice(['生産可', '生産外']), reason='テスト',
+                start_on=birth_on + timedelta(days=100 + 60 * k),
+                boar_id=boar.id))
+    db.session.commit()
+
+
+def pytest_sessionfinish(session, exitstatus) -> None:
+    """一時ディレクトリのSQLiteを削除する"""
+    shutil.rmtree(_folder, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app():
+    """登録済みのSQLiteを使うアプリ(テスト全体で1つ)"""
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        seed()
+        db.session.remove()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """テスト用のクライアント"""
+    return app.test_client()
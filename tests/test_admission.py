@@ -0,0 +1,138 @@
+"""重い処理の受付制御のテスト"""
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from mendel_japan import admission, db
+
+SLOW_QUERY = text(
+    'WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r '
+    'WHERE i < 5000000) SELECT count(*) FROM r')
+
+
+def hold(gate: admission.Gate, user: str, seconds: float) -> threading.Thread:
+    """別スレッドでゲートに入り、seconds秒後に出る"""
+    entered = threading.Event()
+
+    def run() -> None:
+        gate.enter(user)
+        entered.set()
+        time.sleep(seconds)
+        gate.leave(user, seconds)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    entered.wait()
+    return thread
+
+
+def test_gate_rejects_same_user():
+    gate = admission.Gate(2, 2, 1, 1)
+    thread = hold(gate, 'user:1', 0.1)
+
+    with pytest.raises(admission.Rejected) as e:
+        gate.enter('user:1')
+    thread.join()
+
+    assert e.value.status == 429
+    assert e.value.retry_after >= 1
+    assert gate.users == {}
+
+
+def test_gate_rejects_when_queue_is_full():
+    gate = admission.Gate(1, 0, 1, 0)
+    thread = hold(gate, None, 0.1)
+
+    with pytest.raises(admission.Rejected) as e:
+        gate.enter('user:2')
+    thread.join()
+
+    assert (e.value.status, e.value.reason) == (503, 'queue_full')
+
+
+def test_gate_timeout_releases_waiting_user():
+    gate = admission.Gate(1, 2, 0.05, 1)
+    thread = hold(gate, 'user:1', 0.3)
+
+    with pytest.raises(admission.Rejected) as e:
+        gate.enter('user:2')
+
+    assert (e.value.status, e.value.reason) == (503, 'timeout')
+    assert gate.users == {'user:1': 1}
+    assert gate.waiting == 0
+    thread.join()
+    assert gate.users == {}
+    assert gate.active == 0
+
+
+def test_gate_admits_waiting_request():
+    gate = admission.Gate(1, 2, 1, 1)
+    thread = hold(gate, 'user:1', 0.05)
+
+    waited: float = gate.enter('user:2')
+    gate.leave('user:2')
+    thread.join()
+
+    assert waited > 0
+    assert gate.active == 0 and gate.users == {}
+
+
+def test_sqlite_statement_timeout(app):
+    with app.app_context():
+        with pytest.raises(OperationalError):
+            with admission.statement_timeout(50):
+                with db.engine.connect() as con:
+                    con.execute(SLOW_QUERY)
+        with db.engine.connect() as con:
+            assert con.execute(text('SELECT 1')).scalar() == 1
+
+
+def test_postgresql_timeout_is_set_once_per_transaction(monkeypatch):
+    """SET LOCALはトランザクションごとに1回、SQLのカーソルとは別に実行する
+
+    ・PostgreSQLの代わりにSQLiteの方言名を変え、SET LOCALを記録して置き換える
+    """
+    engine = create_engine('sqlite://')
+    monkeypatch.setattr(engine.dialect, 'name', 'postgresql')
+    executed: list = []
+
+    @event.listens_for(engine, 'before_cursor_execute', retval=True)
+    def record(con, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+        if statement.startswith('SET LOCAL'):
+            return 'SELECT 1', ()
+        return statement, parameters
+
+    with admission.statement_timeout(1500):
+        with engine.begin() as con:
+            for _ in range(3):
+                con.execute(text('SELECT 1'))
+    with engine.begin() as con:
+        con.execute(text('SELECT 1'))
+
+    assert executed == [
+        'SET LOCAL statement_timeout = 1500',
+        'SELECT 1', 'SELECT 1', 'SELECT 1', 'SELECT 1']
+
+
+def test_busy_heavy_route_returns_retry_after(app, client):
+    gate: admission.Gate = admission.gate_of(app)
+    queue: int = gate.queue
+    gate.queue = 0
+    for _ in range(gate.limit):
+        gate.enter()
+    try:
+        response = client.post('/boars/download', data={})
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+        assert client.get('/boars/').status_code == 200
+    finally:
+        for _ in range(gate.limit):
+            gate.leave()
+        gate.queue = queue
+    assert gate.active == 0
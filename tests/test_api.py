@@ -0,0 +1,32 @@
+"""JSON API(/api)のページ送りのテスト"""
+from __future__ import annotations
+
+from starlette.testclient import TestClient
+
+from conftest import BOARS
+from mendel_japan.api.routes import create_api
+
+
+def test_cursor_pages_through_all_rows(app):
+    ids: list = []
+    with TestClient(create_api(app)) as client:
+        response = client.get('/boars?limit=7&fields=name')
+        while True:
+            assert response.status_code == 200
+            page: dict = response.json()
+            ids += [x['id'] for x in page['data']]
+            if page['next_cursor'] is None:
+                break
+            response = client.get(
+                f'/boars?limit=7&fields=name&cursor={page["next_cursor"]}')
+
+    assert len(ids) >= BOARS
+    assert ids == sorted(set(ids))
+
+
+def test_invalid_cursor_is_rejected(app):
+    with TestClient(create_api(app)) as client:
+        response = client.get('/boars?cursor=not-a-cursor')
+
+    assert response.status_code == 400
+    assert response.json() == {'error': 'cursorが不正です'}
@@ -0,0 +1,78 @@
+"""淘汰済みの雄のアーカイブのテスト"""
+from __future__ import annotations
+
+from datetime import date
+
+from sqlalchemy import delete
+
+from mendel_japan import db
+from mendel_japan.boars.archive import archive_culled
+from mendel_japan.models import ArchivedBoar, Boar, Farm, Line
+
+CULLED_ON: date = date(2000, 1, 1)
+
+
+def add_culled(tattoo: str) -> int:
+    boar = Boar(tattoo=tattoo, name=tattoo, culling_on=CULLED_ON,
+                farm_id=Farm.query.first().id, line_id=Line.query.first().id)
+    db.session.add(boar)
+    db.session.commit()
+    return boar.id
+
+
+def remove_archived(*tattoos: str) -> None:
+    db.session.execute(delete(ArchivedBoar).where(
+        ArchivedBoar.tattoo.in_(tattoos)))
+    db.session.commit()
+
+
+def test_archived_tattoo_cannot_be_registered(app, client):
+    with app.app_context():
+        add_culled('ARC-1')
+        assert archive_culled(date(2001, 1, 1)) == 1
+        form: dict = {
+            'tattoo': 'ARC-1', 'name': 'new', 'birth_on': '2022-01-01',
+            'farm_id': Farm.query.first().id,
+            'line_id': Line.query.first().id}
+        db.session.remove()
+
+    response = client.post('/boars/create', data=form)
+
+    try:
+        assert response.status_code == 200
+        assert 'アーカイブ済みの雄で登録済みです' in response.get_data(True)
+        with app.app_context():
+            assert Boar.query.filter_by(tattoo='ARC-1').count() == 0
+    finally:
+        with app.app_context():
+            remove_archived('ARC-1')
+
+
+def test_duplicate_tattoo_does_not_block_archive(app):
+    with app.app_context():
+        add_culled('ARC-2')
+        archive_culled(date(2001, 1, 1))
+        reused: int = add_culled('ARC-2')
+        other: int = add_culled('ARC-3')
+        try:
+            assert archive_culled(date(2001, 1, 1)) == 1
+            assert db.session.get(Boar, reused) is not None
+            assert db.session.get(ArchivedBoar, other) is not None
+        finally:
+            db.session.execute(delete(Boar).where(Boar.id == reused))
+            remove_archived('ARC-2', 'ARC-3')
+            db.session.remove()
+
+
+def test_archived_max_id_is_not_reused(app):
+    with app.app_context():
+        archived: int = add_culled('ARC-4')
+        assert archive_culled(date(2001, 1, 1)) == 1
+        assert db.session.get(Boar, archived) is None
+        reused: int = add_culled('ARC-5')
+        try:
+            assert reused > archived
+        finally:
+            db.session.execute(delete(Boar).where(Boar.id == reused))
+            remove_archived('ARC-4')
+            db.session.remove()
@@ -0,0 +1,30 @@
+"""日ごとの状態別頭数のテスト"""
+from __future__ import annotations
+
+from mendel_japan.boars import asof
+
+
+def test_availability_counts_each_day(client):
+    response = client.get(
+        '/boars/status/availability?start=2022-01-01&end=2022-01-31')
+
+    assert response.status_code == 200
+    assert len(response.get_json()['series']) == 31
+
+
+def test_start_after_end_is_rejected(client):
+    response = client.get(
+        '/boars/status/availability?start=2022-02-01&end=2022-01-01')
+
+    assert response.status_code == 400
+    assert 'period' in response.get_json()['errors']
+
+
+def test_too_long_period_is_rejected(client):
+    too_long = client.get(
+        '/boars/status/availability?start=1900-01-01&end=2022-01-01')
+    far_future = client.get('/boars/status/availability?end=2400-01-01')
+
+    assert asof.MAX_PERIOD_DAYS < (2022 - 1900) * 365
+    assert too_long.status_code == 400
+    assert far_future.status_code == 400
@@ -0,0 +1,81 @@
+"""雄情報の一括編集のテスト"""
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from mendel_japan import db
+from mendel_japan.models import AiStation, Boar, Change, Farm, User
+
+
+@pytest.fixture
+def station_client(app):
+    """センター0のユーザーでログインしたクライアント"""
+    with app.app_context():
+        station: AiStation = AiStation.query.order_by(AiStation.id).first()
+        user = User(email='bulk@example.com', name='bulk',
+                    ai_station_id=station.id)
+        db.session.add(user)
+        db.session.commit()
+        user_id: int = user.id
+        ai_station_id: int = station.id
+        farms: dict = {farm.name: farm.id for farm in Farm.query}
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    try:
+        yield client, ai_station_id, farms
+    finally:
+        with app.app_context():
+            db.session.execute(delete(User).where(User.id == user_id))
+            db.session.commit()
+            db.session.remove()
+
+
+def station_boar_id(ai_station_id: int) -> int:
+    return db.session.execute(
+        select(Boar.id).join(Farm, Farm.id == Boar.farm_id)
+        .where(Farm.ai_station_id == ai_station_id)
+        .order_by(Boar.id)).scalars().first()
+
+
+def test_other_station_farm_is_rejected(app, station_client):
+    client, ai_station_id, farms = station_client
+    with app.app_context():
+        id: int = station_boar_id(ai_station_id)
+        db.session.remove()
+
+    page = client.get('/boars/')
+    response = client.post('/boars/bulk-edit', json={
+        'ids': [id], 'farm_id': farms['東日本農場']})
+
+    assert 'GGP農場' in page.get_data(True)
+    assert '東日本農場' not in page.get_data(True)
+    assert response.status_code == 400
+    assert 'farm_id' in response.get_json()['errors']
+    with app.app_context():
+        assert db.session.get(Boar, id).farm_id == farms['GGP農場']
+        db.session.remove()
+
+
+def test_updated_boars_match_recorded_changes(app, station_client):
+    client, ai_station_id, farms = station_client
+    with app.app_context():
+        id: int = station_boar_id(ai_station_id)
+        since: int = db.session.execute(select(func.max(Change.id))).scalar()
+        db.session.remove()
+
+    response = client.post('/boars/bulk-edit', json={
+        'ids': [id], 'farm_id': farms['GGP農場']})
+
+    assert response.status_code == 200
+    assert response.get_json() == {'updated': 1}
+    with app.app_context():
+        recorded: list = db.session.execute(
+            select(Change.entity_id).where(Change.id > (since or 0))
+        ).scalars().all()
+        assert recorded == [id]
+        db.session.remove()
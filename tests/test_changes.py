@@ -0,0 +1,94 @@
+"""変更履歴(アウトボックス)と/api/changesのテスト"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from starlette.testclient import TestClient
+
+from mendel_japan import changes, db
+from mendel_japan.api.routes import create_api
+from mendel_japan.models import Boar, Change, Farm
+
+POSTGRESQL_URL: str = os.environ.get('TEST_POSTGRESQL_URL')
+
+
+def last_change_id() -> int:
+    return db.session.execute(select(func.max(Change.id))).scalar() or 0
+
+
+def test_change_feed_resumes_from_cursor(app):
+    with app.app_context():
+        since: int = last_change_id()
+        ids: list = db.session.execute(
+            select(Boar.id).order_by(Boar.id).limit(3)).scalars().all()
+        db.session.remove()
+        for id in ids:
+            with db.engine.begin() as con:
+                changes.record(con, 'boar', 'update', [id])
+
+    with TestClient(create_api()) as client:
+        response = client.get(f'/changes?since={since}')
+        delivered: list = [
+            json.loads(x) for x in response.text.splitlines()]
+        again = client.get(f'/changes?since={delivered[-1]["id"]}')
+
+    assert response.status_code == 200
+    assert [x['entity_id'] for x in delivered] == ids
+    assert [x['id'] for x in delivered] == sorted(x['id'] for x in delivered)
+    assert again.text == ''
+
+
+@pytest.mark.skipif(
+    POSTGRESQL_URL is None, reason='TEST_POSTGRESQL_URLが未設定')
+def test_interleaved_writers_commit_in_id_order():
+    """先にidを振ったトランザクションが後からcommitしても取りこぼさない
+
+    ・書き込みA: 変更を記録してcommitせずに待つ
+    ・書き込みB: 別のスレッドで変更を記録してcommitする
+    ・Aのcommit前に、Bの変更だけが見える(カーソルがAを追い越す)ことがない
+    """
+    engine = create_engine(POSTGRESQL_URL)
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    try:
+        with engine.begin() as con:
+            farm_id: int = con.execute(Farm.__table__.insert().values(
+                name='GGP農場')).inserted_primary_key[0]
+            boar_ids: list = [
+                con.execute(Boar.__table__.insert().values(
+                    tattoo=f'T{n}', name=f'B{n}', farm_id=farm_id,
+                )).inserted_primary_key[0]
+                for n in range(2)]
+
+        def visible() -> list:
+            with engine.connect() as con:
+                return con.execute(
+                    select(Change.entity_id).order_by(Change.id)
+                ).scalars().all()
+
+        writer_a = engine.connect()
+        transaction_a = writer_a.begin()
+        changes.record(writer_a, 'boar', 'update', [boar_ids[0]])
+
+        def write_b() -> None:
+            with engine.begin() as con:
+                changes.record(con, 'boar', 'update', [boar_ids[1]])
+
+        writer_b = threading.Thread(target=write_b)
+        writer_b.start()
+        time.sleep(0.5)
+        seen_before_a: list = visible()
+        transaction_a.commit()
+        writer_a.close()
+        writer_b.join()
+
+        assert seen_before_a == []
+        assert visible() == boar_ids
+    finally:
+        db.metadata.drop_all(engine)
+        engine.dispose()
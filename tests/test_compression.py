@@ -0,0 +1,96 @@
+"""レスポンスの圧縮のテスト"""
+from __future__ import annotations
+
+import zlib
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from werkzeug.datastructures import Headers
+
+from mendel_japan.compression import ASGICompressionMiddleware, compressible
+
+BODY: str = 'タトゥー,雄ID\n' * 200
+
+
+def test_compressible():
+    html = Headers({'Content-Type': 'text/html; charset=utf-8'})
+
+    assert compressible('200 OK', html, 500)
+    assert not compressible('206 Partial Content', html, 500)
+    assert not compressible('200 OK', Headers({
+        'Content-Type': 'text/html', 'Content-Range': 'bytes 0-99/1000'}),
+        500)
+    assert not compressible('200 OK', Headers({
+        'Content-Type': 'text/event-stream'}), 500)
+    assert not compressible('200 OK', Headers({
+        'Content-Type': 'application/vnd.openxmlformats-officedocument'
+                        '.spreadsheetml.sheet'}), 500)
+    assert not compressible('200 OK', Headers({
+        'Content-Type': 'text/html', 'Content-Length': '10'}), 500)
+
+
+def test_flask_response_is_compressed(client):
+    response = client.get('/boars/', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].startswith('W/')
+    assert '雄' in zlib.decompress(
+        response.data, 16 + zlib.MAX_WBITS).decode('utf-8')
+
+
+def asgi_client() -> TestClient:
+    def lines():
+        for number in range(3):
+            yield f'{{"line": {number}}}\n' * 100
+
+    async def events():
+        yield 'retry: 3000\n\n'
+
+    routes: list = [
+        Route('/text', lambda request: PlainTextResponse(BODY)),
+        Route('/small', lambda request: PlainTextResponse('ok')),
+        Route('/partial', lambda request: PlainTextResponse(
+            BODY, status_code=206,
+            headers={'Content-Range': 'bytes 0-99/1000'})),
+        Route('/stream', lambda request: StreamingResponse(
+            lines(), media_type='application/x-ndjson')),
+        Route('/events', lambda request: StreamingResponse(
+            events(), media_type='text/event-stream')),
+    ]
+    return TestClient(ASGICompressionMiddleware(Starlette(routes=routes)))
+
+
+def test_asgi_response_is_compressed():
+    client: TestClient = asgi_client()
+    gzip: dict = {'Accept-Encoding': 'gzip'}
+
+    text = client.get('/text', headers=gzip)
+    stream = client.get('/stream', headers=gzip)
+
+    assert text.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in text.headers
+    assert text.headers['Vary'] == 'Accept-Encoding'
+    assert text.text == BODY
+    assert stream.headers['Content-Encoding'] == 'gzip'
+    assert stream.text.count('\n') == 300
+
+
+def test_asgi_prefers_brotli():
+    response = asgi_client().get('/text', headers={
+        'Accept-Encoding': 'gzip, br'})
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.text == BODY
+
+
+def test_asgi_skips_small_partial_and_event_stream():
+    client: TestClient = asgi_client()
+    gzip: dict = {'Accept-Encoding': 'gzip'}
+
+    for url in ('/small', '/partial', '/events'):
+        response = client.get(url, headers=gzip)
+        assert 'Content-Encoding' not in response.headers, url
+    response = client.get('/text', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
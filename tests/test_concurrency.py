@@ -0,0 +1,69 @@
+"""複数スレッドからの同時リクエストのテスト"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import event, select
+
+from mendel_japan import db
+from mendel_japan.concurrency import checked_out, run_requests
+from mendel_japan.models import Boar
+
+
+@pytest.fixture
+def connections(app):
+    """貸し出し中の接続数を数える(SQLiteのNullPoolでも数えられるようにする)"""
+    lock = threading.Lock()
+    counts: dict = {'out': 0, 'max': 0}
+
+    def checkout(dbapi_connection, record, proxy) -> None:
+        with lock:
+            counts['out'] += 1
+            counts['max'] = max(counts['max'], counts['out'])
+
+    def checkin(dbapi_connection, record) -> None:
+        with lock:
+            counts['out'] -= 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'checkout', checkout)
+    event.listen(engine, 'checkin', checkin)
+    yield counts
+    event.remove(engine, 'checkout', checkout)
+    event.remove(engine, 'checkin', checkin)
+
+
+def test_threads_do_not_share_sessions(app, connections):
+    with app.app_context():
+        ids: list = db.session.execute(
+            select(Boar.id).order_by(Boar.id).limit(10)).scalars().all()
+        db.session.remove()
+    urls: list = [
+        '/boars/' if number % 5 == 0 else f'/boars/{ids[number % 10]}'
+        for number in range(40)]
+
+    with app.app_context():
+        result: dict = run_requests(app, urls, 8)
+        assert checked_out() in (None, 0)
+
+    assert result['errors'] == []
+    assert result['statuses'] == {200: 40}
+    assert result['shared'] == 0
+    assert result['leaked'] == 0
+    assert connections['max'] > 1
+    assert connections['out'] == 0
+
+
+def test_client_requests_from_threads(app, connections):
+    def get(url: str) -> int:
+        return app.test_client().get(url).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses: list = list(executor.map(get, ['/boars/'] * 16))
+
+    assert statuses == [200] * 16
+    assert db.session.registry.registry == {}
+    assert connections['out'] == 0
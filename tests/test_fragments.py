@@ -0,0 +1,31 @@
+"""雄一覧の行のHTMLキャッシュのテスト"""
+from __future__ import annotations
+
+from mendel_japan import db
+from mendel_japan.boars import fragments
+from mendel_japan.models import AiStation
+
+
+def test_renaming_station_rerenders_cached_rows(app, client):
+    with app.app_context():
+        station: AiStation = AiStation.query.order_by(AiStation.id).first()
+        name: str = station.name
+    before = client.get('/boars/')
+    cached = client.get('/boars/')
+    assert cached.headers['X-Row-Cache'].endswith('misses=0')
+
+    with app.app_context():
+        db.session.get(AiStation, station.id).name = '改名したセンター'
+        db.session.commit()
+    try:
+        after = client.get(
+            '/boars/', headers={'If-None-Match': before.headers['ETag']})
+
+        assert after.status_code == 200
+        assert '改名したセンター' in after.get_data(as_text=True)
+        assert after.headers['X-Row-Cache'].startswith('hits=0;')
+    finally:
+        with app.app_context():
+            db.session.get(AiStation, station.id).name = name
+            db.session.commit()
+        fragments.rows.invalidate()
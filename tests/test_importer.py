@@ -0,0 +1,72 @@
+"""アップロードファイルの検証とエラーレポートのテスト"""
+from __future__ import annotations
+
+import openpyxl as xl
+import pytest
+
+from mendel_japan import db
+from mendel_japan.boars import importer
+from mendel_japan.models import Boar, Farm
+
+HEADER: list = ['タトゥー', '雄ID', '系統', '生年月日', '淘汰日']
+ROWS: list = [
+    ['IMP-1', None, 'MMMM', '2022-01-01', None],
+    ['IMP-2', None, 'XXXX', '2022-01-01', None],
+    ['IMP-3', None, 'NNNN', '2022-02-30', None],
+    ['IMP-4', None, 'NNNN', '2022-01-01', None],
+    ['IMP-4', None, 'MMMM', '2022-01-01', None],
+]
+
+
+@pytest.fixture
+def upload(tmp_path) -> str:
+    """1行目がタイトル、2行目からROWSのExcelファイル"""
+    wb: xl.Workbook = xl.Workbook()
+    wb.active.append(HEADER)
+    for row in ROWS:
+        wb.active.append(row)
+    path: str = str(tmp_path / 'boars.xlsx')
+    wb.save(path)
+    return path
+
+
+def test_errors_are_reported_with_excel_rows(app, upload):
+    with app.app_context():
+        df = importer.check_format(upload)
+        errors = importer.validate(df, importer.line_ids())
+        db.session.remove()
+
+    assert list(df.index) == [2, 3, 4, 5, 6]
+    assert errors.values.tolist() == [
+        [3, '系統', '登録されていない系統です'],
+        [4, '生年月日', '日付として読めません'],
+        [5, 'タトゥー', 'ファイル内で重複しています'],
+        [6, 'タトゥー', 'ファイル内で重複しています'],
+    ]
+
+
+def test_error_report_marks_rows(app, upload):
+    with app.app_context():
+        df = importer.check_format(upload)
+        report = importer.error_report(
+            df, importer.validate(df, importer.line_ids()))
+        db.session.remove()
+
+    wb: xl.Workbook = xl.load_workbook(report)
+    rows: list = list(wb['取り込み内容'].iter_rows(values_only=True))
+    assert rows[0][0] == '行' and rows[0][-1] == 'エラー'
+    assert [x[0] for x in rows[1:]] == [2, 3, 4, 5, 6]
+    assert rows[1][-1] is None
+    assert rows[2][-1] == '系統: 登録されていない系統です'
+    assert wb['取り込み内容']['A3'].fill.fgColor.rgb.endswith('FFFF99')
+    assert len(list(wb['エラー一覧'].iter_rows())) == 1 + 4
+
+
+def test_invalid_upload_registers_nothing(app, upload):
+    with app.test_request_context():
+        farm_id: int = Farm.query.first().id
+        report = importer.import_boar_list(upload, 'boars.xlsx', farm_id)
+
+        assert report is not None
+        assert Boar.query.filter(Boar.tattoo.like('IMP-%')).count() == 0
+        db.session.remove()
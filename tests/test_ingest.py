@@ -0,0 +1,174 @@
+"""雄・状態の一括取り込みAPI(POST /api/ingest)のテスト"""
+from __future__ import annotations
+
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+from mendel_japan import admission, db
+from mendel_japan.api import ingest
+from mendel_japan.api.routes import create_api
+from mendel_japan.models import AiStation, Boar, Farm, Line, Status
+
+NDJSON: dict = {'Content-Type': 'application/x-ndjson'}
+
+
+@pytest.fixture
+def masters(app) -> dict:
+    """農場・系統・AIセンターのID"""
+    with app.app_context():
+        stations: list = [x.id for x in AiStation.query.order_by(AiStation.id)]
+        farms: list = [
+            (x.id, x.ai_station_id) for x in Farm.query.order_by(Farm.id)]
+        line_id: int = Line.query.first().id
+        db.session.remove()
+    return {'stations': stations, 'farms': farms, 'line_id': line_id}
+
+
+@pytest.fixture
+def api(app, masters, monkeypatch):
+    """トークンを設定したAPIのクライアント"""
+    monkeypatch.setattr(ingest, 'INGEST_TOKENS', {
+        'all-farms': None, 'station': masters['stations'][0]})
+    with TestClient(create_api(app)) as client:
+        yield client
+
+
+def post(client: TestClient, records: list, token: str = 'all-farms',
+         query: str = '') -> list:
+    body: str = ''.join(
+        (x if isinstance(x, str) else json.dumps(x, ensure_ascii=False))
+        + '\n' for x in records)
+    response = client.post(
+        f'/ingest{query}', data=body.encode('utf-8'),
+        headers=dict(NDJSON, Authorization=f'Bearer {token}'))
+    assert response.status_code == 200
+    return [json.loads(x) for x in response.text.splitlines()]
+
+
+def test_inserts_updates_and_deduplicates(app, api, masters):
+    farm_id: int = masters['farms'][0][0]
+    records: list = [
+        {'type': 'boar', 'tattoo': 'ING-1', 'name': 'I1', 'farm_id': farm_id,
+         'line_id': masters['line_id'], 'birth_on': '2022-01-01'},
+        {'type': 'status', 'tattoo': 'ING-1', 'start_on': '2022-05-01',
+         'status': '生産可', 'reason': 'テスト'},
+        {'type': 'boar', 'tattoo': 'T00000', 'culling_on': '2022-06-01'},
+    ]
+
+    first: list = post(api, records)
+    again: list = post(api, records)
+
+    assert [x['result'] for x in first[:-1]] == [
+        'inserted', 'inserted', 'updated']
+    assert first[-1]['summary']['inserted'] == 2
+    assert [x['result'] for x in again[:-1]] == ['unchanged'] * 3
+    with app.app_context():
+        boar: Boar = Boar.query.filter_by(tattoo='ING-1').one()
+        assert Status.query.filter_by(boar_id=boar.id).count() == 1
+        assert Boar.query.filter_by(tattoo='T00000').one().culling_on \
+            .isoformat() == '2022-06-01'
+
+
+def test_invalid_lines_are_reported(api, masters):
+    results: list = post(api, [
+        {'type': 'boar', 'tattoo': 'ING-2', 'farm_id': masters['farms'][0][0]},
+        {'type': 'boar', 'tattoo': 'ING-3', 'name': 'x', 'farm_id': 9999,
+         'birth_on': '2022-13-01'},
+        {'type': 'status', 'tattoo': 'NOT-FOUND', 'start_on': '2022-05-01',
+         'status': '生産可'},
+        {'type': 'unknown'},
+        'not json',
+    ], query='?results=errors')
+
+    errors: dict = {x['line']: x['errors'] for x in results[:-1]}
+    assert set(errors) == {1, 2, 3, 4, 5}
+    assert 'name' in errors[1]
+    assert {'farm_id', 'birth_on'} <= set(errors[2])
+    assert errors[3] == {'tattoo': '登録されていません'}
+    assert 'type' in errors[4] and 'line' in errors[5]
+    assert results[-1]['summary']['error'] == 5
+
+
+def test_stream_returns_the_same_results(api, masters):
+    records: list = [
+        {'type': 'boar', 'tattoo': 'ING-5', 'farm_id': masters['farms'][0][0]},
+        {'type': 'unknown'},
+    ]
+
+    spooled: list = post(api, records)
+    streamed: list = post(api, records, query='?stream=1')
+
+    assert spooled[:-1] == streamed[:-1]
+    assert spooled[-1]['summary']['error'] == 2
+
+
+@pytest.mark.parametrize('stream, read_before_results', [
+    (False, ingest.BATCH_SIZE + 1),
+    (True, ingest.BATCH_SIZE),
+])
+def test_results_wait_for_the_whole_body(api, stream, read_before_results):
+    read: list = []
+
+    class Body:
+        """1行ずつ本文を渡し、渡した行数を記録するリクエスト"""
+        async def stream(self):
+            for number in range(ingest.BATCH_SIZE + 1):
+                read.append(number)
+                yield b'{"type": "unknown"}\n'
+
+    async def first_chunk() -> str:
+        results = ingest.ingest_results(
+            Body(), await ingest.Masters.load(None), True, 0, stream)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+
+    chunk: str = api.portal.call(first_chunk)
+
+    assert len(read) == read_before_results
+    assert json.loads(chunk.splitlines()[0])['result'] == 'error'
+
+
+def test_station_token_is_limited_to_its_farms(api, masters):
+    other: int = next(
+        farm_id for farm_id, station_id in masters['farms']
+        if station_id != masters['stations'][0])
+
+    results: list = post(api, [
+        {'type': 'boar', 'tattoo': 'ING-4', 'name': 'x', 'farm_id': other},
+    ], token='station')
+
+    assert results[0]['errors'] == {'farm_id': '登録されていない、または管轄外です'}
+
+
+def test_authentication_and_content_type(api):
+    missing = api.post('/ingest', data=b'', headers=NDJSON)
+    wrong = api.post('/ingest', data=b'', headers=dict(
+        NDJSON, Authorization='Bearer wrong'))
+    text = api.post('/ingest', data=b'', headers={
+        'Authorization': 'Bearer all-farms', 'Content-Type': 'text/plain'})
+
+    assert missing.status_code == wrong.status_code == 401
+    assert wrong.json() == {'error': 'トークンが正しくありません'}
+    assert text.status_code == 415
+
+
+def test_busy_gate_returns_retry_after(app, api):
+    gate: admission.Gate = admission.gate_of(app)
+    queue: int = gate.queue
+    gate.queue = 0
+    for _ in range(gate.limit):
+        gate.enter()
+    try:
+        response = api.post('/ingest', data=b'', headers=dict(
+            NDJSON, Authorization='Bearer all-farms'))
+    finally:
+        for _ in range(gate.limit):
+            gate.leave()
+        gate.queue = queue
+
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
@@ -0,0 +1,76 @@
+"""雄一覧のスナップショットの差し替えのテスト"""
+from __future__ import annotations
+
+from datetime import date, datetime
+
+import numpy as np
+from sqlalchemy import delete, update
+
+from mendel_japan import changes, db
+from mendel_japan.boars import roster
+from mendel_japan.boars.archive import archive_culled
+from mendel_japan.models import ArchivedBoar, Boar, Farm
+
+
+def add_boar(tattoo: str, culling_on: date = None) -> int:
+    boar = Boar(tattoo=tattoo, name=tattoo, culling_on=culling_on,
+                farm_id=Farm.query.first().id)
+    db.session.add(boar)
+    db.session.flush()
+    changes.record(db.session, 'boar', 'insert', [boar.id])
+    db.session.commit()
+    return boar.id
+
+
+def count_loads(monkeypatch) -> list:
+    loads: list = []
+    load_roster = roster.load_roster
+
+    def counted() -> roster.Roster:
+        loads.append(1)
+        return load_roster()
+    monkeypatch.setattr(roster, 'load_roster', counted)
+    return loads
+
+
+def test_late_commit_is_refreshed_from_changes(app, monkeypatch):
+    with app.app_context():
+        id: int = add_boar('ROSTER-1')
+        roster.current()
+        loads: list = count_loads(monkeypatch)
+
+        # 先に更新日時を取ったトランザクションが後からcommitされた場合
+        db.session.execute(
+            update(Boar).where(Boar.id == id)
+            .values(name='late', updated_at=datetime(2000, 1, 1)))
+        changes.record(db.session, 'boar', 'update', [id])
+        db.session.commit()
+        try:
+            snapshot, _ = roster.current()
+
+            assert loads == []
+            assert snapshot.name[np.searchsorted(snapshot.id, id)] == 'late'
+        finally:
+            db.session.execute(delete(Boar).where(Boar.id == id))
+            db.session.commit()
+            db.session.remove()
+
+
+def test_archive_falls_back_to_full_reload(app, monkeypatch):
+    with app.app_context():
+        id: int = add_boar('ROSTER-2', culling_on=date(2000, 1, 1))
+        roster.current()
+        loads: list = count_loads(monkeypatch)
+
+        # アーカイブへの移動は変更履歴に残らないので、件数の違いで検知する
+        archive_culled(date(2001, 1, 1))
+        try:
+            snapshot, _ = roster.current()
+
+            assert loads == [1]
+            assert snapshot.archived[np.searchsorted(snapshot.id, id)]
+        finally:
+            db.session.execute(
+                delete(ArchivedBoar).where(ArchivedBoar.id == id))
+            db.session.commit()
+            db.session.remove()
@@ -0,0 +1,83 @@
+"""定期作成するダウンロードファイルのテスト"""
+from __future__ import annotations
+
+import io
+import os
+import zipfile
+from datetime import date, timedelta
+
+from mendel_japan import db
+from mendel_japan.boars import exporter, snapshots
+
+
+class Tomorrow(date):
+    @classmethod
+    def today(cls) -> date:
+        return date.today() + timedelta(days=1)
+
+
+def test_version_changes_with_date(app, monkeypatch):
+    with app.app_context():
+        today: str = snapshots.snapshot_version()
+        monkeypatch.setattr(snapshots, 'date', Tomorrow)
+        tomorrow: str = snapshots.snapshot_version()
+        db.session.remove()
+
+    assert today != tomorrow
+
+
+def test_open_snapshot_survives_rebuild(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'EXPORT_SNAPSHOT_FOLDER', str(tmp_path))
+    with app.app_context():
+        built: list = snapshots.build_snapshots()
+        selection = snapshots.standard_selections()[0]
+        sending = snapshots.find_snapshot(selection)
+
+        monkeypatch.setattr(snapshots, 'date', Tomorrow)
+        rebuilt: list = snapshots.build_snapshots()
+        current = snapshots.find_snapshot(selection)
+        db.session.remove()
+
+    try:
+        assert not os.path.exists(sending.name)
+        assert zipfile.ZipFile(sending).testzip() is None
+        assert current.name in rebuilt and current.name not in built
+    finally:
+        sending.close()
+        current.close()
+
+
+def test_download_sends_snapshot(app, client, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, 'EXPORT_SNAPSHOT_FOLDER', str(tmp_path))
+    with app.app_context():
+        path, = snapshots.build_snapshots()[:1]
+        db.session.remove()
+    form: dict = {
+        name: 'y' for name in (
+            'm_line', 'n_line', 'l_line', 'z_line', 'jl_line', 'jw_line',
+            'ggp1_farm', 'ggp2_farm', 'east_farm')}
+
+    response = client.post('/boars/download', data=dict(
+        form, enrollment_status='alive_only'))
+
+    assert response.status_code == 200
+    with open(path, 'rb') as snapshot:
+        assert response.data == snapshot.read()
+
+
+def test_generated_workbook_is_removed_after_sending(client, monkeypatch):
+    built: list = []
+    build_workbook = exporter.build_workbook
+
+    def remembered(boars, file_name: str = None) -> str:
+        built.append(build_workbook(boars, file_name))
+        return built[-1]
+    monkeypatch.setattr(exporter, 'build_workbook', remembered)
+
+    # buffered=Trueでは本文を読み終えたときにレスポンスを閉じる
+    response = client.post('/boars/download', buffered=True, data={
+        'm_line': 'y', 'ggp1_farm': 'y', 'enrollment_status': 'all'})
+
+    assert response.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(response.data)).testzip() is None
+    assert not os.path.exists(built[0])
@@ -0,0 +1,76 @@
+"""条件付きGETのテスト"""
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import delete, update
+
+from mendel_japan import changes, db
+from mendel_japan.models import Boar, Farm
+
+
+def add_boar(app, tattoo: str) -> int:
+    with app.app_context():
+        boar = Boar(tattoo=tattoo, name=tattoo, farm_id=Farm.query.first().id)
+        db.session.add(boar)
+        db.session.commit()
+        id: int = boar.id
+        db.session.remove()
+    return id
+
+
+def test_if_none_match_returns_not_modified(client):
+    first = client.get('/boars/')
+    second = client.get(
+        '/boars/', headers={'If-None-Match': first.headers['ETag']})
+
+    assert first.status_code == 200
+    assert second.status_code == 304
+    assert second.data == b''
+
+
+def test_delete_changes_etag(app, client):
+    id: int = add_boar(app, 'DELETE-ME')
+    before = client.get('/boars/')
+    client.post(f'/boars/{id}/delete')
+    client.get('/boars/')  # 削除のフラッシュメッセージを表示する
+
+    after = client.get('/boars/', headers={
+        'If-None-Match': before.headers['ETag'],
+        'If-Modified-Since': before.headers['Last-Modified']})
+
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
+
+
+def test_if_modified_since_alone_is_ignored(client):
+    first = client.get('/boars/')
+    second = client.get('/boars/', headers={
+        'If-Modified-Since': first.headers['Last-Modified']})
+
+    assert second.status_code == 200
+
+
+def test_late_commit_with_older_updated_at_changes_etag(app, client):
+    id: int = add_boar(app, 'LATE-COMMIT')
+    before = client.get('/boars/')
+
+    # 先に更新日時を取ったトランザクションが後からcommitされた場合
+    with app.app_context():
+        db.session.execute(
+            update(Boar).where(Boar.id == id)
+            .values(name='late', updated_at=datetime(2000, 1, 1)))
+        changes.record(db.session, 'boar', 'update', [id])
+        db.session.commit()
+        db.session.remove()
+    after = client.get(
+        '/boars/', headers={'If-None-Match': before.headers['ETag']})
+
+    try:
+        assert after.status_code == 200
+        assert after.headers['ETag'] != before.headers['ETag']
+    finally:
+        with app.app_context():
+            db.session.execute(delete(Boar).where(Boar.id == id))
+            db.session.commit()
+            db.session.remove()